@@ -0,0 +1,102 @@
+# Ethan McIntosh - GIS and Data Services - Brown University - October 2026
+
+"""Times a full scale -> state -> cell -> map year -> print year cascade of
+drop-down selections, the way LabeledDropDownMenu.dd_selected works through it,
+before and after the catalog started handing out presorted child lists and
+single-child collapse chains. Only the data work is timed (no tkinter widgets).
+
+before: the nested dictionary from read_topos, with every menu's values
+        sorted by multisort, and single-value menus handled by recursing
+after:  the Catalog from read_catalog, with keys() already in display order
+        and single-value runs taken from CatalogNode.collapse_chain()
+
+usage: python benchmarks/cascade_timing.py [path/to/usgs_topos.csv] [number of maps]"""
+
+import os, random, sys, time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import file_io
+from catalog import LEVELS
+
+LAST = len(LEVELS) - 1
+
+def multisort(elem):
+    """the sort key that dd_selected used to sort every menu's values with"""
+    if elem == '(none)':
+         return 0
+    elif is_number(elem):
+        return float(elem)
+    else: 
+        return elem
+
+def is_number(s):
+    try:
+        float(s)
+        return True
+    except ValueError:
+        return False
+
+def select_before(node, level, val):
+    """Mirrors dd_selected before the change. Returns the options of the next menu
+    the user has to choose from, and that menu's level (None, LAST when done)"""
+    while level < LAST:
+        node = node[val]
+        vals = sorted(list(node.keys()), key=multisort)
+        level += 1
+        if len(vals) != 1:
+            return node, level
+        val = vals[0] # the only value is locked in, and dd_selected recurses
+    return None, LAST
+
+def select_after(node, level, val):
+    """Mirrors dd_selected after the change"""
+    if level == LAST:
+        return None, LAST
+    node = node[val]
+    node.keys()
+    level += 1
+    for _, child in node.collapse_chain():
+        if level == LAST:
+            return None, LAST
+        node = child
+        node.keys()
+        level += 1
+    return node, level
+
+def cascade(select, top, path):
+    """selects each value of a map's path in turn, the way a user would"""
+    node, level = top, 0
+    while node is not None:
+        node, level = select(node, level, path[level])
+
+def time_cascades(select, top, paths):
+    start = time.perf_counter()
+    for path in paths:
+        cascade(select, top, path)
+    return (time.perf_counter() - start) / len(paths)
+
+def main(filepath, n_maps):
+    maps = {}
+    file_io.read_topos(filepath, maps)
+    catalog = file_io.read_catalog(filepath)
+
+    # pick maps to look up at random from the whole catalog
+    random.seed(0)
+    paths = []
+    for _ in range(n_maps):
+        node, path = maps, []
+        for _ in LEVELS:
+            val = random.choice(list(node.keys()))
+            path.append(val)
+            node = node[val]
+        paths.append(path)
+
+    before = time_cascades(select_before, maps, paths)
+    after = time_cascades(select_after, catalog.root(), paths)
+    print("full cascades timed:      {:>8,}".format(n_maps))
+    print("before (sort + recurse):  {:>8.1f} us per cascade".format(before * 1e6))
+    print("after (presorted chains): {:>8.1f} us per cascade".format(after * 1e6))
+    print("{:.1f}x faster".format(before / after))
+
+if __name__ == '__main__':
+    main(sys.argv[1] if len(sys.argv) > 1 else 'usgs_topos.csv',
+         int(sys.argv[2]) if len(sys.argv) > 2 else 2000)
@@ -0,0 +1,35 @@
+# Ethan McIntosh - GIS and Data Services - Brown University - October 2026
+
+"""Compares how much memory the map catalog takes up when it is read into the
+nested dictionary from file_io.read_topos versus the compact Catalog from
+file_io.read_catalog. Only the memory that is still held once the csv has been
+parsed is counted, since that is what the tool keeps for its whole session.
+
+usage: python benchmarks/catalog_memory.py [path/to/usgs_topos.csv]"""
+
+import os, sys, time, tracemalloc
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import file_io
+
+def retained(build):
+    """Runs build() and returns (result, bytes still allocated afterwards, seconds)"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - start
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size, elapsed
+
+def main(filepath):
+    maps = {}
+    _, dict_size, dict_time = retained(lambda: file_io.read_topos(filepath, maps))
+    catalog, cat_size, cat_time = retained(lambda: file_io.read_catalog(filepath))
+
+    print("rows in catalog:          {:>8,}".format(len(catalog)))
+    print("nested dict (read_topos): {:>8.1f} MB, built in {:.2f} s".format(dict_size / 1e6, dict_time))
+    print("Catalog (read_catalog):   {:>8.1f} MB, built in {:.2f} s".format(cat_size / 1e6, cat_time))
+    print("the Catalog takes {:.1f}x less memory".format(dict_size / max(cat_size, 1)))
+
+if __name__ == '__main__':
+    main(sys.argv[1] if len(sys.argv) > 1 else 'usgs_topos.csv')
@@ -0,0 +1,57 @@
+# Ethan McIntosh - GIS and Data Services - Brown University - October 2026
+
+"""Measures how long it takes to import each of the tool's entry points, using
+python -X importtime in a fresh interpreter (so nothing is already imported), and
+checks the times against a budget. Exits with status 1 if any entry point goes
+over its budget, along with the slowest modules it imported, so that a heavy
+import (like pandas, which only file_io._read_chunks should import) creeping back
+in at import time shows up here.
+
+Each entry point is imported several times and the fastest time is kept, since
+the first import after a while can be slowed down by the disk cache.
+
+usage: python benchmarks/import_time.py [number of runs]"""
+
+import os, subprocess, sys
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# (module, import time budget in milliseconds). bul_topo_tool only builds its
+# window when run directly, so importing it measures tkinter and the modules below
+BUDGETS = [('inventory', 60),
+           ('bulk_record', 60),
+           ('bul_topo_tool', 150)]
+
+def import_times(module:str):
+    """Imports a module in a fresh interpreter with -X importtime, and returns a
+    dictionary of {module name: cumulative import time in microseconds}"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + module],
+                            cwd=PACKAGE_DIR, capture_output=True, text=True, check=True)
+    times = {}
+    # lines look like "import time:       123 |       4567 |   some.module"
+    for line in result.stderr.splitlines():
+        parts = line.split('|')
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        name = parts[2].strip()
+        times[name] = max(times.get(name, 0), int(parts[1]))
+    return times
+
+def main(runs:int):
+    over_budget = False
+    for module, budget in BUDGETS:
+        fastest = min((import_times(module) for _ in range(runs)), key=lambda times: times[module])
+        total = fastest[module] / 1000
+        status = "ok" if total <= budget else "OVER BUDGET"
+        print("{:<15} {:>7.1f} ms  (budget {:>4} ms)  {}".format(module, total, budget, status))
+        if total > budget:
+            over_budget = True
+            slowest = sorted(fastest.items(), key=lambda item: item[1], reverse=True)[1:6]
+            for name, micros in slowest:
+                print("    {:<30} {:>7.1f} ms".format(name, micros / 1000))
+        if 'pandas' in fastest:
+            print("    pandas was imported")
+    return 1 if over_budget else 0
+
+if __name__ == '__main__':
+    sys.exit(main(int(sys.argv[1]) if len(sys.argv) > 1 else 5))
@@ -0,0 +1,249 @@
+# Ethan McIntosh - GIS and Data Services - Brown University - October 2026
+
+"""Runs the tool's benchmarks against synthetic HTMC data (see synthetic_htmc.py)
+at one or more scales, compares the results with a baseline file, and exits
+with status 1 if anything got slower (or bigger) than the baseline by more than
+a threshold. Every metric is "lower is better".
+
+The synthetic csv and scratch database for each scale are generated into the
+data directory the first time they're needed and reused after that. Nothing
+touches the real usgs_topos.csv or the database on the shared drive.
+
+Timings depend on the computer, so the baseline should be recorded on the same
+computer the suite is compared on:
+
+    python benchmarks/suite.py --update-baseline          # record the baseline
+    python benchmarks/suite.py                            # compare with it
+    python benchmarks/suite.py --scale 1 --scale 10       # today's HTMC and 10x
+    python benchmarks/suite.py --threshold 0.5            # allow 50% slower
+
+The results of every run are also written to results.json in the data directory."""
+
+import argparse, json, os, platform, random, shutil, statistics, sys, time, tracemalloc
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+import cell_search, db, file_io, inventory, journal # import the files of the tool itself
+from catalog import DbCatalog
+from bul_topo_tool import AutocompleteCombobox
+from cascade_timing import select_after, time_cascades
+import synthetic_htmc
+
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, 'baseline.json')
+DEFAULT_DATA_DIR = os.path.join(BENCH_DIR, 'data')
+DEFAULT_THRESHOLD = 0.25
+
+# what gets measured at each scale, in the order it's reported, with how much a
+# result can change from run to run on an idle computer (in the metric's own units).
+# A result only counts as a regression if it's worse than the baseline by more than
+# both the threshold and this much, so that the quickest operations, which take well
+# under a millisecond, don't trip the threshold on noise alone
+METRICS = [('read_topos_s', 0.3, "read_topos into the nested dictionary"),
+           ('read_gnis_s', 0.2, "read_gnis into the GNIS cell index"),
+           ('read_htmc_s', 0.4, "read_htmc: catalog and GNIS cell index in one pass"),
+           ('cached_load_s', 0.02, "read_htmc_cached from an up-to-date snapshot"),
+           ('columnar_load_s', 0.02, "read_columnar: memory-mapping the columnar version of the csv"),
+           ('read_topos_peak_mb', 1.0, "peak memory while running read_topos"),
+           ('read_htmc_peak_mb', 1.0, "peak memory while running read_htmc"),
+           ('columnar_load_peak_mb', 1.0, "peak memory while running read_columnar"),
+           ('cascade_us', 10.0, "dd_selected cascade from map scale to print year"),
+           ('db_cascade_us', 200.0, "the same cascade through a DbCatalog on the scratch database"),
+           ('autocomplete_keystroke_us', 10.0, "AutocompleteCombobox prefix search per keystroke"),
+           ('cell_search_keystroke_us', 100.0, "typo-tolerant cell name search per keystroke"),
+           ('journal_enqueue_ms', 0.2, "insert_record: queueing a map in the local journal"),
+           ('insert_topo_ms', 0.5, "insert_topo_if_absent on the database (what the syncer does)"),
+           ('history_first_page_ms', 0.05, "fetch_history_page: the first page, as populate_most_recent reads it at sign-in"),
+           ('history_page_ms', 0.05, "fetch_history_page: a page of the table display from the end of a user's history")]
+
+def scale_key(scale:float):
+    """the name a scale's results go under, like '1x' or '10x'"""
+    return '{:g}x'.format(scale)
+
+def prepare(data_dir:str, scale:float):
+    """Returns the (csv path, database path) for a scale, generating them if they don't exist yet"""
+    os.makedirs(data_dir, exist_ok=True)
+    csv_path = os.path.join(data_dir, 'usgs_topos_{}.csv'.format(scale_key(scale)))
+    db_path = os.path.join(data_dir, 'inventory_{}.db'.format(scale_key(scale)))
+    if not os.path.exists(csv_path):
+        print("generating {}...".format(csv_path))
+        synthetic_htmc.write_topos_csv(csv_path, scale)
+    if not os.path.exists(db_path):
+        print("generating {}...".format(db_path))
+        synthetic_htmc.create_inventory_db(csv_path, db_path)
+    db.Database(db_path).migrate(0) # a scratch database from an older version may be missing indexes
+    return csv_path, db_path
+
+def seconds(func, repeat:int=1):
+    """returns how long func() takes to run, in seconds, the fastest of repeat runs"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def peak_mb(func):
+    """returns the most memory func() had allocated at once while it ran, in MB"""
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / 1e6
+
+def median_ms(func, args_list, rounds:int=3):
+    """Runs func once for each set of arguments and returns the median time, in
+    milliseconds. The arguments are split into rounds and the fastest round's median
+    is kept, since the quickest operations are easily thrown off by disk activity."""
+    medians = []
+    for r in range(rounds):
+        times = []
+        for args in args_list[r::rounds]:
+            start = time.perf_counter()
+            func(*args)
+            times.append(time.perf_counter() - start)
+        medians.append(statistics.median(times))
+    return min(medians) * 1000
+
+def run_scale(scale:float, data_dir:str, samples:int):
+    """runs every benchmark in METRICS at one scale and returns a dictionary of the results"""
+    csv_path, db_path = prepare(data_dir, scale)
+    rng = random.Random(0)
+    results = {}
+    print("{} ({})".format(scale_key(scale), csv_path))
+
+    # ---- reading the csv ----
+    results['read_topos_s'] = seconds(lambda: file_io.read_topos(csv_path, {}))
+    results['read_gnis_s'] = seconds(lambda: file_io.read_gnis(csv_path, {}))
+    results['read_htmc_s'] = seconds(lambda: file_io.read_htmc(csv_path))
+    cache_path = csv_path + '.cache'
+    if os.path.exists(cache_path):
+        os.remove(cache_path)
+    file_io.read_htmc_cached(csv_path, cache_path) # writes the snapshot
+    results['cached_load_s'] = seconds(lambda: file_io.read_htmc_cached(csv_path, cache_path), repeat=5)
+    columnar_path = os.path.splitext(csv_path)[0] + '.htmc'
+    catalog, cells, _ = file_io.read_htmc_cached(csv_path, cache_path)
+    file_io.write_columnar(columnar_path, catalog, cells, csv_path)
+    results['columnar_load_s'] = seconds(lambda: file_io.read_columnar(columnar_path), repeat=5)
+    results['read_topos_peak_mb'] = peak_mb(lambda: file_io.read_topos(csv_path, {}))
+    results['read_htmc_peak_mb'] = peak_mb(lambda: file_io.read_htmc(csv_path))
+    results['columnar_load_peak_mb'] = peak_mb(lambda: file_io.read_columnar(columnar_path))
+
+    # ---- the main window's drop-down menus ----
+    catalog, _ = inventory.load_catalog(csv_path)
+    maps = catalog.root()
+    paths = []
+    for _ in range(samples * 10):
+        node, path = maps, []
+        while not isinstance(node, list):
+            val = rng.choice(node.keys())
+            path.append(val)
+            node = node[val]
+        paths.append(path)
+    results['cascade_us'] = min(time_cascades(select_after, maps, paths) for _ in range(3)) * 1e6
+    # starting from an empty cache each time, as if the tool had just been opened
+    results['db_cascade_us'] = min(time_cascades(select_after, DbCatalog(db_path).root(), paths)
+                                   for _ in range(3)) * 1e6
+
+    # type cell names into a menu of every cell name there is, one keystroke at a
+    # time. Only the prefix search is timed, since the widget needs a display
+    menu = AutocompleteCombobox.__new__(AutocompleteCombobox)
+    cell_names = list(catalog.pools[2])
+    menu.index_completion_list(cell_names)
+    typed = [name[:i] for name in rng.sample(cell_names, min(samples, len(cell_names)))
+             for i in range(1, len(name) + 1)]
+    results['autocomplete_keystroke_us'] = seconds(lambda: [menu.prefix_hits(text) for text in typed], repeat=3) / len(typed) * 1e6
+
+    # and the same again with a letter left out of each name, which the cell name
+    # menus look up in a trigram index (see cell_search.py) on every keystroke
+    search = cell_search.CellNameIndex(cell_names)
+    typos = [text[:1] + text[2:] for text in typed if len(text) > 3]
+    results['cell_search_keystroke_us'] = seconds(lambda: [search.search(text) for text in typos], repeat=3) / len(typos) * 1e6
+
+    # ---- recording maps, on a copy of the scratch database ----
+    work_db_path = os.path.join(data_dir, 'work.db')
+    journal_path = os.path.join(data_dir, 'work_journal.db')
+    for path in [work_db_path, journal_path, journal_path + '-wal', journal_path + '-shm']:
+        if os.path.exists(path):
+            os.remove(path)
+    shutil.copyfile(db_path, work_db_path)
+    map_db = db.Database(work_db_path)
+    write_journal = journal.WriteJournal(journal_path)
+    unrecorded = [scan_id for (scan_id,) in map_db.conn.execute(
+        "SELECT scan_id FROM all_usgs_topos WHERE scan_id NOT IN (SELECT scan_id FROM usgs_topos_we_have) LIMIT ?", (samples,))]
+    records = [inventory.topo_record(scan_id, 'EPM', False, False) for scan_id in unrecorded]
+    results['journal_enqueue_ms'] = median_ms(write_journal.enqueue,
+                                              [(db.TOPO_WRITE, 'EPM', record, record) for record in records])
+    results['insert_topo_ms'] = median_ms(map_db.insert_topo_if_absent, records)
+    results['history_first_page_ms'] = median_ms(map_db.fetch_history_page, [(user,) for user in synthetic_htmc.USERS] * samples)
+    # the last full page of each user's history, which should take as long as the first
+    pages = []
+    for user in synthetic_htmc.USERS:
+        after, last_after = None, None
+        while True:
+            rows, next_after = map_db.fetch_history_page(user, after)
+            if len(rows) < 50:
+                break
+            last_after, after = after, next_after
+        pages.append((user, last_after))
+    results['history_page_ms'] = median_ms(map_db.fetch_history_page, pages * samples)
+    del map_db, write_journal
+    return results
+
+def compare(results:dict, baseline:dict, threshold:float):
+    """Prints each result next to its baseline, and returns a list of the (scale, metric)
+    pairs that are more than threshold (a fraction) worse than the baseline, and worse
+    by more than the metric's noise (see METRICS)"""
+    regressions = []
+    for key, scale_results in results.items():
+        base = baseline.get(key, {})
+        print("\n{:<28}{:>12}{:>12}{:>9}".format(key, "baseline", "now", "change"))
+        for metric, noise, _ in METRICS:
+            now = scale_results[metric]
+            if metric not in base:
+                print("{:<28}{:>12}{:>12.3f}".format(metric, "-", now))
+                continue
+            change = (now - base[metric]) / base[metric] if base[metric] else 0.0
+            flag = ""
+            if change > threshold and now - base[metric] > noise:
+                regressions.append((key, metric))
+                flag = "  REGRESSED"
+            print("{:<28}{:>12.3f}{:>12.3f}{:>+8.0%}{}".format(metric, base[metric], now, change, flag))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the tool on synthetic HTMC data.")
+    parser.add_argument('--scale', type=float, action='append',
+                        help="how many times the size of today's HTMC to test at (can be repeated, default 1)")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="the baseline results file")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="how much worse than the baseline a result can be, as a fraction (default 0.25)")
+    parser.add_argument('--update-baseline', action='store_true', help="save these results as the baseline")
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR, help="where the synthetic data is generated")
+    parser.add_argument('--samples', type=int, default=200, help="how many maps the per-map benchmarks use")
+    args = parser.parse_args()
+
+    results = {scale_key(scale): run_scale(scale, args.data_dir, args.samples) for scale in (args.scale or [1])}
+    with open(os.path.join(args.data_dir, 'results.json'), 'w') as f:
+        json.dump({'results': results}, f, indent=2)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    regressions = compare(results, baseline.get('results', {}), args.threshold)
+
+    if args.update_baseline:
+        # keep the baseline of any scale that wasn't run this time
+        baseline.setdefault('results', {}).update(results)
+        baseline['machine'] = {'python': platform.python_version(), 'platform': platform.platform(),
+                               'processor': platform.processor() or platform.machine()}
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print("\nbaseline saved to " + args.baseline)
+        return 0
+    if regressions:
+        print("\n{} result(s) regressed by more than {:.0%}".format(len(regressions), args.threshold))
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
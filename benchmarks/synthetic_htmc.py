@@ -0,0 +1,125 @@
+# Ethan McIntosh - GIS and Data Services - Brown University - October 2026
+
+"""Generates a synthetic stand-in for usgs_topos.csv, and a scratch inventory
+database to go with it, so that the tool can be benchmarked without the real
+HTMC data or the database on the shared drive.
+
+The csv has the same columns as the HTMC csv and roughly the same cardinalities
+per column as today's HTMC (about 190,000 maps): 56 states and territories, about
+a thousand cell names per state drawn from a shared pool of names (so the same
+name turns up in several states, as it does in the HTMC), a handful of map
+scales dominated by 1:24,000, map years from 1880 to 2015, a print year on
+most but not all maps, and a standard cell type (which is what puts a map's cell
+in the GNIS cell index) on most but not all maps. A scale factor multiplies the number of maps without
+adding states, scales or cell names, so a 10x csv has ten times as many maps per
+cell, which is how the HTMC would grow.
+
+The output only depends on the scale factor and the seed.
+
+usage: python benchmarks/synthetic_htmc.py path/to/output.csv [scale factor] [path/to/scratch.db]"""
+
+import csv, os, random, sqlite3, sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import db
+
+# today's HTMC, roughly
+BASE_ROWS = 190000
+N_STATES = 56
+CELLS_PER_STATE = 1000
+CELL_NAME_POOL = 20000
+
+HTMC_COLUMNS = ['series', 'version', 'cell_id', 'scan_id', 'gda_item_id', 'gnis_cell_id', 'map_name',
+                'cell_name', 'primary_state', 'county_list', 'cell_type', 'map_scale', 'date_on_map',
+                'print_year', 'product_url']
+
+# (map scale, cell grid, relative frequency)
+SCALES = [('24000', '7.5X7.5 GRID', 60), ('62500', '15X15 GRID', 20), ('125000', '30X30 GRID', 6),
+          ('250000', '1X2 GRID', 4), ('31680', '7.5X7.5 GRID', 3), ('63360', '15X20 GRID', 3),
+          ('100000', '30X60 GRID', 2), ('20000', '7.5X7.5 GRID', 1), ('25000', '7.5X7.5 GRID', 1)]
+
+# one map in this many is an oversized or undersized one, whose cell type doesn't
+# start with 'Standard', so it's left out of the GNIS cell index (see file_io._add_gnis_row)
+NON_STANDARD_EVERY = 10
+
+WORDS = ['Salem', 'Mount', 'Hood', 'Saint', 'Paul', 'Lake', 'Big', 'Creek', 'Pine', 'Bluff', 'Cedar',
+         'Spring', 'Rock', 'Little', 'River', 'North', 'South', 'East', 'West', 'Bald', 'Eagle', 'Fort',
+         'Grove', 'Hill', 'Valley', 'Mill', 'Point', 'Oak', 'Bear', 'Elk', 'Green', 'Red', 'White', 'Black']
+
+# the fraction of maps that the scratch database has already recorded, and the
+# initials they're recorded under
+RECORDED_FRACTION = 0.02
+USERS = ['CL', 'EPM', 'FPD']
+
+def write_topos_csv(filepath:str, scale:float=1, seed:int=0):
+    """Writes a synthetic HTMC csv with scale times as many maps as today's HTMC,
+    and returns the number of maps written"""
+    rng = random.Random(seed)
+    states = ['State {:02d}'.format(i) for i in range(N_STATES)]
+    name_pool = sorted({' '.join(rng.sample(WORDS, rng.choice([1, 2, 2, 3]))) for _ in range(CELL_NAME_POOL * 2)})
+    cells = {state: rng.sample(name_pool, min(CELLS_PER_STATE, len(name_pool))) for state in states}
+    scale_weights = [weight for _, _, weight in SCALES]
+    gnis_ids = {}
+
+    n_rows = int(BASE_ROWS * scale)
+    with open(filepath, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(HTMC_COLUMNS)
+        for i in range(n_rows):
+            state = rng.choice(states)
+            cell = rng.choice(cells[state])
+            map_scale, grid, _ = rng.choices(SCALES, scale_weights)[0]
+            # picked by row number rather than at random, so the rest of the csv comes out
+            # the same whether or not a map is standard
+            cell_type = ('Non-Standard ' if i % NON_STANDARD_EVERY == NON_STANDARD_EVERY - 1 else 'Standard ') + grid
+            gnis = gnis_ids.setdefault((state, cell, map_scale), str(100000 + len(gnis_ids)))
+            map_year = rng.randint(1880, 2015)
+            print_year = str(map_year + rng.randint(0, 30)) if rng.random() < 0.7 else ''
+            scan_id = str(100000 + i)
+            abbrev = state.replace(' ', '')
+            url = 'https://prd-tnm.s3.amazonaws.com/StagedProducts/Maps/HistoricalTopo/PDF/{}/{}/{}_{}_{}_{}_{}_geo.pdf'\
+                .format(abbrev, map_scale, abbrev, cell.replace(' ', ''), scan_id, map_year, map_scale)
+            writer.writerow(['HTMC', '1', str(i), scan_id, str(i), gnis, cell + ' ' + state, cell, state,
+                             'County', cell_type, map_scale, str(map_year), print_year, url])
+    return n_rows
+
+def create_inventory_db(csv_path:str, db_path:str, seed:int=0):
+    """Creates a scratch inventory database with the same tables as the one on the
+    shared drive: all_usgs_topos (loaded from a csv), and usgs_topos_we_have and
+    exception_maps_we_have, with RECORDED_FRACTION of the maps and a few exception
+    maps already recorded. Any existing file at db_path is replaced. The database
+    is migrated (see db.MIGRATIONS) so that it has the indexes the tool expects."""
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    rng = random.Random(seed)
+    conn = sqlite3.connect(db_path)
+    with open(csv_path, newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        conn.execute("CREATE TABLE all_usgs_topos ({})".format(", ".join(col + " TEXT" for col in header)))
+        conn.executemany("INSERT INTO all_usgs_topos VALUES ({})".format(", ".join("?" * len(header))), reader)
+    conn.execute("CREATE TABLE usgs_topos_we_have ({}, recorded_by TEXT, recorded_time INTEGER, is_damaged INTEGER, "
+                 "is_duplicate INTEGER, producer TEXT)".format(", ".join(col + " TEXT" for col in header)))
+    conn.execute("CREATE TABLE exception_maps_we_have (map_id TEXT, producer TEXT, map_scale TEXT, primary_state TEXT, "
+                 "cell_name TEXT, gnis_cell_id TEXT, date_on_map TEXT, print_year TEXT, sheet TEXT, series TEXT, "
+                 "edition TEXT, is_damaged INTEGER, is_duplicate INTEGER, recorded_by TEXT, recorded_time INTEGER)")
+
+    # record a random sample of the maps, spread over a few years of recorded times
+    n_maps = conn.execute("SELECT COUNT(*) FROM all_usgs_topos").fetchone()[0]
+    recorded = rng.sample(range(n_maps), int(n_maps * RECORDED_FRACTION))
+    conn.executemany("INSERT INTO usgs_topos_we_have SELECT *, ?, ?, ?, ?, 'USGS' FROM all_usgs_topos WHERE rowid = ?",
+                     ((rng.choice(USERS), 202200000000 + i, int(rng.random() < 0.05), int(rng.random() < 0.1), rowid + 1)
+                      for i, rowid in enumerate(sorted(recorded))))
+    conn.executemany("INSERT INTO exception_maps_we_have VALUES (?, 'Army Map Service', '250000', 'State 00', "
+                     "'Salem', '', '1950', '', '', '', '', 0, 0, ?, ?)",
+                     ((str(10000 + i), rng.choice(USERS), 202200000000 + i * 50) for i in range(len(recorded) // 50)))
+    conn.commit()
+    conn.close()
+    db.Database(db_path).migrate(0)
+
+if __name__ == '__main__':
+    csv_path = sys.argv[1]
+    n_rows = write_topos_csv(csv_path, float(sys.argv[2]) if len(sys.argv) > 2 else 1)
+    print("wrote {:,} maps to {}".format(n_rows, csv_path))
+    if len(sys.argv) > 3:
+        create_inventory_db(csv_path, sys.argv[3])
+        print("created {}".format(sys.argv[3]))
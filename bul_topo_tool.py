@@ -1,19 +1,16 @@
 # Ethan McIntosh - GIS and Data Services - Brown University - August 2022
 
 import tkinter as tk
-from tkinter import ttk
+from tkinter import messagebox, ttk
 import webbrowser
-from datetime import datetime
-import os, file_io, db # import the other files in this package
+from bisect import bisect_left
+import os, queue, sqlite3, threading
+import cell_search, db, inventory, journal, perf, previews # import the other files in this package
 
 tool_title = 'BUL Topo Map Inventory Tool'
-if os.name=='posix':
-    top_path=os.path.split(os.path.dirname(os.getcwd()))[0]
-    db_path=os.path.join(top_path,'bul_topo_map_inventory.db')
-    map_db = db.Database(db_path)
-else:
-    db_path='//files.brown.edu/DFS/Library_Shared/_geodata/maps/bul_topo_map_inventory.db'
-    map_db = db.Database(db_path)
+PENDING_ID = '(pending)' # what the table display shows as an exception map's ID until it's synced
+RECORDED_MARK = ' (recorded)' # added to Print Year options whose maps have all been recorded
+HISTORY_PAGE_ROWS = 50 # how many map records the table display reads in at a time (see load_history_page())
 
 # ------------------------------------------------------------------------------
 # ---------------------------- CUSTOM CLASSES ----------------------------------
@@ -34,13 +31,21 @@ class AutocompleteCombobox(ttk.Combobox):
 
     Source: https://mail.python.org/pipermail/tkinter-discuss/2012-January/003041.html
     """
-    def set_completion_list(self, completion_list, select_func=lambda:None, no_match_func=lambda:None):
+    def set_completion_list(self, completion_list, select_func=lambda:None, no_match_func=lambda:None, fuzzy=False):
             """This initializes the drop-down menu with some extra data structures that
             are needed for the autocomplete to be functional. The optional select_func 
             and no_match_func arguments allow you to specify functions that should be
             called when an autocomplete is performed (select_func) or when a typed entry
-            does not match the predefined list of options (no_match_func)"""
-            self._completion_list = completion_list
+            does not match the predefined list of options (no_match_func). If fuzzy is
+            True, the options are also searched for whatever has been typed in anywhere in
+            them, or something close to it (see cell_search.py), and the drop-down list is
+            narrowed down to the best matches as the user types"""
+            self.index_completion_list(completion_list)
+            self._search = cell_search.index_for(completion_list) if fuzzy else None
+            if fuzzy and not getattr(self, '_restores_values', False):
+                    # once one of the matches has been picked, go back to listing every option
+                    self.bind('<<ComboboxSelected>>', lambda event: self.show_matches(''), add='+')
+                    self._restores_values = True
             self._hits = []
             self._hit_index = 0
             self.position = 0
@@ -49,6 +54,18 @@ class AutocompleteCombobox(ttk.Combobox):
             self.select_func = select_func
             self.no_match_func = no_match_func
 
+    def index_completion_list(self, completion_list):
+            """Builds the prefix index that prefix_hits() searches. This doesn't touch
+            the widget itself, so it can be timed without a display (see benchmarks/suite.py)."""
+            self._completion_list = completion_list
+            # prefix index: the lowercased options in sorted order, alongside each one's
+            # position in completion_list, so that the options starting with whatever has
+            # been typed in are a contiguous run that a binary search can find
+            folded = sorted((element.lower(), pos) for pos, element in enumerate(completion_list))
+            self._folded = [element for element, _ in folded]
+            self._folded_pos = [pos for _, pos in folded]
+            self._completion_set = set(completion_list)
+
     def autocomplete(self, delta=0):
             """This method is called in response to keystrokes in order to autocomplete the Combobox.
             If an autocomplete is performed, call the given select_func().
@@ -58,10 +75,7 @@ class AutocompleteCombobox(ttk.Combobox):
             else: # set position to end so selection starts where textentry ended
                     self.position = len(self.get())
             # collect hits
-            _hits = []
-            for element in self._completion_list:
-                    if element.lower().startswith(self.get().lower()): # Match case insensitively
-                            _hits.append(element)
+            _hits = self.prefix_hits(self.get())
             # if we have a new hit list, keep this in mind
             if _hits != self._hits:
                     self._hit_index = 0
@@ -78,6 +92,40 @@ class AutocompleteCombobox(ttk.Combobox):
             else: # if whatever is typed into the box does not match a predefined option
                 self.no_match_func()
 
+    def prefix_hits(self, text):
+            """Returns the options that start with the given text, ignoring case, in the
+            order they appear in the completion list. Finding them takes a binary search
+            of the prefix index plus one step per hit, rather than a pass over every option."""
+            prefix = text.lower() # Match case insensitively
+            start = bisect_left(self._folded, prefix)
+            end = start
+            while end < len(self._folded) and self._folded[end].startswith(prefix):
+                    end += 1
+            return [self._completion_list[pos] for pos in sorted(self._folded_pos[start:end])]
+
+    def step(self, delta):
+            """Selects the option delta places after the selected one (before it, if delta
+            is negative), counting in the full completion list rather than the drop-down
+            list, which show_matches() may have narrowed down, and lists every option again.
+            If what's in the menu isn't an option, the first option counts as one place
+            after it. Returns False, and leaves the menu alone, if there's no such option"""
+            options = list(self._completion_list)
+            pos = options.index(self.get()) if self.get() in self._completion_set else -1
+            if not 0 <= pos + delta < len(options):
+                    return False
+            self['values'] = self._completion_list
+            self.set(options[pos + delta])
+            return True
+
+    @perf.timed('cell name search')
+    def show_matches(self, text):
+            """Narrows the drop-down list down to the options that match the given text
+            (see cell_search.CellNameIndex.search), or lists every option again if there
+            aren't any or nothing has been typed in"""
+            matches = self._search.search(text) if text.strip() else []
+            self['values'] = matches or self._completion_list
+
+    @perf.timed('autocomplete keystroke')
     def handle_keyrelease(self, event):
             """event handler for the keyrelease event while this widget is active
             If the value in the menu doesn't match a predefined option, call the given no_match_func()
@@ -85,7 +133,7 @@ class AutocompleteCombobox(ttk.Combobox):
             if event.keysym == "BackSpace":
                     self.delete(self.index(tk.INSERT), tk.END)
                     self.position = self.index(tk.END)
-                    if self.get() not in self._completion_list:
+                    if self.get() not in self._completion_set:
                         self.no_match_func()
                     else:
                         self.select_func()
@@ -99,6 +147,8 @@ class AutocompleteCombobox(ttk.Combobox):
                     self.position = self.index(tk.END) # go to end (no selection)
             if len(event.keysym) == 1:
                     self.autocomplete()
+            if self._search is not None and (event.keysym == "BackSpace" or len(event.keysym) == 1):
+                    self.show_matches(self.get()[:self.position])
             # No need for up/down, we'll jump to the popup
             # list at the position of the autocompletion
 
@@ -109,10 +159,13 @@ class LabeledDropDownMenu:
     selections, and which can each have their own previous and next buttons.
     """
     def __init__(self, label: tk.Label, menu: AutocompleteCombobox, prev: tk.Button, 
-                next: tk.Button, index: int, next_vals: dict):
+                next: tk.Button, index: int, next_vals: dict, fuzzy: bool=False, marks_recorded: bool=False):
         """Initialize the tkinter widgets (label, menu, prev, next) and associated
         data like index (the position of this drop-down menu in the hierarchy) and 
-        next_vals (a dictionary whose keys are the possible values of the menu).
+        next_vals (a dictionary or CatalogNode whose keys are the possible values of the menu).
+        fuzzy menus also match typed-in text that's only close to one of the values (see cell_search.py).
+        If marks_recorded is True (for the last menu, whose values each have a list of maps),
+        values whose maps have all been recorded are shown with RECORDED_MARK.
         """
         self.label = label
         self.menu = menu
@@ -124,10 +177,45 @@ class LabeledDropDownMenu:
         self.next.configure(command = lambda: self.next_button()) 
         self.next_vals = next_vals
         self.next_lddm = None
+        self.fuzzy = fuzzy
+        self.marks_recorded = marks_recorded
+        self.shown = {} # the value behind each option that's shown with RECORDED_MARK
 
     def set_next_lddm(self, next_lddm):
         self.next_lddm = next_lddm
 
+    def set_options(self, next_vals):
+        """Gives the drop-down menu a new set of possible values, the keys of next_vals
+        (listed in the order they should be displayed in)."""
+        self.next_vals = next_vals
+        vals = list(next_vals.keys())
+        self.shown = {}
+        if self.marks_recorded and recorded_maps is not None:
+            # whether each map has been recorded is kept in memory (see inventory.RecordedMaps),
+            # so this doesn't go to the database
+            for pos, val in enumerate(vals):
+                if recorded_maps.all_recorded(next_vals[val]):
+                    self.shown[val + RECORDED_MARK] = val
+                    vals[pos] = val + RECORDED_MARK
+        self.menu.set_completion_list(vals, lambda: self.dd_selected(), lambda: self.disable_next(), self.fuzzy)
+
+    def value(self):
+        """returns the value selected in the drop-down menu, without RECORDED_MARK"""
+        return self.shown.get(self.menu.get(), self.menu.get())
+
+    def show(self, val):
+        """selects a value in the drop-down menu, with RECORDED_MARK if it has one"""
+        self.menu.set(val + RECORDED_MARK if val + RECORDED_MARK in self.shown else val)
+
+    def mark_recorded(self):
+        """Marks the values whose maps have all been recorded again, after maps have been
+        recorded or removed, keeping whatever value is selected"""
+        if self.marks_recorded:
+            val = self.value()
+            self.set_options(self.next_vals)
+            if val:
+                self.show(val)
+
     def disable(self):
         """disables the drop-down menu and its associated prev/next buttons"""
         self.menu['state'] = tk.DISABLED
@@ -143,19 +231,17 @@ class LabeledDropDownMenu:
     def prev_button(self):
         """In response to clicking the prev button, toggle the value on the given
         drop-down menu to its previous possible value."""
-        val = self.menu.current()
-        if val > 0: # if we're not at the beginning of the list of possible values,
-            # set the drop down to the next value in the list of possible values
-            self.menu.current(val - 1) 
+        # if we're not at the beginning of the list of possible values, set the drop down
+        # to the previous value in the list (the full one, not the narrowed-down matches)
+        if self.menu.step(-1):
             self.dd_selected()
 
     def next_button(self):
         """In response to clicking the prev button, toggle the value on the given
         drop-down menu to its next possible value."""
-        val = self.menu.current()
-        if val != len(self.menu['values']) - 1: # if we're not at the end of the list of possible values,
-            # set the drop down to the next value in the list of possible values
-            self.menu.current(val + 1) 
+        # if we're not at the end of the list of possible values, set the drop down to
+        # the next value in the list (the full one, not the narrowed-down matches)
+        if self.menu.step(1):
             self.dd_selected()
 
     def disable_next(self):
@@ -170,6 +256,7 @@ class LabeledDropDownMenu:
         else:
             add1_btn['state'] = tk.DISABLED
 
+    @perf.timed('dd_selected')
     def dd_selected(self): 
         """This method is called whenever a value is selected in a given drop-down menu.
         For example, if a map scale is selected, the possible values of the primary 
@@ -178,8 +265,11 @@ class LabeledDropDownMenu:
         menus after primary state are deactivated.  If there's only one state for a given 
         map scale, that state will be "locked in" and dd_selected will be called on the 
         state drop-down in order to update the values of the cell name drop-down."""
-        # disable the "record this map" button by default
+        global jumped_scan_id
+        # disable the "record this map" button by default, and forget any map that was
+        # jumped to, since the menus may not point to it anymore
         add1_btn['state'] = tk.DISABLED
+        jumped_scan_id = None
 
         # if the user has made a selection for the last drop-down in the hierarchy,
         # activate the "record this map" button and exit this method
@@ -188,29 +278,30 @@ class LabeledDropDownMenu:
             return None # exit this method, do not proceed to the remaining lines of code
 
         # otherwise (if the selection is for some other drop-down), we want to alter
-        # the possible values of the next drop down menu in the hierarchy
+        # the possible values of the next drop down menu in the hierarchy. The catalog
+        # already lists each node's children in display order, so nothing is sorted here
         next_dd = self.next_lddm
-        next_dd.next_vals = self.next_vals[self.menu.get()]
-        vals = sorted(list(next_dd.next_vals.keys()), key=multisort)
-        # next_dd.menu['values'] = vals
-        next_dd.menu.set_completion_list(vals, lambda: next_dd.dd_selected(), lambda: next_dd.disable_next())
         
         # blank out & disable all drop-down menus after whichever one was selected
         # so that selections high in the hierarchy will clear out the following menus' values
-        # for dd in list(dropdowns.values())[next_dd.index:]: 
-        #     dd.menu.set('')
-        #     dd.disable()
         self.disable_next()
+        next_dd.set_options(self.next_vals[self.value()])
 
-        if len(vals) == 1:  # if there's only 1 possible value for the next drop down
-            # lock that value into that drop-down menu and disable it from selections
-            next_dd.menu.set(vals[0])
+        # if there's only 1 possible value for the next drop down, the catalog has the
+        # whole run of menus below this one that only have 1 possible value worked out
+        # ahead of time. Lock each of those values into its drop-down menu and disable it
+        for val, child in next_dd.next_vals.collapse_chain():
+            next_dd.show(val)
             next_dd.disable()
-            # then, do what needs to be done in response to the next dd being selected
-            next_dd.dd_selected()
-        else: # if there are more than 1 possible values for the next drop down
-            # activate the next drop down so the user can make a selection on it
-            next_dd.enable()  
+            if next_dd.next_lddm is None: # every menu has a value, so the map can be recorded
+                add1_btn['state'] = tk.NORMAL
+                return None
+            next_dd = next_dd.next_lddm
+            next_dd.set_options(child)
+
+        # activate the first drop down that has more than 1 possible value, so the user
+        # can make a selection on it
+        next_dd.enable()
 
 # ------------------------------------------------------------------------------
 # ------------------------ INITIALIZATION METHODS ------------------------------
@@ -220,35 +311,128 @@ def sign_in(event):
     """Defines what happens when the user selects their initials from the sign-in
     menu. The first drop-down menu, the exception button, and the remove selected 
     record button are activated, a welcome message is displayed, and populate_most_recent()
-    is called to display the map records most recently inventoried by the selected user."""
-
-    dropdowns[0].enable()
-    exception_btn['state'] = tk.NORMAL
+    is called to display the map records inventoried by the selected user, most recent first.
+    If the map catalog is still loading, the first drop-down menu and the exception
+    button are activated by catalog_loaded() once it's done instead. The first sign-in
+    also starts reading in every map we have in the background (see check_recorded_maps())."""
+    global recorded_maps
+    if recorded_maps is None:
+        recorded_maps = inventory.RecordedMaps(db_path, write_journal.pending(-1))
+        check_recorded_maps()
+
+    if maps is not None:
+        dropdowns[0].enable()
+        exception_btn['state'] = tk.NORMAL
+        jump_entry['state'] = tk.NORMAL
+        jump_btn['state'] = tk.NORMAL
     remove_btn['state'] = tk.NORMAL
     dialog['foreground'] = '#0f0' # text will be green
-    dialogContents.set("Welcome, " + initials.get() + "!")
+    if maps is not None:
+        dialogContents.set("Welcome, " + initials.get() + "!")
+    else:
+        dialogContents.set("Welcome, " + initials.get() + "! The map catalog is still loading...")
     populate_most_recent(initials.get())
 
+def load_catalog(filepath, messages):
+    """Reads the map catalog (and the GNIS cell index for the exception window) on
+    a worker thread, so that the main window can be used while it loads. tkinter
+    widgets may only be touched from the main thread, so this never touches them;
+    instead it puts ('progress', message), ('done', (catalog, from_cache)) or
+    ('error', exception) tuples into the messages queue for check_catalog_loading()."""
+    try:
+        with perf.timer('catalog load'):
+            catalog, from_cache = inventory.load_catalog(filepath,
+                    progress=lambda message: messages.put(('progress', message)))
+        messages.put(('done', (catalog, from_cache)))
+    except Exception as e:
+        messages.put(('error', e))
+
+def check_catalog_loading(messages):
+    """Runs on the main thread every 100 ms while load_catalog() is running, and
+    shows whatever it has to say in the dialog label."""
+    try:
+        while True:
+            kind, payload = messages.get_nowait()
+            if kind == 'progress':
+                dialog['foreground'] = '' # default text color
+                dialogContents.set(payload)
+            elif kind == 'done':
+                catalog_loaded(*payload)
+                return None # stop checking
+            else:
+                dialog['foreground'] = '#f00' # text will be red
+                dialogContents.set("Could not load the map catalog: " + str(payload))
+                return None # stop checking
+    except queue.Empty:
+        pass
+    root.after(100, check_catalog_loading, messages)
+
+def catalog_loaded(catalog, from_cache):
+    """Once the map catalog has loaded, give its data to the first drop-down menu,
+    and activate that menu and the exception button if someone has signed in.
+    from_cache is None for a catalog that's read from the map database as it's used."""
+    global maps
+    maps = catalog.root()
+    dropdowns[0].set_options(maps)
+    if initials.get():
+        dropdowns[0].enable()
+        exception_btn['state'] = tk.NORMAL
+        jump_entry['state'] = tk.NORMAL
+        jump_btn['state'] = tk.NORMAL
+    dialog['foreground'] = '#0f0' # text will be green
+    if from_cache is None: # a DbCatalog, which doesn't load anything up front
+        dialogContents.set("Drop-down menus are filled from the map database.")
+    elif from_cache:
+        dialogContents.set("Map catalog loaded from cache.")
+    else:
+        dialogContents.set("Map catalog rebuilt from usgs_topos.csv.")
+
 def populate_most_recent(initials):
-    """Updates the table display to show the most recent 10 map records inventoried by the given user."""
+    """Updates the table display to show the map records inventoried by the given user,
+    most recent first. Only the first page of them is read from the database here; the
+    rest are read a page at a time as the table is scrolled down (see table_scrolled())."""
+    global history_after, history_more
     # clear whatever's currently in the table
-    for item in tbl.get_children():
-        tbl.delete(item)
-    
-    # grab data on the most recent maps recorded by the given initials
-    rows = map_db.fetch_most_recent('usgs_topos_we_have', 'scan_id', initials)
-    exc_rows = map_db.fetch_most_recent('exception_maps_we_have', 'map_id', initials)
-    rows.extend(exc_rows)
-    # sort the most recent regular maps together with the most recent exceptions
-    most_recent = sorted(rows, key=lambda lst: int(lst[-1])) 
-
-    # add the 10 most recent rows to the table display
-    for row in most_recent[-10:]:
+    tbl.delete(*tbl.get_children())
+    history_after, history_more = None, True
+    load_history_page(initials)
+
+    # maps this user recorded that haven't been written to the database yet go on
+    # top, under their write IDs so that check_sync_messages() can find them later
+    for write_id, tbl_row in write_journal.pending_rows(initials):
+        tbl.insert('', 0, iid=write_id, values=tbl_row)
+
+def load_history_page(initials):
+    """Adds the next page of the given user's map records to the bottom of the table
+    display. The database merges the regular maps with the exceptions and returns them
+    most recent first, picking up where the last page left off (see
+    Database.fetch_history_page), so a page takes the same time however far down it is."""
+    global history_after, history_more
+    rows, history_after = map_db.fetch_history_page(initials, history_after, HISTORY_PAGE_ROWS)
+    history_more = len(rows) == HISTORY_PAGE_ROWS
+    for row in rows:
         # convert empty values from database to (none) in table display
         tbl_row = ["(none)" if val is None or val == '' else val for val in row[:-3]] 
         # convert 1s and 0s from is_damaged and is_duplicate columns in database to read as True and False in table display
         tbl_row.extend([bool(val) for val in row[-3:-1]]) 
-        tbl.insert('', 0, values=tbl_row)
+        tbl.insert('', tk.END, values=tbl_row)
+
+def table_scrolled(first, last):
+    """Runs whenever the part of the table display that's in view changes. Besides
+    moving the scroll bar, it reads in the next page of map records once the bottom
+    of the table comes into view, after tkinter has finished redrawing the table."""
+    global history_loading
+    tbl_scroll.set(first, last)
+    if history_more and not history_loading and float(last) >= 0.9 and initials.get():
+        history_loading = True
+        root.after_idle(load_more_history)
+
+def load_more_history():
+    """reads in the next page of map records for whoever is signed in (see table_scrolled())"""
+    global history_loading
+    history_loading = False
+    if history_more:
+        load_history_page(initials.get())
 
 # ------------------------------------------------------------------------------
 # -------------------------- RECORDING MAPS METHODS ----------------------------
@@ -262,25 +446,64 @@ def record_this_map():
     are inserted into the database. Otherwise, we call select_from_multiple().
     """
     last_dd = dropdowns[len(dropdowns)-1]
-    results = last_dd.next_vals[last_dd.menu.get()] # should be a list of tuples
+    results = last_dd.next_vals[last_dd.value()] # should be a list of tuples
     if len(results) == 1:
         insert_record(results[0][0])  # passing in just the scan ID
+    elif jumped_scan_id is not None:
+        # the map was looked up by its scan ID or URL (see jump_to_map()), so we
+        # already know which of the matches it is
+        insert_record(jumped_scan_id)
     else:
         select_from_multiple(results)
 
+def jump_to_map(event=None):
+    """When a scan ID or product URL is entered in the "Jump to" box on the main
+    window, the map is looked up in the catalog's reverse index (see inventory.find_map)
+    and all of the drop-down menus are set to its values at once, as if they had been
+    picked one by one, so that the map can be recorded right away. Menus with only
+    one possible value are locked in, the same way dd_selected() locks them in."""
+    global jumped_scan_id
+    found = inventory.find_map(maps, jump_var.get())
+    if found is None:
+        dialog['foreground'] = '#f00' # text will be red
+        dialogContents.set("No map has the scan ID or URL " + jump_var.get().strip())
+        return None
+    path, (scan_id, url) = found
+
+    # give each menu its options and value, from the top of the hierarchy down
+    node = maps
+    for dd, val in zip(dropdowns, path):
+        dd.set_options(node)
+        dd.show(val)
+        if len(node) == 1:
+            dd.disable()
+        else:
+            dd.enable()
+        node = node[val]
+
+    jumped_scan_id = scan_id
+    add1_btn['state'] = tk.NORMAL
+    jump_var.set('')
+    dialog['foreground'] = '#0f0' # text will be green
+    dialogContents.set("Found map " + scan_id + ".")
+
 def select_from_multiple(results):
     """Creates a pop-up window where the user chooses which of the multiple resulting
     map records matches the map physically in hand. Each map is an option on a 
     radiobutton, and each option has a button which will open up the map pdf in 
-    the user's web browser.  by opening up the links to the different options"""
+    the user's web browser.  by opening up the links to the different options.
+    The start of each option's pdf is downloaded in the background as soon as the
+    window opens (see previews.py), and the label next to each button says whether
+    the USGS has the pdf and how big it is."""
     win = tk.Toplevel(root)
     win.wm_transient(root)
     win.title("Multiple matches found")
     ttk.Label(win, text="The USGS database has multiple records for that map.  Please select the record that matches the map in hand.")\
-        .grid(row=0, columnspan=2, pady=20, padx=20)
+        .grid(row=0, columnspan=3, pady=20, padx=20)
     choices = tk.StringVar()
     record_btn = tk.Button(win, text="Record this map", command=lambda: record_chosen_map(choices.get(), win), state=tk.DISABLED)
 
+    statuses = {} # scan ID: the StringVar of its download status label
     for idx, result in enumerate(results):
         result_id = result[0]
         result_link=result[1]
@@ -288,8 +511,36 @@ def select_from_multiple(results):
             .grid(row=idx+1, column=0, pady=5, sticky='e')
         tk.Button(win, text="Open pdf in browser", command=lambda result_link=result_link: webbrowser.open_new_tab(result_link))\
             .grid(row=idx+1, column=1, sticky='w')
+        statuses[result_id] = tk.StringVar(value="checking...")
+        ttk.Label(win, textvariable=statuses[result_id]).grid(row=idx+1, column=2, padx=10, sticky='w')
     
-    record_btn.grid(row=idx+2, column=0, columnspan=2, pady=20)
+    record_btn.grid(row=idx+2, column=0, columnspan=3, pady=20)
+
+    # the downloads report back on the fetcher's threads, which can't touch tkinter
+    # widgets, so their results go through a queue that check_previews() empties
+    downloads = queue.Queue()
+    preview_fetcher.fetch_all([(result[0], result[1]) for result in results],
+                              lambda *download: downloads.put(download))
+    check_previews(win, downloads, statuses)
+
+def check_previews(win, downloads, statuses):
+    """Runs on the main thread every 100 ms while a multiple matches window is open,
+    and shows which of its pdfs the USGS has, and how big they are"""
+    if not win.winfo_exists():
+        return None # stop checking once the window has been closed
+    try:
+        while True:
+            scan_id, size, error = downloads.get_nowait()
+            if error is not None:
+                statuses[scan_id].set("not available: " + str(error))
+            elif size is None:
+                statuses[scan_id].set("available")
+            else:
+                statuses[scan_id].set("available ({:.1f} MB)".format(size / 1e6))
+    except queue.Empty:
+        pass
+    if any(status.get() == "checking..." for status in statuses.values()):
+        root.after(100, check_previews, win, downloads, statuses)
 
 def record_chosen_map(scan_id, window):
     """When the user clicks on the button on the multiple matches window to record
@@ -299,49 +550,45 @@ def record_chosen_map(scan_id, window):
     window.destroy()
 
 def insert_record(scan_id):
-    """Inserts record for map we have on hand into sqlite backend by grabbing map
-    information from the main window drop-down menus and checkboxes, confirms the
-    insertion by selecting that record from the db, and then calls methods to add
-    that record to the table display and print out a confirmation message.
+    """Queues a record for the map we have on hand by grabbing map information from
+    the main window drop-down menus and checkboxes, adds that record to the table
+    display and prints out a confirmation message. The record is written to the
+    local journal right away and to the SQLite backend by the syncer, which reports
+    back through check_sync_messages() if the map turns out to be recorded already.
     """
-    before = map_db.fetch("usgs_topos_we_have", "scan_id", scan_id)
-    if len(before) > 0:
+    # this is checked against the maps we have in memory (see inventory.RecordedMaps),
+    # which include the ones still waiting in the journal, without going to the database
+    if recorded_maps.has_topo(scan_id):
         dialog['foreground'] = '#f00' # text will be red
         dialogContents.set("Map " + str(scan_id) + " has already been recorded.")
         return None
-    map_db.insert_topo(scan_id
-                , initials.get() # recorded_by
-                , int(datetime.now().strftime('%Y%m%d%H%M')) # recorded_time
-                , int(dmgvar.get()) # is_damaged (0 or 1)
-                , int(dupevar.get()) # is_duplicate (0 or 1)
-                , 'USGS') # producer
-    inserted = map_db.fetch("usgs_topos_we_have", "scan_id", scan_id)
-    if len(inserted) == 1:
-        add_to_table(scan_id) # display record on table, as well as confirmation
-        dialog['foreground'] = '#0f0' # text will be green
-        dialogContents.set("Map " + str(scan_id) + " successfully recorded!")
-        dmgvar.set(False)
-        dupevar.set(False)
-
-    else:
-        dialog['foreground'] = '#f00' # text will be red
-        dialogContents.set("Possible error inserting map " + str(scan_id) + " into the database.")
+    tbl_vals = table_row(scan_id)
+    record = inventory.topo_record(scan_id, initials.get(), dmgvar.get(), dupevar.get())
+    write_id = write_journal.enqueue(db.TOPO_WRITE, initials.get(), record, tbl_vals)
+    syncer.wake()
+    recorded_maps.add_pending(write_id, db.TOPO_WRITE, record)
+    dropdowns[-1].mark_recorded()
+    tbl.insert('', 0, iid=write_id, values=tbl_vals) # display record on table, as well as confirmation
+    dialog['foreground'] = '#0f0' # text will be green
+    dialogContents.set("Map " + str(scan_id) + " successfully recorded!")
+    dmgvar.set(False)
+    dupevar.set(False)
 
-def add_to_table(scan_id):
-    """Given the ID of a map, insert information about a map (whatever is currently
-    selected in the drop-down menus and checkboxes) into the table display (tbl)"""
+def table_row(scan_id):
+    """Given the ID of a map, returns the table display (tbl) row for that map, using
+    whatever is currently selected in the drop-down menus and checkboxes"""
+    # below are the columns that will be in the table display:
+    # ('Scan ID', 'Producer', 'Map Scale', 'Primary State', 'Cell Name', 'Map Year', 'Print Year', 'Damaged', 'Duplicate')
     tbl_vals = [scan_id, 'USGS'] 
     tbl_vals.extend(grab_dd_values())
     tbl_vals.extend([dmgvar.get(), dupevar.get()])
-    tbl.insert('', 0, values=tbl_vals)
-    # below are the columns that will be in the table display:
-    # ('Scan ID', 'Producer', 'Map Scale', 'Primary State', 'Cell Name', 'Map Year', 'Print Year', 'Damaged', 'Duplicate')
+    return tbl_vals
 
 def grab_dd_values():
     """traverses the drop-downs in order, returns a list of their currently selected values"""
     data = []
     for dd in dropdowns:
-        data.append(dd.menu.get()) 
+        data.append(dd.value()) 
     return data
 
 # ------------------------------------------------------------------------------
@@ -380,11 +627,11 @@ def record_exception(selected_vals):
     ttk.Label(options, text="Map Scale:").grid(row=1, column=3, pady=5, sticky='e')
     scale_dd = AutocompleteCombobox(options)
     scale_dd.grid(row=1, column=4, columnspan=2, pady=5, sticky='w')
-    scale_dd.set_completion_list(sorted(list(maps.keys()), key=multisort))
+    scale_dd.set_completion_list(maps.keys())
 
-    # load in information about GNIS cell IDs for given states and cells
-    cells = {}
-    file_io.read_gnis("usgs_topos.csv", cells)
+    # information about GNIS cell IDs for given states and cells. This is read from
+    # the csv at startup together with the map catalog, and shared
+    cells = inventory.gnis_cells()
 
     ttk.Label(options, text="Cell Name:").grid(row=3, column=3, pady=5, sticky='e')
     cell_dd = AutocompleteCombobox(options, state=tk.NORMAL) # , state=DISABLED
@@ -455,71 +702,46 @@ def insert_exception(exc_map_vars, cells, window):
     # extract whatever values on the exception window were selected/typed in
     map_info = [x.get() for x in exc_map_vars]
 
-    # identify the GNIS cell ID based on the selected state and cell, and then 
-    # instead of looking for an exact match for map scale, we look for the GNIS
-    # cell ID with the closest map scale to whatever scale was selected/typed in
-    try:
-        scale = int(map_info[1])
-    except ValueError: # if the scale was left blank or otherwise isn't an integer,
-        scale = 24000 # assign 24000 as a default for the purposes of assigning a GNIS cell ID
-    state = map_info[2]
-    cell = map_info[3]
-    closest_gnis = ''
-    if state in cells:
-        if cell in cells[state]:
-            # to find the closest GNIS cell ID, find the map scale with the smallest
-            # difference between it and the selected map scale, and use that GNIS ID
-            min_diff = float('inf')
-            for scl, gnis in cells[state][cell]:
-                if abs(int(scl) - scale) < min_diff:
-                    min_diff = abs(int(scl) - scale)
-                    closest_gnis = gnis
-
-    # assemble the row (list of values) that will be inserted into the exception maps database table
-    # Columns are map_id, producer, map_scale, primary_state, cell_name, gnis_cell_id, date_on_map, 
-    # print_year, sheet, series, edition, is_damaged, is_duplicate, recorded_by, recorded_time"
-    new_id = generate_new_exception_id()
-    exc_tbl_row = [new_id]
-    exc_tbl_row.extend(map_info[:4])
-    exc_tbl_row.append(closest_gnis)
-    exc_tbl_row.extend(map_info[4:-2])
-    exc_tbl_row.extend([int(x) for x in map_info[-2:]])
-    exc_tbl_row.extend([initials.get(), int(datetime.now().strftime('%Y%m%d%H%M'))])
+    # assemble the row (list of values) that will be inserted into the exception maps database table.
+    # This includes the GNIS cell ID of the cell in the selected state with the closest map scale
+    # to whatever scale was selected/typed in. The map_id is left out, since the database
+    # allocates it when the row is inserted
+    exc_tbl_row = inventory.exception_record(map_info, cells, initials.get())
+    # an exception map that matches one we have in every way but its damaged and
+    # duplicate checkboxes may have been recorded already (see inventory.exception_key).
+    # Exception maps often only have a few values filled in, though, so two different
+    # maps can look the same, and whoever has the map in hand gets the final say
+    if recorded_maps.has_exception(exc_tbl_row) and not messagebox.askyesno("Possible duplicate",
+            "An exception map with these values is already recorded. Record this one anyway?", parent=window):
+        return None
 
     # assemble the row (list of values) that will be inserted into the table display
     # Columns are 'Scan ID', 'Producer', 'Map Scale', 'Primary State', 'Cell Name', 
-    # 'Map Year', 'Print Year', 'Damaged', 'Duplicate')
-    tbl_dsply_row = [new_id]
+    # 'Map Year', 'Print Year', 'Damaged', 'Duplicate'). The database allocates the
+    # map ID when the syncer writes the record, so until then it reads as pending
+    tbl_dsply_row = [PENDING_ID]
     tbl_dsply_row.extend(map_info[:6])
     tbl_dsply_row.extend(map_info[-2:])
 
-    map_db.insert_exception(exc_tbl_row) # insert record into exception maps database table
-    inserted = map_db.fetch("exception_maps_we_have", "map_id", new_id)
-    if len(inserted) == 1: # if the database row insert was successful,
-        tbl.insert('', 0, values=tbl_dsply_row) # display record on table, 
-        dialog['foreground'] = '#0f0' # and show a confirmation in green text
-        dialogContents.set("Map " + str(new_id) + " successfully recorded!")
-        # we reset the damage and duplicate checkboxes to be unchecked after every map
-        dmgvar.set(False)
-        dupevar.set(False)
+    # queue the record for the exception maps database table, and display it on the table
+    write_id = write_journal.enqueue(db.EXCEPTION_WRITE, initials.get(), exc_tbl_row, tbl_dsply_row)
+    syncer.wake()
+    recorded_maps.add_pending(write_id, db.EXCEPTION_WRITE, exc_tbl_row)
+    tbl.insert('', 0, iid=write_id, values=tbl_dsply_row)
+    dialog['foreground'] = '#0f0' # and show a confirmation in green text
+    dialogContents.set("Exception map successfully recorded! It will get its map ID once it's synced.")
+    # we reset the damage and duplicate checkboxes to be unchecked after every map
+    dmgvar.set(False)
+    dupevar.set(False)
 
     window.destroy() # close the exception window
 
-def generate_new_exception_id():
-    """reads next available exception ID number from a csv, writes a new number
-    to that csv, and returns the next available ID number. This is used to assign 
-    unique ID numbers to exception maps.
-    """
-    new_id = file_io.read_next_exception_id("next_exception_id.csv")
-    file_io.write_next_exception_id("next_exception_id.csv", int(new_id) + 1)
-    return new_id
-
 def state_selected(cells, state_dd, cell_dd):
     """On the exception window, when a selection is made on the primary state drop-down 
     menu, we want the values of the cell drop-down menu to be updated in response.
     """
     # cell_dd['values'] = sorted(list(cells[state_dd.get()].keys()), key=multisort)
-    cell_dd.set_completion_list(sorted(list(cells[state_dd.get()].keys()), key=multisort))
+    cell_dd.set_completion_list(sorted(list(cells[state_dd.get()].keys()), key=multisort), fuzzy=True)
     cell_dd.set('')
 
 # ------------------------------------------------------------------------------
@@ -559,36 +781,115 @@ def confirm_removal(removal_id):
 def remove(removal_id, window):
     """When the user confirms that they want to remove a given map from our records,
     this method activates. It deletes the selected record from tbl, closes the extra pop-up window, 
-    and calls remove_record with the selected record's map ID to remove it from the database.
+    and either takes the record out of the journal, if it hasn't been synced yet, or
+    calls remove_record with the selected record's map ID to remove it from the database.
     """
-    remove_record(removal_id)
-    tbl.delete(tbl.selection())
+    item = tbl.selection()[0]
+    if write_journal.cancel(item):
+        recorded_maps.cancel_pending(item)
+        dialog['foreground'] = '#0f0' # text will be green
+        dialogContents.set("Map " + str(removal_id) + " successfully removed.")
+    else:
+        # the record may have been synced since the window opened, in which case
+        # its table row may be out of date (an exception map's ID, for instance)
+        check_sync_messages(repeat=False)
+        if tbl.exists(item):
+            # the next check_recorded_maps() reads the removal back from the database
+            remove_record(tbl.item(item, 'values')[0])
+    if tbl.exists(item):
+        tbl.delete(item)
+    dropdowns[-1].mark_recorded()
     window.destroy()
 
 def remove_record(removal_id):
     """Deletes the record corresponding with a given map ID from the SQLite database.
     The number of digits in the map ID determines whether it's a regular topo or
-    an exception map, which determines which table to delete the record from.
-    This method also verifies that after removal, there are no more maps with the 
-    removed ID in the database, and prints informative messages in case of issues.
+    an exception map, which determines which table to delete the record from
+    (see inventory.map_table).
+    The removal happens in a single database transaction, which tells us whether
+    there was anything to remove, and informative messages are printed in case of issues.
     """
-    table, id_name = "usgs_topos_we_have", "scan_id"
-    if len(str(removal_id)) < 6:
-        table, id_name = "exception_maps_we_have", "map_id"
-    before = map_db.fetch(table, id_name, removal_id)
-    if len(before) == 0:
-        dialog['foreground'] = '#f00' # text will be red
-        dialogContents.set("Map " + str(removal_id) + " has already been removed.")
-        return None
-    map_db.remove(table, id_name, removal_id)
-    remaining = map_db.fetch(table, id_name, removal_id)
-    if len(remaining) == 0:
-        # call the method to display confirmation of removal window
+    outcome = inventory.remove_map(map_db, removal_id)
+    if outcome == db.REMOVED:
         dialog['foreground'] = '#0f0' # text will be green
         dialogContents.set("Map " + str(removal_id) + " successfully removed.")
+    elif outcome == db.ALREADY_ABSENT:
+        dialog['foreground'] = '#f00' # text will be red
+        dialogContents.set("Map " + str(removal_id) + " has already been removed.")
     else:
         dialog['foreground'] = '#f00' # text will be red
-        dialogContents.set("Possible error removing map " + str(removal_id) + " from the database.")
+        dialogContents.set("Possible error removing map " + str(removal_id) + " from the database: " + str(map_db.last_error))
+
+# ------------------------------------------------------------------------------
+# ------------------------- SYNCING RECORDS METHODS ----------------------------
+# ------------------------------------------------------------------------------
+
+def check_sync_messages(repeat=True):
+    """Runs on the main thread every half second, and passes along whatever the
+    syncer (which runs on its own thread and can't touch tkinter widgets) has put
+    into sync_messages since the last time: the outcome of each record it writes
+    to the database, and how many records are still waiting to be written."""
+    try:
+        while True:
+            kind, payload = sync_messages.get_nowait()
+            if kind == 'result':
+                record_synced(*payload)
+            else:
+                show_sync_status(*payload)
+    except queue.Empty:
+        pass
+    if repeat:
+        root.after(500, check_sync_messages)
+
+def record_synced(write_id, outcome, map_id, error):
+    """Updates the table display once the syncer has written a record (identified
+    by its write ID) to the database. Exception maps get their new map IDs filled in,
+    and records that couldn't be written after all are taken off the table."""
+    if recorded_maps is not None:
+        # the map is read back from the database by the next check_recorded_maps()
+        recorded_maps.done_pending(write_id)
+    on_table = tbl.exists(write_id)
+    if outcome == db.INSERTED:
+        if on_table and tbl.set(write_id, 'Map ID') == PENDING_ID:
+            tbl.set(write_id, 'Map ID', map_id)
+            dialog['foreground'] = '#0f0' # text will be green
+            dialogContents.set("Exception map recorded as map " + str(map_id) + ".")
+        return None
+    if on_table:
+        tbl.delete(write_id)
+    dialog['foreground'] = '#f00' # text will be red
+    if outcome == db.ALREADY_PRESENT:
+        dialogContents.set("Map " + str(map_id) + " had already been recorded, so it was not recorded again.")
+    else:
+        dialogContents.set("Possible error inserting " + ("map " + str(map_id) if map_id else "exception map")
+                           + " into the database: " + str(error))
+
+def check_recorded_maps():
+    """Runs on the main thread every 2 seconds once someone has signed in, and catches
+    up with the maps that have been recorded or removed since the last time, on this
+    workstation or any other (see inventory.RecordedMaps.refresh), including every map
+    the syncer has written since then. Finding out whether anything has changed only
+    reads the database header, so this is cheap even on the shared drive. If anything
+    has, or the maps we have have just finished loading, the Print Year options are marked again."""
+    try:
+        if recorded_maps.refresh():
+            dropdowns[-1].mark_recorded()
+    except sqlite3.Error as e: # the shared drive may be unreachable for a while
+        syncContents.set("Could not check for maps recorded elsewhere: " + str(e))
+    root.after(2000, check_recorded_maps)
+
+def show_sync_status(pending_count, error):
+    """Shows how many records are waiting to be written to the database, and why
+    the last attempt to write them (or to bring the database up to date) failed, if it did"""
+    if pending_count == 0 and error:
+        syncContents.set("Retrying: " + str(error))
+    elif pending_count == 0:
+        syncContents.set("All records are saved to the database.")
+    else:
+        status = str(pending_count) + " record" + ("s" if pending_count != 1 else "") + " waiting to be saved to the database"
+        if error:
+            status += " (retrying: " + str(error) + ")"
+        syncContents.set(status)
 
 # ------------------------------------------------------------------------------
 # ------------------------ MISCELLANEOUS METHODS -------------------------------
@@ -616,118 +917,185 @@ def is_number(s):
     except ValueError:
         return False
 
-# ------------------------------------------------------------------------------
-# -------------------------- BUILD THE MAIN WINDOW -----------------------------
-# ------------------------------------------------------------------------------
+# everything above this line can be imported (by benchmarks, for instance) without
+# opening the database or a window. Running this file builds the window and starts the tool
+if __name__ == '__main__':
+    # if performance logging is on (see perf.py), time every database call, including
+    # the ones the syncer makes
+    perf.instrument_database(db.Database)
+    # connect to the map database. Its indexes and tables are brought up to date by the
+    # syncer (see journal.JournalSyncer), so that a locked database can't hold up the window
+    db_path = db.default_db_path()
+    map_db = db.Database(db_path)
+    # recorded maps are queued in a journal on the local disk and written to the map
+    # database by a background syncer (see journal.py), so that recording a map never
+    # has to wait on the shared drive, or fail because the database is locked
+    write_journal = journal.WriteJournal()
+
+    # ------------------------------------------------------------------------------
+    # -------------------------- BUILD THE MAIN WINDOW -----------------------------
+    # ------------------------------------------------------------------------------
+
+    root = tk.Tk()
+    root.title(tool_title)
+    # Ctrl+Shift+P opens a window with live performance numbers (see perf.py)
+    root.bind_all('<Control-P>', lambda event: perf.show_panel(root))
+
+    # Frame containing the entire window - exists in order to customize margins
+    content = tk.Frame(root)
+    content.grid(row=0, column=0, padx=10, pady=20)
+
+    # add a header frame with a title and a drop-down menu for users to sign in
+    header = tk.Frame(content)
+    title = ttk.Label(header, text=tool_title)
+    sign_in_label = ttk.Label(header, text="Select your initials to sign in:")
+    initials = ttk.Combobox(header, state='readonly', values=inventory.users())
+    initials.bind('<<ComboboxSelected>>', sign_in)
+
+    # add an options frame to contain all the menus and buttons for recording maps
+    options = tk.Frame(content)
 
-root = tk.Tk()
-root.title(tool_title)
-
-# Frame containing the entire window - exists in order to customize margins
-content = tk.Frame(root)
-content.grid(row=0, column=0, padx=10, pady=20)
-
-# add a header frame with a title and a drop-down menu for users to sign in
-header = tk.Frame(content)
-title = ttk.Label(header, text=tool_title)
-sign_in_label = ttk.Label(header, text="Select your initials to sign in:")
-initials = ttk.Combobox(header, state='readonly', values=file_io.read_users('users.csv'))
-initials.bind('<<ComboboxSelected>>', sign_in)
-
-# add an options frame to contain all the menus and buttons for recording maps
-options = tk.Frame(content)
-
-# set up an ordered list of labeled drop down menus, one for each map attribute
-label_names = ['Map Scale', 'Primary State', 'Cell Name', 'Map Year', 'Print Year'] 
-dropdowns = []
-
-for idx, lbl in enumerate(label_names):
-    lddm = LabeledDropDownMenu(ttk.Label(options, text=lbl + ": ")
-        , AutocompleteCombobox(options, state=tk.DISABLED)
-        , ttk.Button(options, text="^", state=tk.DISABLED)
-        , ttk.Button(options, text="v", state=tk.DISABLED)
-        , idx
-        , {}
-    )
-    dropdowns.append(lddm)
-    if idx != 0:
-        dropdowns[idx-1].set_next_lddm(lddm)
-
-# read map data into a nested dictionary, ordered according to our set of map attributes
-maps = {}
-file_io.read_topos('usgs_topos.csv', maps)
-
-# initialize the first dropdown
-first_dd = dropdowns[0] # access the first labeled dropdown menu
-first_dd.next_vals = maps # give the map data to the first menu
-first_dd.menu.set_completion_list(sorted(list(maps.keys()), key=multisort), \
-    lambda: first_dd.dd_selected(), lambda: first_dd.disable_next())
-
-# checkboxes to flag damages and duplicates
-dmgvar = tk.BooleanVar(value=False)
-damaged = ttk.Checkbutton(options, text="This map is significantly damaged", 
-            variable=dmgvar, onvalue=True)
-
-dupevar = tk.BooleanVar(value=False)
-duplicate = ttk.Checkbutton(options, text="We have duplicate(s) for this map", 
-            variable=dupevar, onvalue=True)
-
-# buttons for recording this map, recording exceptions, and removing selected records
-add1_btn = ttk.Button(options, text='Record this map', command=record_this_map, state=tk.DISABLED)
-exception_btn = ttk.Button(options, text='Record an exception', command=lambda: record_exception(grab_dd_values()), state=tk.DISABLED)
-remove_btn = ttk.Button(options, text='Remove selected record', command=remove_selected_record, state=tk.DISABLED)
-
-# set up a space on the main window for dialog messages to be displayed to the user
-dialogContents = tk.StringVar()
-dialog = ttk.Label(options)
-dialog['textvariable'] = dialogContents
-
-# ---------------- table frame ---------------------------
-table = tk.Frame(content)
-
-tbl_cols = ('Map ID', 'Producer', 'Map Scale', 'Primary State', 'Cell Name', 'Map Year', 'Print Year', 'Damaged', 'Duplicate')
-tbl = ttk.Treeview(table, columns=tbl_cols, show='headings')
-
-# define headings
-for col in tbl_cols:
-    tbl.heading(col, text=col)
-    tbl.column(col, width=100)
-# add a scrollbar
-tbl_scroll = ttk.Scrollbar(table, orient=tk.VERTICAL, command=tbl.yview)
-tbl.configure(yscroll=tbl_scroll.set)
-
-# -------------------- place widgets onto the main window -------------------
-
-# ---- header frame ----
-header.grid(row=0, column=0, columnspan=7, rowspan=1, pady=5)
-title.grid(row=0, column=0, columnspan=5, rowspan=1, padx=100, pady=5)
-sign_in_label.grid(row=0, column=5)
-initials.grid(row=0, column=6, padx=20)
-
-# ---- options frame ----
-options.grid(row=1, column=0, columnspan=7, rowspan=8, pady=5)
-
-for idx, dd in enumerate(dropdowns):
-    r = (idx%3)*2 + 1  # creates three rows of drop downs, starting at row 1, with
-    c = int(idx/3)*3   # as many columns as are needed for the set of drop downs
-
-    # place each label on the left, then the menu, then the prev/next buttons
-    dd.label.grid(row=r, column=c, rowspan=2, padx=20, pady=10, sticky='e')
-    dd.menu.grid(row=r, column=c+1, rowspan=2, padx=10)
-    dd.prev.grid(row=r, column=c+2, sticky='w')
-    dd.next.grid(row=r+1, column=c+2, sticky='w')
-
-damaged.grid(row=5, column=3, columnspan=3, rowspan=1) # dmg checkbox
-duplicate.grid(row=6, column=3, columnspan=3, rowspan=1) # duplicate checkbox
-exception_btn.grid(row=7, column=0, columnspan=3, pady=5) # record exception button
-remove_btn.grid(row=8, column=0, columnspan=3, pady=5) # remove selected button
-add1_btn.grid(row=7, column=3, rowspan=2, columnspan=3, pady=5) # record this map button
-dialog.grid(row=8, column=3, columnspan=3, rowspan=1, pady=5, sticky='s') # dialog label
-
-# ---- table frame ----
-table.grid(row=9, column=0, columnspan=7, rowspan=1, pady=5)
-tbl.grid(row=9, column=0, columnspan=6, rowspan=1) # table 
-tbl_scroll.grid(row=9, column=6, rowspan=1, sticky='ns') # table scroll bar
-
-# ------------------------------ RUN THE TOOL ----------------------------------
-root.mainloop()
\ No newline at end of file
+    # set up an ordered list of labeled drop down menus, one for each map attribute
+    label_names = ['Map Scale', 'Primary State', 'Cell Name', 'Map Year', 'Print Year'] 
+    dropdowns = []
+
+    for idx, lbl in enumerate(label_names):
+        lddm = LabeledDropDownMenu(ttk.Label(options, text=lbl + ": ")
+            , AutocompleteCombobox(options, state=tk.DISABLED)
+            , ttk.Button(options, text="^", state=tk.DISABLED)
+            , ttk.Button(options, text="v", state=tk.DISABLED)
+            , idx
+            , {}
+            , lbl == 'Cell Name' # map titles often spell cell names a little differently
+            , idx == len(label_names) - 1 # mark the print years whose maps have all been recorded
+        )
+        dropdowns.append(lddm)
+        if idx != 0:
+            dropdowns[idx-1].set_next_lddm(lddm)
+
+    # the map data for the first drop-down menu. This stays None until the catalog
+    # has been loaded in the background (see load_catalog() and catalog_loaded())
+    maps = None
+    # every map we have, kept in memory and up to date (see inventory.RecordedMaps).
+    # This stays None until someone signs in (see sign_in())
+    recorded_maps = None
+
+    # a box for going straight to a map by its scan ID or product URL instead of
+    # through the drop-down menus (see jump_to_map()), and the scan ID of the map it
+    # last went to, which is forgotten as soon as a drop-down selection changes
+    jump_var = tk.StringVar()
+    jump_label = ttk.Label(options, text="Jump to scan ID or URL: ")
+    jump_entry = ttk.Entry(options, textvariable=jump_var, width=40, state=tk.DISABLED)
+    jump_entry.bind('<Return>', jump_to_map)
+    jump_btn = ttk.Button(options, text="Go", command=jump_to_map, state=tk.DISABLED)
+    jumped_scan_id = None
+
+    # checkboxes to flag damages and duplicates
+    dmgvar = tk.BooleanVar(value=False)
+    damaged = ttk.Checkbutton(options, text="This map is significantly damaged", 
+                variable=dmgvar, onvalue=True)
+
+    dupevar = tk.BooleanVar(value=False)
+    duplicate = ttk.Checkbutton(options, text="We have duplicate(s) for this map", 
+                variable=dupevar, onvalue=True)
+
+    # buttons for recording this map, recording exceptions, and removing selected records
+    add1_btn = ttk.Button(options, text='Record this map', command=record_this_map, state=tk.DISABLED)
+    exception_btn = ttk.Button(options, text='Record an exception', command=lambda: record_exception(grab_dd_values()), state=tk.DISABLED)
+    remove_btn = ttk.Button(options, text='Remove selected record', command=remove_selected_record, state=tk.DISABLED)
+
+    # set up a space on the main window for dialog messages to be displayed to the user
+    dialogContents = tk.StringVar()
+    dialog = ttk.Label(options)
+    dialog['textvariable'] = dialogContents
+
+    # and one underneath the table for the number of records waiting to be synced
+    syncContents = tk.StringVar()
+    sync_status = ttk.Label(content)
+    sync_status['textvariable'] = syncContents
+
+    # ---------------- table frame ---------------------------
+    table = tk.Frame(content)
+
+    tbl_cols = ('Map ID', 'Producer', 'Map Scale', 'Primary State', 'Cell Name', 'Map Year', 'Print Year', 'Damaged', 'Duplicate')
+    tbl = ttk.Treeview(table, columns=tbl_cols, show='headings')
+
+    # define headings
+    for col in tbl_cols:
+        tbl.heading(col, text=col)
+        tbl.column(col, width=100)
+    # add a scrollbar
+    tbl_scroll = ttk.Scrollbar(table, orient=tk.VERTICAL, command=tbl.yview)
+    tbl.configure(yscroll=table_scrolled)
+    # where the table display's history of map records left off (see load_history_page()),
+    # whether there's more of it, and whether the next page is about to be read in
+    history_after = None
+    history_more = False
+    history_loading = False
+
+    # -------------------- place widgets onto the main window -------------------
+
+    # ---- header frame ----
+    header.grid(row=0, column=0, columnspan=7, rowspan=1, pady=5)
+    title.grid(row=0, column=0, columnspan=5, rowspan=1, padx=100, pady=5)
+    sign_in_label.grid(row=0, column=5)
+    initials.grid(row=0, column=6, padx=20)
+
+    # ---- options frame ----
+    options.grid(row=1, column=0, columnspan=7, rowspan=8, pady=5)
+    jump_label.grid(row=0, column=0, padx=20, pady=10, sticky='e')
+    jump_entry.grid(row=0, column=1, columnspan=4, padx=10, sticky='w')
+    jump_btn.grid(row=0, column=5, sticky='w')
+
+    for idx, dd in enumerate(dropdowns):
+        r = (idx%3)*2 + 1  # creates three rows of drop downs, starting at row 1, with
+        c = int(idx/3)*3   # as many columns as are needed for the set of drop downs
+
+        # place each label on the left, then the menu, then the prev/next buttons
+        dd.label.grid(row=r, column=c, rowspan=2, padx=20, pady=10, sticky='e')
+        dd.menu.grid(row=r, column=c+1, rowspan=2, padx=10)
+        dd.prev.grid(row=r, column=c+2, sticky='w')
+        dd.next.grid(row=r+1, column=c+2, sticky='w')
+
+    damaged.grid(row=5, column=3, columnspan=3, rowspan=1) # dmg checkbox
+    duplicate.grid(row=6, column=3, columnspan=3, rowspan=1) # duplicate checkbox
+    exception_btn.grid(row=7, column=0, columnspan=3, pady=5) # record exception button
+    remove_btn.grid(row=8, column=0, columnspan=3, pady=5) # remove selected button
+    add1_btn.grid(row=7, column=3, rowspan=2, columnspan=3, pady=5) # record this map button
+    dialog.grid(row=8, column=3, columnspan=3, rowspan=1, pady=5, sticky='s') # dialog label
+
+    # ---- table frame ----
+    table.grid(row=9, column=0, columnspan=7, rowspan=1, pady=5)
+    tbl.grid(row=9, column=0, columnspan=6, rowspan=1) # table 
+    tbl_scroll.grid(row=9, column=6, rowspan=1, sticky='ns') # table scroll bar
+    sync_status.grid(row=10, column=0, columnspan=7, pady=5) # sync status label
+
+    # ------------------------------ RUN THE TOOL ----------------------------------
+    # read map data into a compact catalog, ordered according to our set of map attributes.
+    # maps answers the same lookups as a nested dictionary (see catalog.py). The GNIS cell
+    # index for the exception window is read in the same pass, and both go through a
+    # snapshot on disk that is only rebuilt when usgs_topos.csv changes. This happens on a
+    # worker thread, so that the window shows up and people can sign in right away.
+    # If the BUL_TOPO_CATALOG environment variable is set to "database", the drop-down
+    # menus are instead filled straight from all_usgs_topos in the map database as
+    # they're used (see DbCatalog in catalog.py), so nothing is loaded up front and the
+    # GNIS cell index is only read from the csv when the exception window first opens
+    if os.environ.get('BUL_TOPO_CATALOG') == 'database':
+        catalog_loaded(inventory.database_catalog(db_path), None)
+    else:
+        catalog_messages = queue.Queue()
+        threading.Thread(target=load_catalog, args=(inventory.catalog_path(), catalog_messages), daemon=True).start()
+        check_catalog_loading(catalog_messages)
+    # start writing whatever is in the journal to the database, including anything left
+    # over from the last time the tool was open, once the database is up to date
+    sync_messages = queue.Queue()
+    syncer = journal.JournalSyncer(journal.DEFAULT_JOURNAL_PATH, db_path,
+                                   on_result=lambda *result: sync_messages.put(('result', result)),
+                                   on_status=lambda *status: sync_messages.put(('status', status)),
+                                   exception_id_seed=inventory.exception_id_seed())
+    syncer.start()
+    check_sync_messages()
+    # checks on the pdfs of the options in multiple matches windows (see select_from_multiple())
+    preview_fetcher = previews.PreviewFetcher(previews.PreviewCache())
+    root.mainloop()
+    preview_fetcher.shutdown()
\ No newline at end of file
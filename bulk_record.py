@@ -0,0 +1,111 @@
+# Ethan McIntosh - GIS and Data Services - Brown University - October 2026
+
+# Records a whole batch of USGS topo maps from a csv file, without the main window.
+# Each row of the csv describes one map by the same five attributes as the drop-down
+# menus on the main window, plus the damaged and duplicate checkboxes and the
+# initials of whoever has the map in hand:
+#
+#   python bulk_record.py drawer_12.csv [--report drawer_12_report.csv] [--db path/to/bul_topo_map_inventory.db]
+#
+# Rows that match exactly one map in usgs_topos.csv are recorded in a single database
+# transaction. Rows that match no maps, or several (the cases where the main window
+# would ask which map is in hand), are written to the report csv along with any rows
+# that couldn't be recorded for some other reason, so that they can be followed up
+# on through the main window.
+
+import argparse, os, time
+import file_io, db, inventory # import the other files in this package
+from catalog import LEVELS
+
+# the columns the csv needs, in the order they go in the report
+BULK_COLUMNS = list(LEVELS) + ['is_damaged', 'is_duplicate', 'recorded_by']
+
+# how the damaged and duplicate columns can be filled in
+TRUE_FLAGS = ('1', 'y', 'yes', 'true', 'x')
+FALSE_FLAGS = ('', '0', 'n', 'no', 'false')
+
+def parse_flag(val:str):
+    """returns 1 or 0 for a damaged or duplicate value from the csv, or None if it isn't one of TRUE_FLAGS or FALSE_FLAGS"""
+    if val.lower() in TRUE_FLAGS:
+        return 1
+    if val.lower() in FALSE_FLAGS:
+        return 0
+    return None
+
+def record_bulk(rows, maps, map_db, users):
+    """Resolves each row of a bulk recording csv against the map catalog and records
+    every row that matches exactly one map in a single database transaction.
+    Returns a (recorded count, report rows) tuple, where the report rows are the
+    (line number, row, problem, candidates) tuples that write_bulk_report expects.
+    If the database couldn't be written to at all, nothing is recorded and every
+    resolved row goes in the report with the error.
+
+    rows: a list of (line number, row) tuples from file_io.read_bulk_rows
+    maps: the root CatalogNode of the map catalog
+    map_db: a db.Database
+    users: the initials that are allowed to record maps"""
+    report = []
+    to_record = [] # (line number, row, insert_topo_if_absent arguments)
+    recorded_time = inventory.recorded_time()
+    for line_num, row in rows:
+        # blank attributes are (none) in the catalog, like they are in the drop-down menus
+        path = [row[level] or "(none)" for level in LEVELS]
+        is_damaged = parse_flag(row['is_damaged'])
+        is_duplicate = parse_flag(row['is_duplicate'])
+        if row['recorded_by'] not in users:
+            report.append((line_num, row, "initials are not in users.csv", ''))
+        elif is_damaged is None or is_duplicate is None:
+            report.append((line_num, row, "is_damaged and is_duplicate should be 1 or 0", ''))
+        else:
+            results = inventory.resolve(maps, path)
+            if len(results) == 1:
+                to_record.append((line_num, row, inventory.topo_record(results[0][0], row['recorded_by'],
+                                                                       is_damaged, is_duplicate, recorded_time)))
+            elif not results:
+                report.append((line_num, row, "no matching map", ''))
+            else:
+                report.append((line_num, row, "{} matching maps".format(len(results)),
+                               "; ".join(scan_id + " " + url for scan_id, url in results)))
+
+    outcomes = map_db.insert_topos_if_absent([record for _, _, record in to_record])
+    if outcomes == db.FAILED:
+        outcomes = [(db.FAILED, map_db.last_error)] * len(to_record)
+    recorded = 0
+    for (line_num, row, record), (outcome, error) in zip(to_record, outcomes):
+        if outcome == db.INSERTED:
+            recorded += 1
+        elif outcome == db.ALREADY_PRESENT:
+            report.append((line_num, row, "map {} has already been recorded".format(record[0]), record[0]))
+        else:
+            report.append((line_num, row, "could not record map {}: {}".format(record[0], error), record[0]))
+    report.sort(key=lambda report_row: report_row[0])
+    return recorded, report
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Record a csv of USGS topo maps in the map database.")
+    parser.add_argument('csv_path', help="a csv with the columns " + ", ".join(BULK_COLUMNS))
+    parser.add_argument('--report', help="where to write the rows that weren't recorded " +
+                        "(default: the csv's name with _report added)")
+    parser.add_argument('--db', default=db.default_db_path(), help="the map database")
+    parser.add_argument('--topos', help="the csv (or columnar file) of all USGS topo maps " +
+                        "(default: whichever of usgs_topos.csv and usgs_topos.htmc is up to date)")
+    args = parser.parse_args()
+    report_path = args.report or os.path.splitext(args.csv_path)[0] + '_report.csv'
+
+    start = time.perf_counter()
+    catalog, _ = inventory.load_catalog(args.topos)
+    map_db = inventory.open_database(args.db)
+    users = inventory.users()
+    loaded = time.perf_counter()
+
+    rows = file_io.read_bulk_rows(args.csv_path, BULK_COLUMNS)
+    recorded, report = record_bulk(rows, catalog.root(), map_db, users)
+    if report:
+        file_io.write_bulk_report(report_path, BULK_COLUMNS, report)
+    done = time.perf_counter()
+
+    print("Loaded the map catalog and database in {:.2f} s".format(loaded - start))
+    print("Recorded {:,} of {:,} maps in {:.2f} s ({:,.0f} rows/s)".format(
+        recorded, len(rows), done - loaded, len(rows) / max(done - loaded, 1e-9)))
+    if report:
+        print("{:,} rows need follow-up, see {}".format(len(report), report_path))
@@ -0,0 +1,503 @@
+# Ethan McIntosh - GIS and Data Services - Brown University - October 2026
+
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+import re
+import db
+
+# how many menus' worth of values a DbCatalog keeps (see DbCatalog)
+DB_CACHE_BRANCHES = 512
+
+# the attributes that the drop-down menus on the main window step through, in order
+LEVELS = ('map_scale', 'primary_state', 'cell_name', 'date_on_map', 'print_year')
+
+def display_key(val:str):
+    """Sort key for the values of a drop-down menu. Numeric strings sort by number
+    and everything else alphabetically, with '(none)' treated as zero, the same as
+    multisort in bul_topo_tool.py. Unlike multisort, numbers and words can be sorted
+    together (numbers come first), since the catalog sorts every value of a level
+    at once rather than one menu's worth at a time."""
+    if val == '(none)':
+        return (0, 0.0, val)
+    try:
+        return (0, float(val), val)
+    except ValueError:
+        return (1, 0.0, val)
+
+class Catalog:
+    """A compact, read-only version of the nested dictionary that read_topos builds.
+    Instead of ~190k Python tuples at the bottom of a five-level tree of dicts,
+    every attribute is dictionary-encoded: each distinct map scale, state, cell
+    name, map year and print year is stored once in a per-level pool, and the
+    tree itself is a set of flat integer arrays.
+
+    The catalog rows are sorted by their attribute codes, so every node of the
+    tree covers a contiguous run of the next level's nodes (and the last level's
+    nodes cover contiguous runs of rows):
+
+        values[level][i]  is the pool code of node i at that level
+        starts[level][i]  is the index of node i's first child in level+1, or,
+                          for the last level, of its first row. starts has one
+                          more entry than values so that node i's children end
+                          at starts[level][i+1].
+        runs[level][i]    is how many levels below node i have only one possible
+                          value in a row (0 unless node i has a single child),
+                          which is how many drop-down menus get locked in at
+                          once when node i's value is selected.
+
+    Each pool is sorted in display order (see display_key) and the codes are
+    positions in the pools, so every node's children are already in the order
+    the drop-down menus show them in.
+
+    The leaves (scan IDs and product URLs) are stored in row order. Product URLs
+    share a handful of directories, so each one is split into a dictionary-encoded
+    directory and a file name.
+
+    Use root() to get a CatalogNode, which answers the same maps[...] lookups that
+    the nested dictionary does, and find_row() and path() to go the other way,
+    from a scan ID or product URL to the drop-down menu values of its map.
+
+    A catalog read from a columnar file (see file_io.read_columnar) has the same
+    arrays, but as views onto the memory-mapped file rather than copies of it,
+    with the file names as a StringColumn. It also comes with scan_order and
+    name_order, the rows sorted by scan ID and by file name, which find_row()
+    binary searches instead of building hash indexes."""
+
+    def __init__(self, pools, values, starts, runs, scan_ids, url_dirs, url_dir_codes, url_names,
+                 scan_order=None, name_order=None):
+        self.pools = pools
+        self.values = values
+        self.starts = starts
+        self.runs = runs
+        self.scan_ids = scan_ids
+        self.url_dirs = url_dirs
+        self.url_dir_codes = url_dir_codes
+        self.url_names = url_names
+        self.scan_order = scan_order
+        self.name_order = name_order
+        self._codes = None
+        self._rows = None
+
+    def __getstate__(self):
+        """The string -> code and identifier -> row lookups are cheap to rebuild, so
+        they are left out of pickles"""
+        state = self.__dict__.copy()
+        state['_codes'] = None
+        state['_rows'] = None
+        return state
+
+    def __len__(self):
+        """the number of map records (rows) in the catalog"""
+        return len(self.url_names)
+
+    def root(self):
+        """returns the node whose keys are the map scales, the top of the hierarchy"""
+        return CatalogNode(self, 0, 0, len(self.values[0]))
+
+    def _child(self, level:int, i:int):
+        """returns what node i of a level leads to: a CatalogNode, or for the last
+        level, the list of (scan ID, product URL) tuples"""
+        starts = self.starts[level]
+        if level == len(LEVELS) - 1:
+            return self.rows(starts[i], starts[i+1])
+        return CatalogNode(self, level + 1, starts[i], starts[i+1])
+
+    def code(self, level:int, val:str):
+        """Returns the pool code of a given value at a given level, or None if the
+        value never occurs at that level."""
+        if self._codes is None:
+            self._codes = [{v: c for c, v in enumerate(pool)} for pool in self.pools]
+        return self._codes[level].get(val)
+
+    def index_rows(self):
+        """Builds the hash indexes that find_row() looks scan IDs and product URL file
+        names up in, if they haven't been built yet. They take a few hundredths of a
+        second, so the tool builds them on the thread that loads the catalog rather
+        than on the first lookup. A catalog with scan_order and name_order doesn't
+        need them, so this returns None for it."""
+        if self.scan_order is not None:
+            return None
+        if self._rows is None:
+            scan_rows = {scan_id: r for r, scan_id in enumerate(self.scan_ids)}
+            name_rows = {name: r for r, name in enumerate(self.url_names)}
+            self._rows = (scan_rows, name_rows)
+        return self._rows
+
+    def find_row(self, identifier:str):
+        """Returns the row of the map with a given scan ID or product URL, or None if
+        there isn't one. A product URL only has to end in the right file name, so
+        the file name on its own works too, as does a URL with http:// instead of
+        https:// or a ?query on the end."""
+        identifier = identifier.strip()
+        if not identifier:
+            return None
+        key = identifier
+        if not isinstance(self.scan_ids, (list, StringColumn)):
+            # scan IDs are stored as integers (see CatalogBuilder.add)
+            key = int(identifier) if identifier.isdigit() and str(int(identifier)) == identifier else None
+        name = identifier.split('?')[0].rstrip('/').rpartition('/')[2]
+        if self.scan_order is not None:
+            row = None if key is None else _search_sorted(self.scan_order, self.scan_ids, key)
+            if row is None:
+                row = _search_sorted(self.name_order, self.url_names, name)
+            return row
+        scan_rows, name_rows = self.index_rows()
+        row = scan_rows.get(key)
+        if row is None:
+            row = name_rows.get(name)
+        return row
+
+    def path(self, row:int):
+        """Returns the (map scale, primary state, cell name, map year, print year) of
+        a row, found by walking up from the row to the top of the hierarchy: each
+        node covers a contiguous run of the level below it, so its parent is the
+        last node at the level above whose run starts at or before it."""
+        vals = []
+        i = row
+        for level in reversed(range(len(LEVELS))):
+            i = bisect_right(self.starts[level], i) - 1
+            vals.append(self.pools[level][self.values[level][i]])
+        return tuple(reversed(vals))
+
+    def find(self, identifier:str):
+        """Returns a (path, (scan ID, product URL)) tuple for the map with a given scan
+        ID or product URL (see find_row and path), or None if there isn't one"""
+        row = self.find_row(identifier)
+        if row is None:
+            return None
+        return self.path(row), self.rows(row, row + 1)[0]
+
+    def rows(self, lo:int, hi:int):
+        """returns the (scan ID, product URL) tuples of rows lo through hi-1"""
+        return [(str(self.scan_ids[r]), self.url_dirs[self.url_dir_codes[r]] + self.url_names[r])
+                for r in range(lo, hi)]
+
+def _search_sorted(order, column, key):
+    """Binary searches a column for a value, where order lists the column's rows
+    sorted by their values. Returns the first row with that value, or None."""
+    lo, hi = 0, len(order)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if column[order[mid]] < key:
+            lo = mid + 1
+        else:
+            hi = mid
+    if lo < len(order) and column[order[lo]] == key:
+        return order[lo]
+    return None
+
+class StringColumn:
+    """A read-only list of strings stored back to back as utf-8 in one block of bytes
+    (like part of a memory-mapped file), where string i is bytes offsets[i] through
+    offsets[i+1]-1. A string is only decoded into a Python object when it's asked for."""
+    __slots__ = ('blob', 'offsets')
+
+    def __init__(self, blob, offsets):
+        self.blob = blob
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return str(self.blob[self.offsets[i]:self.offsets[i+1]], 'utf-8')
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+class CatalogNode:
+    """A view onto one node of a Catalog that behaves like the corresponding level
+    of the nested dictionary from read_topos: node.keys() lists the possible values
+    of the next drop-down menu, and node[value] returns the next node down, or,
+    at the print year level, the list of (scan ID, product URL) tuples."""
+    __slots__ = ('catalog', 'level', 'lo', 'hi')
+
+    def __init__(self, catalog:Catalog, level:int, lo:int, hi:int):
+        """level is the level of this node's children, which are nodes lo through
+        hi-1 of that level"""
+        self.catalog = catalog
+        self.level = level
+        self.lo = lo
+        self.hi = hi
+
+    def _find(self, key):
+        """returns the index of the child with a given value, or -1 if there isn't one"""
+        code = self.catalog.code(self.level, key)
+        if code is None:
+            return -1
+        # children are sorted by code, so we can binary search for it
+        vals = self.catalog.values[self.level]
+        i = bisect_left(vals, code, self.lo, self.hi)
+        if i < self.hi and vals[i] == code:
+            return i
+        return -1
+
+    def __getitem__(self, key):
+        i = self._find(key)
+        if i < 0:
+            raise KeyError(key)
+        return self.catalog._child(self.level, i)
+
+    def __contains__(self, key):
+        return self._find(key) >= 0
+
+    def __len__(self):
+        return self.hi - self.lo
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def keys(self):
+        """returns a list of the values of this node's children, in display order"""
+        pool = self.catalog.pools[self.level]
+        vals = self.catalog.values[self.level]
+        return [pool[vals[i]] for i in range(self.lo, self.hi)]
+
+    def collapse_chain(self):
+        """If this node has only one child, returns the run of values that get locked
+        into the drop-down menus below it without the user having to choose anything:
+        a list of (value, what that value leads to) pairs, one per locked-in level,
+        where what it leads to is what node[value] would return. Returns an empty
+        list if this node has more than one child."""
+        if self.hi - self.lo != 1:
+            return []
+        catalog = self.catalog
+        level, i = self.level, self.lo
+        chain = []
+        for _ in range(1 + catalog.runs[level][i]):
+            child = catalog._child(level, i)
+            chain.append((catalog.pools[level][catalog.values[level][i]], child))
+            if level < len(LEVELS) - 1:
+                level, i = level + 1, child.lo
+        return chain
+
+class CatalogBuilder:
+    """Collects catalog rows one at a time, dictionary-encoding each attribute as
+    it goes, and then sorts them into a Catalog with build()."""
+
+    def __init__(self):
+        self.pools = [[] for _ in LEVELS]
+        self._codes = [{} for _ in LEVELS]
+        self.columns = [array('I') for _ in LEVELS]
+        # HTMC scan IDs are integers, so they're packed into an array unless
+        # we come across one that isn't, in which case we fall back to strings
+        self.scan_ids = array('q')
+        self.url_dirs = []
+        self._url_dir_codes = {}
+        self.url_dir_codes = array('I')
+        self.url_names = []
+
+    def _encode(self, level:int, val:str):
+        """returns the pool code for a value at a given level, adding it to the pool if new"""
+        codes = self._codes[level]
+        code = codes.get(val)
+        if code is None:
+            code = codes[val] = len(self.pools[level])
+            self.pools[level].append(val)
+        return code
+
+    def add(self, scan_id:str, path, url:str):
+        """Adds one map record to the catalog.
+
+        scan_id: the map's scan ID
+        path: the map's (map scale, primary state, cell name, map year, print year)
+        url: the map's product URL"""
+        for level, val in enumerate(path):
+            self.columns[level].append(self._encode(level, val))
+
+        if isinstance(self.scan_ids, array):
+            if scan_id.isdigit() and str(int(scan_id)) == scan_id:
+                self.scan_ids.append(int(scan_id))
+            else:
+                self.scan_ids = [str(x) for x in self.scan_ids]
+        if not isinstance(self.scan_ids, array):
+            self.scan_ids.append(scan_id)
+
+        url_dir, _, url_name = url.rpartition('/')
+        if url_dir:
+            url_dir += '/'
+        code = self._url_dir_codes.get(url_dir)
+        if code is None:
+            code = self._url_dir_codes[url_dir] = len(self.url_dirs)
+            self.url_dirs.append(url_dir)
+        self.url_dir_codes.append(code)
+        self.url_names.append(url_name)
+
+    def build(self):
+        """Sorts the rows collected so far into display order and assembles the
+        arrays of the Catalog, including the single-child runs of each node."""
+        n = len(self.url_names)
+
+        # re-number each level's codes so that they follow display order
+        pools = []
+        cols = []
+        for pool, col in zip(self.pools, self.columns):
+            ranked = sorted(range(len(pool)), key=lambda code: display_key(pool[code]))
+            rank_of = array('I', bytes(4 * len(pool)))
+            for rank, code in enumerate(ranked):
+                rank_of[code] = rank
+            pools.append([pool[code] for code in ranked])
+            cols.append(array('I', (rank_of[code] for code in col)))
+
+        # pack the five codes of each row into one integer sort key
+        sizes = [max(len(pool), 1) for pool in pools]
+        def row_key(r):
+            key = 0
+            for level, col in enumerate(cols):
+                key = key * sizes[level] + col[r]
+            return key
+        order = sorted(range(n), key=row_key)
+
+        values = [array('I') for _ in LEVELS]
+        starts = [array('I') for _ in LEVELS]
+        last = len(LEVELS) - 1
+        prev = None
+        for pos, r in enumerate(order):
+            path = [col[r] for col in cols]
+            # find the first level at which this row leaves the previous row's branch
+            depth = 0
+            if prev is not None:
+                while depth < len(LEVELS) and path[depth] == prev[depth]:
+                    depth += 1
+            # open a new node at that level and at every level below it
+            for level in range(depth, len(LEVELS)):
+                starts[level].append(pos if level == last else len(values[level + 1]))
+                values[level].append(path[level])
+            prev = path
+        # closing entries so that the last node at each level knows where it ends
+        for level in range(last):
+            starts[level].append(len(values[level + 1]))
+        starts[last].append(n)
+
+        # work out the single-child runs from the bottom of the hierarchy up. The
+        # last level's children are rows, not menus, so its runs are all zero
+        runs = [array('B', bytes(len(vals))) for vals in values]
+        for level in reversed(range(last)):
+            level_starts = starts[level]
+            for i in range(len(values[level])):
+                child = level_starts[i]
+                if level_starts[i+1] - child == 1:
+                    runs[level][i] = 1 + runs[level + 1][child]
+
+        if isinstance(self.scan_ids, array):
+            scan_ids = array('q', (self.scan_ids[r] for r in order))
+        else:
+            scan_ids = [self.scan_ids[r] for r in order]
+        return Catalog(pools, values, starts, runs, scan_ids, self.url_dirs,
+                       array('I', (self.url_dir_codes[r] for r in order)),
+                       [self.url_names[r] for r in order])
+
+class DbCatalog:
+    """Answers the same lookups as a Catalog straight from the all_usgs_topos table
+    of the map database, instead of from usgs_topos.csv loaded into memory. Each
+    drop-down menu's values are looked up with an indexed query (see
+    Database.catalog_values) when the menu above it gets a value, and the last
+    DB_CACHE_BRANCHES lookups are kept in a least-recently-used cache, so going
+    back and forth between nearby maps doesn't go back to the database. Nothing is
+    read up front, so it's ready as soon as it's created, and it only ever holds
+    the parts of the hierarchy that have been looked at.
+
+    Use root() to get a DbCatalogNode, which behaves like a CatalogNode, and find()
+    to look a map up by its scan ID or product URL."""
+
+    def __init__(self, db_path:str, cache_size:int=DB_CACHE_BRANCHES):
+        self.db_path = db_path
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._db = None
+
+    def _database(self):
+        """returns the catalog's own connection to the map database, connecting the
+        first time, so that it belongs to whichever thread uses the catalog"""
+        if self._db is None:
+            self._db = db.Database(self.db_path)
+        return self._db
+
+    def lookup(self, path:tuple):
+        """Returns the values of the drop-down menu after the given selections, in
+        display order (see display_key), or once every menu has a value, the list of
+        (scan ID, product URL) tuples of the matching maps. Blanks are '(none)',
+        like they are in a Catalog."""
+        result = self._cache.get(path)
+        if result is not None:
+            self._cache.move_to_end(path)
+            return result
+        query = [None if val == '(none)' else val for val in path]
+        if len(path) == len(LEVELS):
+            result = [(scan_id, url or '(none)') for scan_id, url in self._database().catalog_maps(query)]
+        else:
+            vals = {'(none)' if val is None else val for val in self._database().catalog_values(query)}
+            result = sorted(vals, key=display_key)
+        self._cache[path] = result
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False) # forget the least recently used
+        return result
+
+    def root(self):
+        """returns the node whose keys are the map scales, the top of the hierarchy"""
+        return DbCatalogNode(self, ())
+
+    def find(self, identifier:str):
+        """Returns a (path, (scan ID, product URL)) tuple for the map with a given scan
+        ID or product URL, like Catalog.find, or None if there isn't one. HTMC product
+        URLs have the map's scan ID in their file name (like OR_Salem_280976_1969_24000_geo.pdf),
+        so a URL is looked up by each number in its file name in turn, until one
+        turns out to be the scan ID of a map with that file name."""
+        identifier = identifier.strip()
+        name = identifier.split('?')[0].rstrip('/').rpartition('/')[2]
+        candidates = [identifier] if identifier.isdigit() else re.findall(r'\d+', name)
+        for scan_id in candidates:
+            found = self._database().catalog_find(scan_id)
+            if found is None:
+                continue
+            url = found[-1] or ''
+            if identifier.isdigit() or url.rpartition('/')[2] == name:
+                path = tuple('(none)' if val in (None, '') else str(val) for val in found[:len(LEVELS)])
+                return path, (str(found[-2]), url or '(none)')
+        return None
+
+class DbCatalogNode:
+    """A view onto one node of a DbCatalog that behaves like a CatalogNode: node.keys()
+    lists the possible values of the next drop-down menu, and node[value] returns the
+    next node down, or, at the print year level, the list of (scan ID, product URL) tuples."""
+    __slots__ = ('catalog', 'path')
+
+    def __init__(self, catalog:DbCatalog, path:tuple):
+        """path is the values selected above this node, from map scale down"""
+        self.catalog = catalog
+        self.path = path
+
+    def __getitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        path = self.path + (key,)
+        if len(path) == len(LEVELS):
+            return self.catalog.lookup(path)
+        return DbCatalogNode(self.catalog, path)
+
+    def __contains__(self, key):
+        return key in self.catalog.lookup(self.path)
+
+    def __len__(self):
+        return len(self.catalog.lookup(self.path))
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def keys(self):
+        """returns a list of the values of this node's children, in display order"""
+        return list(self.catalog.lookup(self.path))
+
+    def collapse_chain(self):
+        """Like CatalogNode.collapse_chain: if this node has only one child, returns the
+        (value, what that value leads to) pairs of the run of drop-down menus below it
+        that only have one possible value, or an empty list otherwise."""
+        chain = []
+        node = self
+        while isinstance(node, DbCatalogNode) and len(node) == 1:
+            val = node.keys()[0]
+            child = node[val]
+            chain.append((val, child))
+            node = child
+        return chain
@@ -0,0 +1,131 @@
+# Ethan McIntosh - GIS and Data Services - Brown University - October 2026
+
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from functools import lru_cache
+from itertools import chain, islice
+import math, re
+
+# abbreviations that turn up in printed map titles but are spelled out in HTMC cell
+# names (or the other way around). Both the cell names and whatever is typed in have
+# these expanded, so "Mt. Hood", "Mt Hood" and "Mount Hood" all look the same
+ABBREVIATIONS = {'mt': 'mount', 'mtn': 'mountain', 'mtns': 'mountains', 'st': 'saint', 'ste': 'sainte',
+                 'ft': 'fort', 'pt': 'point', 'pk': 'peak', 'lk': 'lake', 'ck': 'creek', 'cr': 'creek',
+                 'spg': 'spring', 'spgs': 'springs', 'hts': 'heights', 'jct': 'junction', 'is': 'island',
+                 'isl': 'island', 'r': 'river', 'res': 'reservoir', 'sta': 'station'}
+
+# how alike (see CellNameIndex.search) a cell name that doesn't contain what was
+# typed in has to be to count as a near miss
+MIN_SIMILARITY = 0.35
+
+# how many matches search() returns at most
+MAX_MATCHES = 50
+
+# how many of the names that share the most 3-letter pieces with the typed-in text
+# search() ranks. This is what keeps a search under a few milliseconds at any size
+MAX_CANDIDATES = 300
+
+_non_word = re.compile(r"[^a-z0-9]+")
+
+def normalize(text:str):
+    """lowercases a cell name (or what's been typed in), turns punctuation into spaces,
+    and expands ABBREVIATIONS"""
+    words = _non_word.sub(' ', text.lower()).split()
+    return ' '.join(ABBREVIATIONS.get(word, word) for word in words)
+
+def trigrams(norm:str):
+    """returns the set of 3-letter pieces of a normalized name, with a space at either
+    end so that the starts and ends of names count too"""
+    padded = ' ' + norm + ' '
+    return {padded[i:i+3] for i in range(len(padded) - 2)}
+
+class CellNameIndex:
+    """A trigram index over a list of cell names, for finding the ones that contain
+    whatever has been typed in, or nearly match it, when a plain prefix match comes
+    up empty. Every 3-letter piece of every normalized name is mapped to the names
+    it occurs in, so a search only looks at the names listed under the rarest
+    pieces of the typed-in text rather than at every name."""
+
+    def __init__(self, names):
+        self.names = list(names)
+        self.norms = [normalize(name) for name in self.names]
+        self.padded = [' ' + norm + ' ' for norm in self.norms]
+        # the normalized names in sorted order, for finding the ones that start with
+        # a query that's too short to have any pieces of its own
+        self.sorted_norms = sorted((norm, i) for i, norm in enumerate(self.norms))
+        self.sizes = []
+        postings = defaultdict(list)
+        for i, norm in enumerate(self.norms):
+            grams = trigrams(norm)
+            self.sizes.append(len(grams))
+            for gram in grams:
+                postings[gram].append(i)
+        self.postings = dict(postings)
+
+    def search(self, text:str, limit:int=MAX_MATCHES):
+        """Returns up to limit of the cell names that match the given text, best match
+        first, in three groups: names that start with it, then names that contain it,
+        then near misses, ranked by trigram similarity (the share of the text's and the
+        name's 3-letter pieces that they have in common). Names are compared after
+        normalize(), so case, punctuation and ABBREVIATIONS don't matter.
+
+        Every name that starts with or contains the text is found, but only the
+        MAX_CANDIDATES other names that share the most pieces with the text are ranked
+        as near misses, which keeps the time a search takes about the same however
+        many names there are."""
+        query = normalize(text)
+        if not query:
+            return []
+        if len(query) < 3:
+            # too short to have any pieces, and nearly every name contains a letter or
+            # two, so only the names that start with it count
+            return [self.names[i] for i in islice(self.prefix_hits(query), limit)]
+
+        query_grams = sorted(trigrams(query), key=lambda gram: len(self.postings.get(gram, ())))
+        def similarity(i):
+            padded = self.padded[i]
+            shared = sum(1 for gram in query_grams if gram in padded)
+            return shared / (len(query_grams) + self.sizes[i] - shared)
+
+        # the names that start with the query, from the sorted names, and the ones that
+        # contain it, which have all of the query's inner pieces (the ones that don't
+        # take in a padding space at either end), so they're all listed under the rarest of those
+        exact = set(self.prefix_hits(query))
+        inner = min((query[i:i+3] for i in range(len(query) - 2)), key=lambda gram: len(self.postings.get(gram, ())))
+        exact.update(i for i in self.postings.get(inner, ()) if query in self.norms[i])
+        hits = [(0 if self.norms[i].startswith(query) else 1, -similarity(i), self.norms[i], i) for i in exact]
+
+        if len(hits) < limit:
+            # then near misses. A near miss has to share at least min_shared of the
+            # query's pieces, so it has to have at least one of the rarest
+            # len - min_shared + 1 of them
+            min_shared = max(1, math.ceil(MIN_SIMILARITY * len(query_grams)))
+            candidate_grams = query_grams[:len(query_grams) - min_shared + 1]
+            counts = Counter(chain.from_iterable(self.postings.get(gram, ()) for gram in candidate_grams))
+            for i in exact:
+                del counts[i]
+            for i, _ in counts.most_common(MAX_CANDIDATES):
+                score = similarity(i)
+                if score >= MIN_SIMILARITY:
+                    hits.append((2, -score, self.norms[i], i))
+        hits.sort()
+        return [self.names[hit[-1]] for hit in hits[:limit]]
+
+    def prefix_hits(self, query:str):
+        """yields the positions of the names whose normalized form starts with a
+        normalized query, in alphabetical order, by a binary search of sorted_norms"""
+        for pos in range(bisect_left(self.sorted_norms, (query,)), len(self.sorted_norms)):
+            norm, i = self.sorted_norms[pos]
+            if not norm.startswith(query):
+                break
+            yield i
+
+@lru_cache(maxsize=64)
+def _cached_index(names:tuple):
+    return CellNameIndex(names)
+
+def index_for(names):
+    """Returns a CellNameIndex over a list of cell names, building it only the first
+    time a given list is seen, so that each state's cell names are indexed once no
+    matter how many times the state gets selected."""
+    return _cached_index(tuple(names))
@@ -0,0 +1,103 @@
+# Ethan McIntosh - GIS and Data Services - Brown University - October 2026
+
+# Converts usgs_topos.csv into a compact columnar file (usgs_topos.htmc) that the
+# tool memory-maps instead of parsing the csv (see the COLUMNAR CATALOG FILES part
+# of file_io.py), and reports how long each way of loading the catalog takes, how
+# many bytes it reads and how much memory it ends up using:
+#
+#   python convert_htmc.py [usgs_topos.csv] [--out usgs_topos.htmc]
+#
+# Once usgs_topos.htmc exists and is at least as new as usgs_topos.csv, the tool,
+# bulk_record.py and refresh_htmc.py all use it (see inventory.catalog_path), so
+# only the columnar file needs to be copied to a workstation. Converting again after
+# usgs_topos.csv changes brings it back up to date; refresh_htmc.py does that itself.
+#
+# Each way of loading is measured in a separate python process, so that they don't
+# share memory. Bytes read are the bytes read through file reads, and resident memory
+# is what the process holds once the catalog is loaded (both on Linux only). The parts
+# of a memory-mapped file are read in by the operating system as they're used
+# instead, so a columnar load only reads its header up front, and only the parts of
+# the file that have been looked at count as resident.
+
+import argparse, json, os, subprocess, sys, time
+import file_io, inventory # import the other files in this package
+
+def convert(csv_path:str, out_path:str):
+    """reads a csv table of all USGS topographic maps and writes its columnar file"""
+    catalog, cells = file_io.read_htmc(csv_path)
+    file_io.write_columnar(out_path, catalog, cells, csv_path)
+
+def bytes_read():
+    """returns how many bytes this process has read through file reads so far, or None if that can't be told"""
+    try:
+        with open('/proc/self/io') as f:
+            for line in f:
+                if line.startswith('rchar:'):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+
+def resident_mb():
+    """returns how much memory this process has resident right now, in MB (on Linux only), or None"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1e3 # in KB
+    except OSError:
+        return None
+
+def measure(how:str, filepath:str):
+    """Loads the catalog one way and returns a dictionary with how long it took, how many
+    bytes were read, and how much memory the process has resident afterwards, once the
+    second drop-down menu has been filled for each map scale the way the tool would"""
+    read_before = bytes_read()
+    start = time.perf_counter()
+    if how == 'parse':
+        catalog, _ = file_io.read_htmc(filepath)
+    elif how == 'snapshot':
+        catalog, _, _ = file_io.read_htmc_cached(filepath)
+    else:
+        catalog, _ = file_io.read_columnar(filepath)
+    maps = catalog.root()
+    for scale in maps.keys():
+        maps[scale].keys()
+    seconds = time.perf_counter() - start
+    read_after = bytes_read()
+    return {'seconds': seconds, 'bytes_read': None if read_before is None else read_after - read_before,
+            'resident_mb': resident_mb()}
+
+def report(csv_path:str, out_path:str):
+    """prints how each way of loading the catalog compares, each measured in a fresh python process"""
+    ways = [("parse " + csv_path, 'parse', csv_path)]
+    if os.path.exists(csv_path + '.cache'):
+        ways.append(("snapshot " + csv_path + '.cache', 'snapshot', csv_path))
+    ways.append(("memory-map " + out_path, 'columnar', out_path))
+    print("{:<40}{:>12}{:>10}{:>14}{:>15}".format("", "file MB", "load s", "MB read", "resident MB"))
+    for label, how, filepath in ways:
+        result = subprocess.run([sys.executable, os.path.abspath(__file__), '--measure', how, filepath],
+                                capture_output=True, text=True, check=True)
+        stats = json.loads(result.stdout)
+        size = os.path.getsize(filepath + '.cache' if how == 'snapshot' else filepath)
+        print("{:<40}{:>12.1f}{:>10.2f}{:>14}{:>15}".format(label, size / 1e6, stats['seconds'],
+              'n/a' if stats['bytes_read'] is None else "{:.1f}".format(stats['bytes_read'] / 1e6),
+              'n/a' if stats['resident_mb'] is None else "{:.1f}".format(stats['resident_mb'])))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Convert usgs_topos.csv into a memory-mappable columnar file.")
+    parser.add_argument('csv_path', nargs='?', default=inventory.TOPOS_CSV, help="the csv of all USGS topo maps")
+    parser.add_argument('--out', default=inventory.TOPOS_COLUMNAR, help="the columnar file to write (default: %(default)s)")
+    parser.add_argument('--measure', nargs=2, metavar=('HOW', 'PATH'), help=argparse.SUPPRESS) # used by report()
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure(*args.measure)))
+        sys.exit(0)
+
+    start = time.perf_counter()
+    try:
+        convert(args.csv_path, args.out)
+    except RuntimeError as e: # the columnar file is open in the tool (see file_io.swap_in)
+        sys.exit(str(e))
+    print("Wrote {} in {:.2f} s\n".format(args.out, time.perf_counter() - start))
+    report(args.csv_path, args.out)
@@ -1,54 +1,622 @@
 # Ethan McIntosh - GIS and Data Services - Brown University - August 2022
 
-import sqlite3
+import os, sqlite3
+
+# what insert_topo_if_absent, insert_exception_with_new_id, apply_writes and remove_if_present can report
+INSERTED = 'inserted'
+ALREADY_PRESENT = 'already present'
+REMOVED = 'removed'
+ALREADY_ABSENT = 'already absent'
+FAILED = 'failed'
+
+# the tables of maps we have, and the column that identifies a map in each of them
+WE_HAVE_TABLES = [('usgs_topos_we_have', 'scan_id'), ('exception_maps_we_have', 'map_id')]
+
+# the SQL behind each kind of query the tool issues. check_query_plans() asks sqlite
+# how it would run every one of these, so any new query belongs here as well
+FETCH_SQL = "SELECT * FROM {table} WHERE {id_name} = ?"
+MOST_RECENT_COLS = "producer, map_scale, primary_state, cell_name, date_on_map, print_year, is_damaged, is_duplicate, recorded_time"
+# one page of the history of maps a user has recorded, in both tables, most recent
+# first. Each table is paged through by keyset: a page picks up right after the last
+# (recorded_time, map ID) of that table that the previous page showed, which the
+# most_recent index can jump straight to, so a page takes the same time however far
+# back it is. Times are only to the minute, so the map ID breaks ties, and each table
+# keeps its own place since a USGS scan ID and an exception map ID aren't comparable.
+# Each half reads its table's most_recent index in order, so sqlite merges the two
+# halves as it goes instead of collecting and sorting every map the user has recorded.
+# The last column says which table a row came from (an index into WE_HAVE_TABLES)
+HISTORY_AFTER_SQL = " AND (recorded_time, {id_name}) < (:{table}_time, :{table}_id)"
+HISTORY_PAGE_SQL = "SELECT scan_id, " + MOST_RECENT_COLS + ", 0 FROM usgs_topos_we_have WHERE recorded_by = :user{after0}" +\
+    " UNION ALL SELECT map_id, " + MOST_RECENT_COLS + ", 1 FROM exception_maps_we_have WHERE recorded_by = :user{after1}" +\
+    " ORDER BY recorded_time DESC, 1 DESC LIMIT :limit"
+INSERT_TOPO_IF_ABSENT_SQL = "INSERT INTO usgs_topos_we_have SELECT *, ?, ?, ?, ?, ? FROM all_usgs_topos WHERE scan_id = ?" +\
+    " AND NOT EXISTS (SELECT 1 FROM usgs_topos_we_have WHERE scan_id = ?)"
+TOPO_RECORDED_SQL = "SELECT 1 FROM usgs_topos_we_have WHERE scan_id = ?"
+EXCEPTION_COLS = "(map_id, producer, map_scale, primary_state, cell_name, gnis_cell_id, " +\
+    "date_on_map, print_year, sheet, series, edition, is_damaged, is_duplicate, recorded_by, recorded_time)"
+INSERT_EXCEPTION_IF_ABSENT_SQL = "INSERT INTO exception_maps_we_have " + EXCEPTION_COLS +\
+    " SELECT ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?" +\
+    " WHERE NOT EXISTS (SELECT 1 FROM exception_maps_we_have WHERE map_id = ?)"
+REMOVE_SQL = "DELETE FROM {table} WHERE {id_name} = ?"
+NEXT_ID_SQL = "UPDATE id_sequences SET next_id = next_id + 1 WHERE name = ?"
+ALLOCATED_ID_SQL = "SELECT next_id - 1 FROM id_sequences WHERE name = ?"
+
+# how many maps of all_usgs_topos we have, and how many are damaged or duplicated,
+# for each map scale and state. A map that was somehow recorded twice only counts
+# once. Unlike the queries above, these read every map on purpose, so they aren't
+# part of check_query_plans(); all_usgs_topos is read through the all_usgs_topos_levels
+# index, which already has its rows in map scale and state order
+COVERAGE_COLUMNS = ['map_scale', 'primary_state', 'maps_in_htmc', 'maps_we_have', 'percent_we_have',
+                    'damaged', 'duplicates']
+COVERAGE_SQL = "SELECT a.map_scale, a.primary_state, COUNT(*), COUNT(h.scan_id), " +\
+    "ROUND(100.0 * COUNT(h.scan_id) / COUNT(*), 1), COALESCE(SUM(h.is_damaged), 0), COALESCE(SUM(h.is_duplicate), 0) " +\
+    "FROM all_usgs_topos a LEFT JOIN (SELECT scan_id, MAX(is_damaged) AS is_damaged, MAX(is_duplicate) AS is_duplicate " +\
+    "FROM usgs_topos_we_have GROUP BY scan_id) h ON h.scan_id = a.scan_id GROUP BY a.map_scale, a.primary_state"
+EXCEPTION_COVERAGE_SQL = "SELECT COUNT(*), COALESCE(SUM(is_damaged), 0), COALESCE(SUM(is_duplicate), 0) " +\
+    "FROM exception_maps_we_have"
+
+# the maps we have (see inventory.RecordedMaps): everything at once, and then only
+# what has changed since then, according to the we_have_changes log. An exception map
+# is told apart from the others by EXCEPTION_KEY_COLS rather than its map ID, which is
+# different every time one is recorded
+EXCEPTION_KEY_COLS = "producer, map_scale, primary_state, cell_name, gnis_cell_id, date_on_map, print_year, sheet, series, edition"
+HAS_CHANGES_LOG_SQL = "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'we_have_changes'"
+RECORDED_SEQ_SQL = "SELECT COALESCE(MAX(seq), 0) FROM we_have_changes"
+RECORDED_TOPOS_SQL = "SELECT scan_id FROM usgs_topos_we_have"
+RECORDED_EXCEPTIONS_SQL = "SELECT map_id, " + EXCEPTION_KEY_COLS + " FROM exception_maps_we_have"
+# the log only needs to go back as far as the last time any copy of the tool read it,
+# which is a couple of seconds ago for every copy that's running (and one that's been
+# left behind reads everything again), so apply_writes() keeps just the most recent
+# CHANGES_KEPT changes. The deletes find the old rows by seq, the table's primary key
+CHANGES_KEPT = 10000
+PRUNE_CHANGES_SQL = "DELETE FROM we_have_changes WHERE seq <= (SELECT MAX(seq) FROM we_have_changes) - ?"
+RECORDED_CHANGES_SQL = "SELECT c.seq, c.table_idx, c.map_id, c.removed, " +\
+    ", ".join("e." + col for col in EXCEPTION_KEY_COLS.split(", ")) + " FROM we_have_changes c " +\
+    "LEFT JOIN exception_maps_we_have e ON c.table_idx = 1 AND c.removed = 0 AND e.map_id = c.map_id " +\
+    "WHERE c.seq > ? ORDER BY c.seq"
+
+# the columns of all_usgs_topos that the drop-down menus step through, in order
+# (catalog.LEVELS), for filling the menus straight from the database (see DbCatalog
+# in catalog.py). A None value in a path stands for a blank
+CATALOG_COLUMNS = ['map_scale', 'primary_state', 'cell_name', 'date_on_map', 'print_year']
+# the distinct values of a column among the maps matching the selections above it.
+# The first couple of menus have a few values that each cover thousands of maps, so
+# rather than reading every map's index entry, the values are picked out one at a time
+# by jumping through the all_usgs_topos_levels index from each value to the next one
+# (a "loose index scan"), with blanks checked for separately since MIN skips NULLs
+CATALOG_SKIP_SCAN_LEVELS = 2
+CATALOG_VALUES_SKIP_SQL = "WITH RECURSIVE distinct_vals(val) AS (" +\
+    "SELECT MIN({column}) FROM all_usgs_topos WHERE {where} UNION ALL " +\
+    "SELECT (SELECT MIN({column}) FROM all_usgs_topos WHERE {where} AND {column} > distinct_vals.val) " +\
+    "FROM distinct_vals WHERE distinct_vals.val IS NOT NULL) " +\
+    "SELECT val FROM distinct_vals WHERE val IS NOT NULL " +\
+    "UNION ALL SELECT NULL WHERE EXISTS (SELECT 1 FROM all_usgs_topos WHERE {where} AND {column} IS NULL)"
+CATALOG_VALUES_SQL = "SELECT DISTINCT {column} FROM all_usgs_topos WHERE {where}"
+CATALOG_MAPS_SQL = "SELECT scan_id, product_url FROM all_usgs_topos WHERE {where}"
+CATALOG_FIND_SQL = "SELECT " + ", ".join(CATALOG_COLUMNS) + ", scan_id, product_url FROM all_usgs_topos WHERE scan_id = ?"
+
+# refresh_htmc.py swaps changed rows of all_usgs_topos out one scan ID at a time.
+# It also reads all_usgs_topos and usgs_topos_we_have from end to end, which are
+# meant to be full table scans, so those reads aren't in tool_queries()
+REMOVE_HTMC_SQL = "DELETE FROM all_usgs_topos WHERE scan_id = ?"
+INSERT_HTMC_SQL = "INSERT INTO all_usgs_topos ({columns}) VALUES ({marks})"
+
+APPLIED_WRITE_SQL = "SELECT outcome, map_id, error FROM applied_writes WHERE write_id = ?"
+RECORD_APPLIED_WRITE_SQL = "INSERT INTO applied_writes (write_id, outcome, map_id, error) VALUES (?, ?, ?, ?)"
+
+# the id_sequences row that exception map IDs are allocated from
+EXCEPTION_ID_SEQUENCE = 'exception_map_id'
+
+# the kinds of writes that apply_writes knows how to do
+TOPO_WRITE = 'topo'
+EXCEPTION_WRITE = 'exception'
+
+# schema migrations, applied in order by Database.migrate(). The database's
+# PRAGMA user_version records how many of them have been applied, so each one
+# runs exactly once per database. Only ever add to the end of this list.
+# Statements can use the named parameters that migrate() is given.
+MIGRATIONS = [
+    # 1: look up maps by ID, and answer the history of maps a user has recorded
+    # (HISTORY_PAGE_SQL) straight from an index (recorded_by narrows it down,
+    # recorded_time orders it, and the remaining columns are the ones the table display needs)
+    ["CREATE INDEX IF NOT EXISTS all_usgs_topos_scan_id ON all_usgs_topos (scan_id)",
+     "CREATE INDEX IF NOT EXISTS usgs_topos_we_have_scan_id ON usgs_topos_we_have (scan_id)",
+     "CREATE INDEX IF NOT EXISTS exception_maps_we_have_map_id ON exception_maps_we_have (map_id)",
+     "CREATE INDEX IF NOT EXISTS usgs_topos_we_have_most_recent ON usgs_topos_we_have " +\
+        "(recorded_by, recorded_time, scan_id, producer, map_scale, primary_state, cell_name, " +\
+        "date_on_map, print_year, is_damaged, is_duplicate)",
+     "CREATE INDEX IF NOT EXISTS exception_maps_we_have_most_recent ON exception_maps_we_have " +\
+        "(recorded_by, recorded_time, map_id, producer, map_scale, primary_state, cell_name, " +\
+        "date_on_map, print_year, is_damaged, is_duplicate)"],
+    # 2: allocate exception map IDs from a sequence in the database instead of
+    # next_exception_id.csv. The sequence starts after both the csv's value and
+    # the highest exception map ID already recorded, whichever is higher
+    ["CREATE TABLE IF NOT EXISTS id_sequences (name TEXT PRIMARY KEY, next_id INTEGER NOT NULL)",
+     "INSERT OR IGNORE INTO id_sequences (name, next_id) " +\
+        "SELECT '" + EXCEPTION_ID_SEQUENCE + "', MAX(:exception_id_seed, COALESCE(MAX(CAST(map_id AS INTEGER)) + 1, 0)) " +\
+        "FROM exception_maps_we_have"],
+    # 3: keep track of which queued writes (see journal.py) have been applied,
+    # so that replaying them is idempotent
+    ["CREATE TABLE IF NOT EXISTS applied_writes (write_id TEXT PRIMARY KEY, outcome TEXT NOT NULL, " +\
+        "map_id TEXT, error TEXT)"],
+    # 4: fill the drop-down menus straight from all_usgs_topos (see DbCatalog in
+    # catalog.py): each menu's values are a range of this index, narrowed down by the
+    # selections above it, and the scan IDs at the bottom come along for free
+    ["CREATE INDEX IF NOT EXISTS all_usgs_topos_levels ON all_usgs_topos " +\
+        "(map_scale, primary_state, cell_name, date_on_map, print_year, scan_id)"],
+    # 5: log every map added to or taken out of the tables of maps we have, whoever
+    # does it (the tool on any workstation, bulk_record.py or DB Browser), so that
+    # the tool can keep its list of recorded maps up to date by reading just the
+    # changes since it last looked (see inventory.RecordedMaps). table_idx is the
+    # table's position in WE_HAVE_TABLES, and an update counts as a removal and an addition
+    ["CREATE TABLE IF NOT EXISTS we_have_changes (seq INTEGER PRIMARY KEY AUTOINCREMENT, " +\
+        "table_idx INTEGER NOT NULL, map_id TEXT, removed INTEGER NOT NULL)"] +\
+    ["CREATE TRIGGER IF NOT EXISTS {table}_{name}_log AFTER {event} ON {table} BEGIN {logs} END".format(
+        table=table, name=event.lower(), event=event, logs=" ".join(
+            "INSERT INTO we_have_changes (table_idx, map_id, removed) VALUES ({}, {}.{}, {});".format(
+                table_idx, row, id_name, int(row == 'OLD')) for row in rows))
+     for table_idx, (table, id_name) in enumerate(WE_HAVE_TABLES)
+     for event, rows in [('INSERT', ['NEW']), ('DELETE', ['OLD']), ('UPDATE', ['OLD', 'NEW'])]],
+]
+
+def catalog_where(path):
+    """Returns the WHERE clause and named parameters that narrow all_usgs_topos down
+    to the maps whose first len(path) CATALOG_COLUMNS match the values in path, where
+    None matches blanks (which can be NULL or '')"""
+    conditions = []
+    params = {}
+    for level, val in enumerate(path):
+        column = CATALOG_COLUMNS[level]
+        if val is None:
+            conditions.append("({0} IS NULL OR {0} = '')".format(column))
+        else:
+            conditions.append("{} = :v{}".format(column, level))
+            params['v' + str(level)] = val
+    return " AND ".join(conditions) or "1", params
+
+def numeric_affinity(declared_type:str):
+    """Returns whether sqlite stores numeric text put in a column of a given declared
+    type (e.g. 'REAL' or 'varchar(10)') as a number, following sqlite's rules for
+    column affinity: only TEXT affinity (a type with CHAR, CLOB or TEXT in it, but no
+    INT) keeps text as it's given. A column without a type keeps whatever it's given,
+    which could be a number too, so it counts as numeric."""
+    declared_type = (declared_type or '').upper()
+    if 'INT' in declared_type:
+        return True
+    return not any(name in declared_type for name in ('CHAR', 'CLOB', 'TEXT'))
+
+def default_db_path():
+    """Returns where the map inventory database lives: on the library shared drive
+    on Windows, and three folders up from the working directory elsewhere"""
+    if os.name=='posix':
+        top_path=os.path.split(os.path.dirname(os.getcwd()))[0]
+        return os.path.join(top_path,'bul_topo_map_inventory.db')
+    return '//files.brown.edu/DFS/Library_Shared/_geodata/maps/bul_topo_map_inventory.db'
+
+def read_only_uri(db_path:str):
+    """Returns a sqlite URI that opens the database at db_path read-only, so that
+    whatever reads it never takes a write lock or changes it by mistake"""
+    path = os.path.abspath(db_path).replace(os.sep, '/')
+    if path.startswith('//'): # a network share like //files.brown.edu/...
+        path = '//' + path
+    elif not path.startswith('/'): # a Windows drive like C:/...
+        path = '/' + path
+    # these are the only characters with a special meaning in the path of a sqlite URI
+    for char, escaped in [('%', '%25'), ('?', '%3f'), ('#', '%23')]:
+        path = path.replace(char, escaped)
+    return 'file:' + path + '?mode=ro'
 
 class Database:
-    def __init__(self, db):
+    def __init__(self, db, read_only=False):
         """initializing a Database object sets up a connection and a cursor for
-        querying a given .db file"""
-        self.conn = sqlite3.connect(db)
+        querying a given .db file, which can't be written to if read_only is True"""
+        if read_only:
+            self.conn = sqlite3.connect(read_only_uri(db), uri=True)
+        else:
+            self.conn = sqlite3.connect(db)
         self.cur = self.conn.cursor()
+        self.last_error = None # the sqlite error behind the most recent FAILED outcome
 
     def fetch(self, table, id_name, id_val):
         """Queries a given table for all records for a given id_name
         matching a given id_val, and returns a list of matching records."""
-        query = "SELECT * FROM {} WHERE {} = ?".format(table, id_name)
+        query = FETCH_SQL.format(table=table, id_name=id_name)
         self.cur.execute(query, (id_val,))
         rows = self.cur.fetchall()
         return rows
     
-    def fetch_most_recent(self, table, id_name, user):
-        """Method for returning table display information (column names are hard-coded) for up to 10 of the most recent
-        maps in a given table with a given ID name that were recorded by a given user.
-        """
-        cols = "producer, map_scale, primary_state, cell_name, date_on_map, print_year, is_damaged, is_duplicate, recorded_time"
-        query = "SELECT {}, {} FROM {} WHERE recorded_by = ? ORDER BY recorded_time DESC LIMIT 10".format(id_name, cols, table)
-        self.cur.execute(query, (user,))
-        rows = self.cur.fetchall()
-        return rows
+    def fetch_history_page(self, user, after=None, limit=50):
+        """Returns up to limit of the maps recorded by a given user, USGS topos and
+        exception maps together, most recent first, starting after wherever the previous
+        page left off, as a (rows, after) tuple. Each row is the map ID followed by
+        MOST_RECENT_COLS, and after is what to pass in to get the next page. Fewer than
+        limit rows means there are no more pages.
 
-    def insert_topo(self, scan_id, recorded_by, recorded_time, is_damaged, is_duplicate, producer):
-        """Inserts a record for a USGS topo map by copying over the information about that map from the all topos table.
-        Assumes the existence of both an all_usgs_topos table containing a scan_id and a usgs_topos_we_have table
-        containing all of the fields of all_usgs_topos plus five extra, whose values for a given map are passed in"""
-        self.cur.execute("INSERT INTO usgs_topos_we_have SELECT *, ?, ?, ?, ?, ? FROM all_usgs_topos WHERE scan_id = ?"
-                        , (recorded_by, recorded_time, is_damaged, is_duplicate, producer, scan_id))
-        self.conn.commit()
-
-    def insert_exception(self, exception_vals):
-        """Given a ordered set of 15 values for a given exception map, inserts those values into the exception_maps_we_have table"""
-        cols = "(map_id, producer, map_scale, primary_state, cell_name, gnis_cell_id, "+\
-            "date_on_map, print_year, sheet, series, edition, is_damaged, is_duplicate, recorded_by, recorded_time)"
-        self.cur.execute("INSERT INTO exception_maps_we_have " + cols + " VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
-                        , exception_vals)
-        self.conn.commit()
-
-    def remove(self, table, id_name, id_val):
-        """Deletes records from a given table with a given ID name matching a given ID value"""
-        query = "DELETE FROM {} WHERE {} = ?".format(table, id_name)
-        self.cur.execute(query, (id_val,))
-        self.conn.commit()
+        after: None for the first page, or the after from the previous page, which is
+        the (recorded_time, map ID) of the last map shown from each of WE_HAVE_TABLES
+        (or None for a table none of whose maps have been shown yet)"""
+        after = list(after or [None] * len(WE_HAVE_TABLES))
+        params = {'user': user, 'limit': limit}
+        fragments = {}
+        for idx, (table, id_name) in enumerate(WE_HAVE_TABLES):
+            fragments['after' + str(idx)] = ''
+            if after[idx] is not None:
+                fragments['after' + str(idx)] = HISTORY_AFTER_SQL.format(table=table, id_name=id_name)
+                params[table + '_time'], params[table + '_id'] = after[idx]
+        self.cur.execute(HISTORY_PAGE_SQL.format(**fragments), params)
+        rows = []
+        for row in self.cur.fetchall():
+            # the rows come most recent first, so each table's last row is where it left off
+            after[row[-1]] = (row[-2], row[0])
+            rows.append(row[:-1])
+        return rows, tuple(after)
+
+    def insert_topo_if_absent(self, scan_id, recorded_by, recorded_time, is_damaged, is_duplicate, producer):
+        """Inserts a record for a USGS topo map by copying over the information about that
+        map from all_usgs_topos, followed by the five extra columns of usgs_topos_we_have,
+        whose values are passed in, unless usgs_topos_we_have already has a record for
+        the given scan_id, all in a single transaction. Returns INSERTED if the record
+        was added, ALREADY_PRESENT if the map had already been recorded, or FAILED if
+        the scan ID isn't in all_usgs_topos or the database couldn't be written to
+        (e.g. because it's locked), in which case the error is kept in last_error."""
+        return self._in_transaction(lambda: self._insert_topo(scan_id, recorded_by, recorded_time,
+                                                              is_damaged, is_duplicate, producer))
+
+    def _insert_topo(self, scan_id, recorded_by, recorded_time, is_damaged, is_duplicate, producer):
+        """the statements behind insert_topo_if_absent, without the transaction around them"""
+        self.cur.execute(INSERT_TOPO_IF_ABSENT_SQL
+                        , (recorded_by, recorded_time, is_damaged, is_duplicate, producer, scan_id, scan_id))
+        if self.cur.rowcount > 0:
+            return INSERTED
+        # nothing was inserted, either because the map was already recorded
+        # or because there's no such map, and we're still inside the transaction
+        self.cur.execute(TOPO_RECORDED_SQL, (scan_id,))
+        if self.cur.fetchone() is not None:
+            return ALREADY_PRESENT
+        self.last_error = "scan ID {} is not in all_usgs_topos".format(scan_id)
+        return FAILED
+
+    def insert_topos_if_absent(self, records):
+        """Does what insert_topo_if_absent does for a whole batch of maps, in a single
+        transaction. Returns a list with an (outcome, error) tuple for each record, in
+        order, where error explains a FAILED outcome (e.g. a scan ID that isn't in
+        all_usgs_topos) and is None otherwise. A record that fails doesn't hold up the
+        rest of the batch. Returns FAILED instead if the batch couldn't be written at
+        all (e.g. because the database is locked), in which case none of it was
+        written and the error is kept in last_error.
+
+        records: a list of (scan_id, recorded_by, recorded_time, is_damaged, is_duplicate,
+        producer) tuples, the arguments of insert_topo_if_absent"""
+        results = []
+        def insert():
+            for record in records:
+                self.last_error = None
+                outcome = self._insert_topo(*record)
+                results.append((outcome, self.last_error if outcome == FAILED else None))
+            return INSERTED
+        if self._in_transaction(insert) == FAILED:
+            return FAILED
+        return results
+
+    def insert_exception_with_new_id(self, exception_vals):
+        """Allocates the next exception map ID from the database's sequence and inserts
+        the exception map under that ID, in a single transaction. Since the sequence is
+        bumped first, the database stays write-locked until the insert is committed, so
+        two people recording exceptions at the same time can never get the same ID,
+        and an ID is only used up if the map is actually recorded.
+        Returns an (outcome, map_id) tuple, where outcome is INSERTED or FAILED (see
+        insert_topo_if_absent), and map_id is the new ID as a string, or None.
+
+        exception_vals: the 14 values that follow map_id in exception_maps_we_have
+        (producer through recorded_time)"""
+        result = []
+        def insert():
+            result.extend(self._insert_new_exception(exception_vals))
+            return result[0]
+        outcome = self._in_transaction(insert)
+        return outcome, (result[1] if outcome == INSERTED else None)
+
+    def _insert_new_exception(self, exception_vals):
+        """the statements behind insert_exception_with_new_id, without the transaction around them"""
+        self.cur.execute(NEXT_ID_SQL, (EXCEPTION_ID_SEQUENCE,))
+        if self.cur.rowcount == 0:
+            self.last_error = "exception map IDs have not been set up in the database yet (see Database.migrate)"
+            return FAILED, None
+        self.cur.execute(ALLOCATED_ID_SQL, (EXCEPTION_ID_SEQUENCE,))
+        new_id = str(self.cur.fetchone()[0])
+        self.cur.execute(INSERT_EXCEPTION_IF_ABSENT_SQL, (new_id,) + tuple(exception_vals) + (new_id,))
+        if self.cur.rowcount == 0:
+            self.last_error = "exception map ID {} is already in use".format(new_id)
+            return FAILED, None
+        return INSERTED, new_id
+
+    def apply_writes(self, writes):
+        """Applies a batch of queued writes (see journal.py) in a single transaction, and
+        makes doing so idempotent: each write's ID is recorded in the applied_writes
+        table in the same transaction as the write itself, so a write that was already
+        applied (e.g. before a crash, or by another copy of the tool) is skipped and
+        its original outcome reported instead. A write that can't be done, like a scan
+        ID that isn't in all_usgs_topos, is recorded as FAILED without holding up the
+        rest of the batch. The log of changes to the maps we have is pruned to its most
+        recent CHANGES_KEPT changes in the same transaction.
+        Returns a list of (write ID, outcome, map ID, error) tuples, one per write, or
+        FAILED if the batch couldn't be applied at all (e.g. the database is locked),
+        in which case none of it was applied and the error is kept in last_error.
+
+        writes: a list of (write ID, kind, values) tuples, where kind is TOPO_WRITE
+        (values are the arguments of insert_topo_if_absent) or EXCEPTION_WRITE (values
+        are the argument of insert_exception_with_new_id)"""
+        results = []
+        def apply():
+            # take the write lock up front, so that nobody else can apply the same
+            # writes between our check of applied_writes and our inserts
+            self.cur.execute("BEGIN IMMEDIATE")
+            for write_id, kind, values in writes:
+                self.cur.execute(APPLIED_WRITE_SQL, (write_id,))
+                applied = self.cur.fetchone()
+                if applied is not None:
+                    results.append((write_id,) + tuple(applied))
+                    continue
+                self.last_error = None
+                if kind == TOPO_WRITE:
+                    outcome = self._insert_topo(*values)
+                    map_id = values[0]
+                else:
+                    outcome, map_id = self._insert_new_exception(values)
+                error = self.last_error if outcome == FAILED else None
+                self.cur.execute(RECORD_APPLIED_WRITE_SQL, (write_id, outcome, map_id, error))
+                results.append((write_id, outcome, map_id, error))
+            self.cur.execute(PRUNE_CHANGES_SQL, (CHANGES_KEPT,))
+            return INSERTED
+        if self._in_transaction(apply) == FAILED:
+            return FAILED
+        return results
+
+    def catalog_values(self, path):
+        """Returns the distinct values of the drop-down menu after the given selections,
+        in no particular order: the values of CATALOG_COLUMNS[len(path)] among the maps
+        in all_usgs_topos whose first len(path) CATALOG_COLUMNS match path. Blanks are
+        returned as None, and a None in path matches blanks.
+
+        path: a list of the values selected so far, from map scale down"""
+        where, params = catalog_where(path)
+        sql = CATALOG_VALUES_SKIP_SQL if len(path) < CATALOG_SKIP_SCAN_LEVELS else CATALOG_VALUES_SQL
+        self.cur.execute(sql.format(column=CATALOG_COLUMNS[len(path)], where=where), params)
+        return [None if val in (None, '') else str(val) for (val,) in self.cur.fetchall()]
+
+    def catalog_maps(self, path):
+        """returns the (scan ID, product URL) tuples of the maps in all_usgs_topos with a
+        given (map scale, primary state, cell name, map year, print year), where None
+        matches blanks (see catalog_values)"""
+        where, params = catalog_where(path)
+        self.cur.execute(CATALOG_MAPS_SQL.format(where=where), params)
+        return [(str(scan_id), url) for scan_id, url in self.cur.fetchall()]
+
+    def catalog_find(self, scan_id):
+        """returns the (map scale, primary state, cell name, map year, print year, scan ID,
+        product URL) of the map in all_usgs_topos with a given scan ID, or None"""
+        self.cur.execute(CATALOG_FIND_SQL, (scan_id,))
+        return self.cur.fetchone()
+
+    def htmc_columns(self):
+        """returns the names of the columns of all_usgs_topos, in order"""
+        return [row[1] for row in self.conn.execute("PRAGMA table_info(all_usgs_topos)")]
+
+    def numeric_columns(self, table):
+        """returns a list with, for each column of a given table in order, whether sqlite
+        stores numbers in it (see numeric_affinity)"""
+        return [numeric_affinity(row[2]) for row in self.conn.execute("PRAGMA table_info({})".format(table))]
+
+    def iter_table(self, table, columns=None):
+        """Yields every row of a given table (just the given columns, if any), reading
+        them from the database as they're needed rather than all at once"""
+        return self.conn.execute("SELECT {} FROM {}".format(", ".join(columns) if columns else "*", table))
+
+    def stream_table(self, table, batch_rows=1000):
+        """Returns the column names of a given table and an iterator over its rows, which
+        are fetched from the database batch_rows at a time, so that however big the table
+        is, only one batch of it is in memory at once"""
+        cur = self.conn.execute("SELECT * FROM " + table)
+        def rows():
+            while True:
+                batch = cur.fetchmany(batch_rows)
+                if not batch:
+                    return
+                yield from batch
+        return [description[0] for description in cur.description], rows()
+
+    def coverage_stats(self):
+        """Returns a row of COVERAGE_COLUMNS for each map scale and state in all_usgs_topos,
+        and a (count, damaged, duplicates) tuple for the exception maps we have"""
+        rows = self.conn.execute(COVERAGE_SQL).fetchall()
+        return rows, self.conn.execute(EXCEPTION_COVERAGE_SQL).fetchone()
+
+    def data_version(self):
+        """Returns a number that changes whenever another connection (on this computer or
+        any other) commits a change to the database, without reading anything but the
+        database header. Changes made through this connection don't change it."""
+        return self.conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def recorded_maps(self):
+        """Returns the maps we have as a (seq, scan IDs, exception maps) tuple, all read
+        in the same transaction: the latest seq in the we_have_changes log (see
+        recorded_changes), or None if the database doesn't have the log yet (see
+        MIGRATIONS), a list of the scan ID of every USGS topo, and a list of the map ID
+        followed by EXCEPTION_KEY_COLS of every exception map"""
+        self.cur.execute("BEGIN")
+        try:
+            seq = None
+            if self.cur.execute(HAS_CHANGES_LOG_SQL).fetchone():
+                seq = self.cur.execute(RECORDED_SEQ_SQL).fetchone()[0]
+            scan_ids = [scan_id for (scan_id,) in self.cur.execute(RECORDED_TOPOS_SQL)]
+            exceptions = self.cur.execute(RECORDED_EXCEPTIONS_SQL).fetchall()
+        finally:
+            self.conn.rollback() # nothing was written, this just ends the transaction
+        return seq, scan_ids, exceptions
+
+    def recorded_changes(self, after_seq):
+        """Returns every change to the tables of maps we have that was logged after
+        after_seq, oldest first, as (seq, table index, map ID, removed) tuples followed by
+        the EXCEPTION_KEY_COLS of added exception maps (None for everything else).
+        table index is the table's position in WE_HAVE_TABLES"""
+        return self.conn.execute(RECORDED_CHANGES_SQL, (after_seq,)).fetchall()
+
+    def replace_htmc_rows(self, columns, rows, removed_ids):
+        """In a single transaction, deletes the all_usgs_topos rows with the given scan
+        IDs, and replaces the rows with the scan IDs of the given rows (or adds them,
+        if there aren't any yet). Returns INSERTED, or FAILED if the database couldn't
+        be written to, in which case nothing was changed and the error is kept in last_error.
+
+        columns: the columns of all_usgs_topos that the values of each row are for, in
+        order, including scan_id
+        rows: a list of tuples of values
+        removed_ids: a list of scan IDs"""
+        scan_col = columns.index('scan_id')
+        insert_sql = INSERT_HTMC_SQL.format(columns=", ".join(columns), marks=", ".join("?" * len(columns)))
+        def replace():
+            self.cur.execute("BEGIN IMMEDIATE")
+            self.cur.executemany(REMOVE_HTMC_SQL, [(scan_id,) for scan_id in removed_ids])
+            self.cur.executemany(REMOVE_HTMC_SQL, [(row[scan_col],) for row in rows])
+            self.cur.executemany(insert_sql, rows)
+            return INSERTED
+        return self._in_transaction(replace)
+
+    def remove_if_present(self, table, id_name, id_val):
+        """Deletes records from a given table with a given ID name matching a given ID
+        value in a single transaction. Returns REMOVED if any records were deleted,
+        ALREADY_ABSENT if there weren't any to delete, or FAILED if the database couldn't
+        be written to, in which case the error is kept in last_error."""
+        def delete():
+            query = REMOVE_SQL.format(table=table, id_name=id_name)
+            self.cur.execute(query, (id_val,))
+            return REMOVED if self.cur.rowcount > 0 else ALREADY_ABSENT
+        return self._in_transaction(delete)
+
+    def _in_transaction(self, statements):
+        """Runs a function that executes some statements as one transaction, which is
+        committed if it returns anything but FAILED and rolled back otherwise. Returns
+        whatever the function returns, or FAILED if sqlite raises an error."""
+        self.last_error = None
+        try:
+            outcome = statements()
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            self.last_error = str(e)
+            return FAILED
+        if outcome == FAILED:
+            self.conn.rollback()
+            return FAILED
+        try:
+            self.conn.commit()
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            self.last_error = str(e)
+            return FAILED
+        return outcome
+
+    def schema_version(self):
+        """returns how many of the MIGRATIONS have been applied to the database"""
+        return self.conn.execute("PRAGMA user_version").fetchone()[0]
+
+    def migrate(self, exception_id_seed=0):
+        """Applies whichever MIGRATIONS the database doesn't have yet, each one in its
+        own transaction together with the bump of the schema version, so a migration
+        is never half-applied. If the database can't be written to right now (e.g.
+        it's locked), the error is kept in last_error and the remaining migrations
+        are left for next time. Returns the schema version the database ends up at.
+
+        exception_id_seed: the next exception map ID from before they were allocated
+        by the database (i.e. the number in next_exception_id.csv), which is only
+        used when the exception map ID sequence is first set up"""
+        params = {'exception_id_seed': int(exception_id_seed)}
+        self.last_error = None
+        version = self.schema_version()
+        while version < len(MIGRATIONS):
+            try:
+                self.cur.execute("BEGIN IMMEDIATE")
+                # another workstation may have applied it while we waited for the lock
+                if self.schema_version() == version:
+                    for statement in MIGRATIONS[version]:
+                        self.cur.execute(statement, params)
+                    self.cur.execute("PRAGMA user_version = {}".format(version + 1))
+                self.conn.commit()
+            except sqlite3.Error as e:
+                self.conn.rollback()
+                self.last_error = str(e)
+                break
+            version = self.schema_version()
+        return version
+
+    def tool_queries(self):
+        """Returns a (description, sql, parameters) tuple for every query the tool
+        issues, with placeholder parameters, for check_query_plans()"""
+        queries = [("insert a USGS topo", INSERT_TOPO_IF_ABSENT_SQL, (None,) * 7),
+                   ("a page of the history of maps in both tables",
+                    HISTORY_PAGE_SQL.format(**{'after' + str(idx): HISTORY_AFTER_SQL.format(table=table, id_name=id_name)
+                                               for idx, (table, id_name) in enumerate(WE_HAVE_TABLES)}),
+                    dict({'user': None, 'limit': 50}, **{table + suffix: None for table, _ in WE_HAVE_TABLES
+                                                         for suffix in ('_time', '_id')})),
+                   ("check whether a USGS topo is recorded", TOPO_RECORDED_SQL, (None,)),
+                   ("insert an exception map", INSERT_EXCEPTION_IF_ABSENT_SQL, (None,) * 16),
+                   ("allocate an exception map ID", NEXT_ID_SQL, (None,)),
+                   ("read the allocated exception map ID", ALLOCATED_ID_SQL, (None,)),
+                   ("check whether a queued write was applied", APPLIED_WRITE_SQL, (None,)),
+                   ("record that a queued write was applied", RECORD_APPLIED_WRITE_SQL, (None,) * 4),
+                   ("remove a map from all_usgs_topos", REMOVE_HTMC_SQL, (None,)),
+                   ("find a map in all_usgs_topos", CATALOG_FIND_SQL, (None,)),
+                   ("changes to the maps we have", RECORDED_CHANGES_SQL, (None,)),
+                   ("prune the log of changes to the maps we have", PRUNE_CHANGES_SQL, (None,))]
+        for level in range(len(CATALOG_COLUMNS)):
+            where, params = catalog_where(['x'] * level)
+            sql = CATALOG_VALUES_SKIP_SQL if level < CATALOG_SKIP_SCAN_LEVELS else CATALOG_VALUES_SQL
+            queries.append(("values of the " + CATALOG_COLUMNS[level] + " menu",
+                            sql.format(column=CATALOG_COLUMNS[level], where=where), params))
+        where, params = catalog_where(['x'] * len(CATALOG_COLUMNS))
+        queries.append(("maps at the bottom of the menus", CATALOG_MAPS_SQL.format(where=where), params))
+        for table, id_name in WE_HAVE_TABLES:
+            queries.extend([
+                ("fetch from " + table, FETCH_SQL.format(table=table, id_name=id_name), (None,)),
+                ("remove from " + table, REMOVE_SQL.format(table=table, id_name=id_name), (None,))])
+        return queries
+
+    def check_query_plans(self):
+        """Runs EXPLAIN QUERY PLAN on every query the tool issues (see tool_queries)
+        and returns a list of (description, plan step) tuples for each step that
+        scans a whole table or index, or sorts rows in a temporary b-tree, rather than
+        looking them up in an index. An empty list means every query is index-backed."""
+        problems = []
+        for description, sql, params in self.tool_queries():
+            self.cur.execute("EXPLAIN QUERY PLAN " + sql, params)
+            for row in self.cur.fetchall():
+                detail = row[-1]
+                # reading back the rows of a WITH clause (distinct_vals) is a scan, but not of a table
+                if (detail.startswith('SCAN') and 'CONSTANT ROW' not in detail and detail != 'SCAN distinct_vals') \
+                        or 'TEMP B-TREE' in detail:
+                    problems.append((description, detail))
+        return problems
 
     def __del__(self):
         """Close the connection to the db file when the Database object stops running"""
-        self.conn.close()
\ No newline at end of file
+        self.conn.close()
+
+if __name__ == '__main__':
+    # python db.py [--migrate] [path/to/bul_topo_map_inventory.db]
+    # reports any of the tool's queries that would scan a table instead of using an index
+    import argparse
+    parser = argparse.ArgumentParser(description="Check how sqlite runs the queries the tool issues.")
+    parser.add_argument('db_path', nargs='?', default=default_db_path())
+    parser.add_argument('--migrate', action='store_true', help="apply any missing schema migrations first")
+    parser.add_argument('--exception-id-seed', type=int, default=0, help="see Database.migrate")
+    args = parser.parse_args()
+
+    database = Database(args.db_path)
+    if args.migrate:
+        database.migrate(args.exception_id_seed)
+        if database.last_error:
+            print("Could not apply migrations:", database.last_error)
+    print("schema version {} of {}".format(database.schema_version(), len(MIGRATIONS)))
+    problems = database.check_query_plans()
+    for description, detail in problems:
+        print("{}: {}".format(description, detail))
+    if not problems:
+        print("every query is backed by an index")
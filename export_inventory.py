@@ -0,0 +1,73 @@
+# Ethan McIntosh - GIS and Data Services - Brown University - October 2026
+
+# Exports the maps we've inventoried, and how much of the HTMC they cover, without
+# opening the map database in DB Browser (which locks the tool out of it):
+#
+#   python export_inventory.py [--out inventory_export] [--format csv] [--db path/to/bul_topo_map_inventory.db]
+#
+# This writes three files to the --out folder:
+#   usgs_topos_we_have.csv and exception_maps_we_have.csv: every row of those tables
+#   coverage.csv: for each map scale and state, how many maps the HTMC has, how many
+#       of them we have, and how many of ours are damaged or duplicated
+#
+# and prints the overall totals. With --format json the two tables are written as json
+# lists instead (coverage.csv stays a csv, since it's small and meant for a spreadsheet).
+#
+# The database is opened read-only, so the export never takes a write lock and can
+# run while people are recording maps. The tables are read and written a batch of
+# rows at a time, so the export uses about the same memory however big they get.
+
+import argparse, os, sys, time
+import file_io, db # import the other files in this package
+
+# how many rows of a table are fetched from the database at a time
+EXPORT_BATCH_ROWS = 1000
+
+def export_tables(map_db, out_dir:str, fmt:str='csv'):
+    """Writes each of the tables of maps we have to its own file in out_dir, and returns
+    a list of (file path, row count) tuples
+
+    map_db: a db.Database, which can be opened read-only
+    fmt: 'csv' or 'json'"""
+    write = file_io.write_table_json if fmt == 'json' else file_io.write_table_csv
+    written = []
+    for table, _ in db.WE_HAVE_TABLES:
+        filepath = os.path.join(out_dir, table + '.' + fmt)
+        columns, rows = map_db.stream_table(table, EXPORT_BATCH_ROWS)
+        written.append((filepath, write(filepath, columns, rows)))
+    return written
+
+def export_coverage(map_db, out_dir:str):
+    """Writes coverage.csv to out_dir (see Database.coverage_stats) and returns a
+    dictionary of the totals across every map scale and state"""
+    rows, (exceptions, exceptions_damaged, exceptions_duplicates) = map_db.coverage_stats()
+    file_io.write_table_csv(os.path.join(out_dir, 'coverage.csv'), db.COVERAGE_COLUMNS, rows)
+    totals = {'maps_in_htmc': sum(row[2] for row in rows), 'maps_we_have': sum(row[3] for row in rows),
+              'damaged': sum(row[5] for row in rows), 'duplicates': sum(row[6] for row in rows),
+              'exceptions': exceptions, 'exceptions_damaged': exceptions_damaged,
+              'exceptions_duplicates': exceptions_duplicates}
+    return totals
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Export the maps we have and the HTMC coverage statistics.")
+    parser.add_argument('--out', default='inventory_export', help="the folder to write to (default: %(default)s)")
+    parser.add_argument('--format', choices=['csv', 'json'], default='csv', help="how to write the tables of maps we have")
+    parser.add_argument('--db', default=db.default_db_path(), help="the map database")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        sys.exit("There is no map database at " + args.db)
+    os.makedirs(args.out, exist_ok=True)
+    start = time.perf_counter()
+    map_db = db.Database(args.db, read_only=True)
+    for filepath, count in export_tables(map_db, args.out, args.format):
+        print("Wrote {:,} maps to {}".format(count, filepath))
+    totals = export_coverage(map_db, args.out)
+    print("Wrote coverage statistics to {}".format(os.path.join(args.out, 'coverage.csv')))
+    print("\nWe have {:,} of the HTMC's {:,} maps ({:.1f}%): {:,} damaged and {:,} with duplicates".format(
+        totals['maps_we_have'], totals['maps_in_htmc'],
+        100 * totals['maps_we_have'] / totals['maps_in_htmc'] if totals['maps_in_htmc'] else 0,
+        totals['damaged'], totals['duplicates']))
+    print("plus {:,} exception maps: {:,} damaged and {:,} with duplicates".format(
+        totals['exceptions'], totals['exceptions_damaged'], totals['exceptions_duplicates']))
+    print("Done in {:.2f} s".format(time.perf_counter() - start))
@@ -1,7 +1,40 @@
 # Ethan McIntosh - GIS and Data Services - Brown University Library - August 2022
 
-import pandas as pd
-import csv
+import csv, hashlib, json, mmap, os, pickle, sys, threading
+from array import array
+from catalog import LEVELS, Catalog, CatalogBuilder, StringColumn
+
+# the GNIS cell index from read_gnis is built at most once per csv version per
+# process and shared by every caller of get_gnis_cells (see below)
+_gnis_lock = threading.Lock()
+_gnis_cells = {}
+
+# bump this whenever the structure that read_htmc builds changes, so that
+# caches written by an older version of the tool get rebuilt instead of loaded
+TOPOS_CACHE_VERSION = 6
+
+# the csv is read in chunks of this many rows, so that memory use while loading
+# doesn't grow with the size of the csv
+CHUNK_ROWS = 20000
+
+# a columnar file (see write_columnar) starts with these bytes, and its header says
+# which version of the layout it has, which is bumped whenever the layout changes
+COLUMNAR_MAGIC = b'HTMCCOL1'
+COLUMNAR_VERSION = 1
+
+# the columns of the csv that the map catalog and the GNIS cell index are built from,
+# in the order that each row's values get unpacked
+TOPO_COLUMNS = ['scan_id', 'product_url'] + list(LEVELS)
+GNIS_COLUMNS = ['gnis_cell_id', 'cell_name', 'primary_state', 'cell_type', 'map_scale']
+
+# some territories have no standard maps, but need them to appear in
+# exceptions dropdown menu, so they get (gnis, cell, state, cell type, scale)
+# placeholder rows in the GNIS cell index
+TERRITORY_ROWS = [('', '', 'American Samoa', '', '24000'),
+                  ('', '', 'Guam', '', '24000'),
+                  ('', '', 'Federated States of Micronesia', '', '25000'),
+                  ('', '', 'Northern Mariana Islands', '', '25000'),
+                  ('', '', 'Republic of Palau', '', '25000')]
 
 def read_next_exception_id(filepath):
     """Reads and returns the value in the first row and first column of a given
@@ -14,17 +47,6 @@ def read_next_exception_id(filepath):
         for row in reader:
             return row[0]
 
-def write_next_exception_id(filepath, next_exc_id):
-    """Writes a given next exception map ID into the first row and first column
-    of a given csv file, replacing what was there before.
-    
-    next_exc_id: the next available exception map ID
-    filepath: a csv file storing the next available exception map ID in its first 
-    row and first column"""
-    with open(filepath, 'w', newline='') as f:
-        writer = csv.writer(f, delimiter='\n')
-        writer.writerow([next_exc_id])
-
 def read_users(filepath:str):
     """reads a csv file with a single column listing map inventory application 
     users and returns the values as a list
@@ -37,6 +59,95 @@ def read_users(filepath:str):
             users.append(row[0])
     return users
 
+def read_bulk_rows(filepath:str, columns:list):
+    """reads a csv file of maps to record in bulk (see bulk_record.py) and returns
+    a list of (line number, row) tuples, where each row is a dictionary with the
+    given columns as keys and whitespace-trimmed strings as values. The csv's
+    first line must be a header naming (at least) the given columns.
+
+    filepath: a csv file with one map per line
+    columns: the column names to read"""
+    rows = []
+    with open(filepath, 'r', newline='', encoding='utf-8-sig') as f:
+        reader = csv.DictReader(f)
+        missing = [col for col in columns if col not in (reader.fieldnames or [])]
+        if missing:
+            raise ValueError("{} is missing the column(s) {}".format(filepath, ", ".join(missing)))
+        for row in reader:
+            rows.append((reader.line_num, {col: (row[col] or '').strip() for col in columns}))
+    return rows
+
+def write_bulk_report(filepath:str, columns:list, rows:list):
+    """writes the rows of a bulk recording csv that couldn't be recorded, with the
+    reason why, to a csv file for follow-up
+
+    filepath: the csv file to write
+    columns: the column names of the rows
+    rows: a list of (line number, row, problem, candidates) tuples, where row is a
+    dictionary like the ones from read_bulk_rows and candidates is a string listing
+    the maps that the row could be (or '')"""
+    with open(filepath, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['line'] + columns + ['problem', 'candidates'])
+        for line_num, row, problem, candidates in rows:
+            writer.writerow([line_num] + [row[col] for col in columns] + [problem, candidates])
+
+def read_htmc_rows(filepath:str, columns:list):
+    """Streams the rows of a csv table of all USGS topographic maps (like a new
+    version of usgs_topos.csv, see refresh_htmc.py) one at a time, as tuples of the
+    given columns' values. Values are strings exactly as they are in the csv, with
+    '' for blanks. Raises ValueError if the csv is missing any of the columns.
+
+    filepath: csv table of all USGS topographic maps that were ever made
+    columns: the column names to read, in the order they go in each tuple"""
+    with open(filepath, 'r', newline='', encoding='utf-8-sig') as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        missing = [col for col in columns if col not in header]
+        if missing:
+            raise ValueError("{} is missing the column(s) {}".format(filepath, ", ".join(missing)))
+        positions = [header.index(col) for col in columns]
+        for row in reader:
+            yield tuple(row[pos] for pos in positions)
+
+def write_refresh_report(filepath:str, rows:list):
+    """writes the maps we've inventoried whose HTMC records changed or disappeared in
+    a refresh (see refresh_htmc.py) to a csv file, one line per changed attribute
+
+    filepath: the csv file to write
+    rows: a list of (scan ID, recorded by, recorded time, change, column, value we
+    recorded, new value) tuples"""
+    with open(filepath, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['scan_id', 'recorded_by', 'recorded_time', 'change', 'column', 'recorded_value', 'new_value'])
+        writer.writerows(rows)
+
+def write_table_csv(filepath:str, columns:list, rows):
+    """writes rows of a table to a csv file one at a time, so that rows can be an
+    iterator over a table that's too big to hold in memory (see Database.stream_table).
+    Returns how many rows were written"""
+    count = 0
+    with open(filepath, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    return count
+
+def write_table_json(filepath:str, columns:list, rows):
+    """does what write_table_csv does, but writes a json list with an object for each
+    row, keyed by column name"""
+    count = 0
+    with open(filepath, 'w', encoding='utf-8') as f:
+        f.write('[')
+        for row in rows:
+            f.write(',\n ' if count else '\n ')
+            json.dump(dict(zip(columns, row)), f)
+            count += 1
+        f.write('\n]\n')
+    return count
+
 def read_gnis(filepath:str, cells:dict):
     """Reads tabular-format data on topographic maps from the csv table of all USGS
     topographic maps that were ever made into a nested dictionary structure, 
@@ -49,42 +160,73 @@ def read_gnis(filepath:str, cells:dict):
     
     filepath: csv table of all USGS topographic maps that were ever made
     cells: a (usually empty) dict in which to populate the nested dictionary structure"""
+    seen = set()
+    for chunk in _read_chunks(filepath, GNIS_COLUMNS):
+        for row in chunk.itertuples(index=False, name=None):
+            _add_gnis_row(cells, seen, row)
+    for row in TERRITORY_ROWS:
+        _add_gnis_row(cells, None, row)
 
-    # these are the column names corresponding to the lookup parameters
-    columns = ['gnis_cell_id', 'cell_name', 'primary_state', 'cell_type', 'map_scale']
+def _add_gnis_row(cells:dict, seen:set, row:tuple):
+    """Adds one (gnis, cell, state, cell type, scale) row of the csv to the GNIS cell
+    index, skipping rows that aren't standard maps and rows we've already seen.
+    seen can be None to add the row unconditionally."""
+    # unpack values of each row (i.e. each map) into named variables
+    gnis, quad, state, cell_type, scale = row
 
-    # read csv into df, selecting specified columns, stringifying everything, dropping duplicates
-    topo_df = pd.read_csv(filepath, usecols=columns, dtype=str).drop_duplicates()
+    if seen is not None:
+        # only consider standard maps - not oversized or undersized maps.  This step
+        # makes it so that GNIS cell IDs are unique to each scale / state / cell name combination
+        if not isinstance(cell_type, str) or not cell_type.startswith('Standard'):
+            return
+        if row in seen: # drop duplicate rows
+            return
+        seen.add(row)
 
-    # only consider standard maps - not oversized or undersized maps.  This step
-    # makes it so that GNIS cell IDs are unique to each scale / state / cell name combination
-    topo_df = topo_df[[x.startswith('Standard') for x in topo_df.cell_type]]
-    
-    # some territories have no standard maps, but need them to appear in
-    # exceptions dropdown menu
-    ttory=pd.DataFrame(
-        [['','','American Samoa','','24000'],
-          ['','','Guam','','24000'],
-          ['','','Federated States of Micronesia','','25000'],
-          ['','','Northern Mariana Islands','','25000'],
-          ['','','Republic of Palau','','25000']],
-          index=[1,2,3,4,5],
-          columns=columns)
-    topo_df=pd.concat([topo_df,ttory])
+    # initialize nested dictionary structure as needed
+    if state not in cells:
+        cells[state] = {}
+    if quad not in cells[state]:
+        cells[state][quad] = []
     
-    topos = topo_df.values.tolist()
-    for topo in topos:
-        # unpack values of each row (i.e. each map) into named variables
-        gnis, quad, state, cell_type, scale = topo
-
-        # initialize nested dictionary structure as needed
-        if state not in cells:
-            cells[state] = {}
-        if quad not in cells[state]:
-            cells[state][quad] = []
-        
-        # populate values for each row
-        cells[state][quad].append((scale, gnis))
+    # populate values for each row
+    cells[state][quad].append((scale, gnis))
+
+def get_gnis_cells(filepath:str):
+    """Returns the nested dictionary of GNIS cell IDs that read_gnis builds, reading
+    the csv only the first time it's asked for. Later calls (e.g. every time the
+    exception window opens) get back the same dictionary, unless the csv's size or
+    modification time has changed since it was read, in which case it is re-read.
+    read_htmc_cached also hands its GNIS cell index over to this, so after startup
+    the csv normally doesn't need to be read again at all.
+    Callers must treat the returned dictionary as read-only, since it is shared.
+    This is safe to call from a background thread to build the index ahead of time;
+    a call made while the index is being built waits for it instead of re-reading.
+
+    filepath: csv table of all USGS topographic maps that were ever made"""
+    signature = _file_signature(filepath)
+    key = os.path.abspath(filepath)
+    with _gnis_lock:
+        cached = _gnis_cells.get(key)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+        if is_columnar(filepath):
+            cells = _read_columnar(filepath)[1]
+        else:
+            cells = {}
+            read_gnis(filepath, cells)
+        _gnis_cells[key] = (signature, cells)
+        return cells
+
+def _share_gnis_cells(filepath:str, signature:tuple, cells:dict):
+    """Hands a GNIS cell index that was built from a given version of the csv over to get_gnis_cells"""
+    with _gnis_lock:
+        _gnis_cells[os.path.abspath(filepath)] = (signature, cells)
+
+def _file_signature(filepath:str):
+    """returns a file's (size, modification time), which changes whenever it's replaced"""
+    stat = os.stat(filepath)
+    return stat.st_size, stat.st_mtime_ns
 
 def read_topos(filepath:str, maps:dict):
     """
@@ -99,36 +241,331 @@ def read_topos(filepath:str, maps:dict):
     structure of data is useful for quickly filtering down the database of maps 
     upon each mouse selection of attributes, and also facilitates fast lookup of
     scan IDs and product URLs when recording USGS topo maps.
+    The tool itself uses the more compact Catalog from read_htmc instead.
     
     filepath: csv table of all USGS topographic maps that were ever made
     maps: a (usually empty) dict in which to populate the nested dictionary structure"""
-    # these are the column names corresponding to the lookup parameters
-    columns = ['scan_id', 'cell_name', 'primary_state', 'map_scale', 
-                'date_on_map', 'print_year', 'product_url']
-
-    # read csv into df, selecting specified columns and stringifying everything
-    # also fills in any missing values with the string "(none)" so that dropdown
-    # menus for the data have a (none) option instead of just a blank option
-    # option instead of just a blank option
-    topo_df = pd.read_csv(filepath, usecols=columns, dtype=str).fillna("(none)")
-
-    topos = topo_df.values.tolist()
-    for topo in topos:
-        # unpack values of list into variables
-        id, quad, state, scale, map_year, print_year, url = topo
-
-        # initialize nested dictionary structure as needed
-        if scale not in maps:
-            maps[scale] = {}
-        if state not in maps[scale]:
-            maps[scale][state] = {}
-        if quad not in maps[scale][state]:
-            maps[scale][state][quad] = {}
-        if map_year not in maps[scale][state][quad]:
-            maps[scale][state][quad][map_year] = {}
-        if print_year not in maps[scale][state][quad][map_year]:
-            # initialize empty list for the (id, url) of each matching map
-            maps[scale][state][quad][map_year][print_year] = []
-        
-        # populate values for each row
-        maps[scale][state][quad][map_year][print_year].append((id, url))
\ No newline at end of file
+    for chunk in _read_chunks(filepath, TOPO_COLUMNS):
+        # fill in any missing values with the string "(none)" so that dropdown
+        # menus for the data have a (none) option instead of just a blank option
+        for topo in chunk.fillna("(none)").itertuples(index=False, name=None):
+            # unpack values of each row into variables
+            id, url, scale, state, quad, map_year, print_year = topo
+
+            # initialize nested dictionary structure as needed
+            if scale not in maps:
+                maps[scale] = {}
+            if state not in maps[scale]:
+                maps[scale][state] = {}
+            if quad not in maps[scale][state]:
+                maps[scale][state][quad] = {}
+            if map_year not in maps[scale][state][quad]:
+                maps[scale][state][quad][map_year] = {}
+            if print_year not in maps[scale][state][quad][map_year]:
+                # initialize empty list for the (id, url) of each matching map
+                maps[scale][state][quad][map_year][print_year] = []
+            
+            # populate values for each row
+            maps[scale][state][quad][map_year][print_year].append((id, url))
+
+def read_catalog(filepath:str):
+    """Reads the same columns of the csv table of all USGS topographic maps as
+    read_topos, but returns them as a compact Catalog (see catalog.py) instead of
+    a nested dictionary. catalog.root() answers the same lookups: for a 1988 map
+    at 1:24000 scale of Salem, Oregon with print year 1999, calling
+    catalog.root()['24000']['Oregon']['Salem']['1988']['1999'] yields a list of
+    tuples with the (scan ID, product URL) of each matching map.
+
+    filepath: csv table of all USGS topographic maps that were ever made"""
+    builder = CatalogBuilder()
+    for chunk in _read_chunks(filepath, TOPO_COLUMNS):
+        for topo in chunk.fillna("(none)").itertuples(index=False, name=None):
+            builder.add(topo[0], topo[2:], topo[1])
+    return builder.build()
+
+def read_htmc(filepath:str, progress=None):
+    """Builds both the map catalog (like read_catalog) and the GNIS cell index
+    (like read_gnis) in a single pass over the csv table of all USGS topographic
+    maps, reading only the columns that the two of them need. The csv is streamed
+    in chunks of CHUNK_ROWS rows, so apart from the finished catalog and index,
+    memory use doesn't grow with the size of the csv.
+    Returns a (catalog, cells) tuple.
+
+    filepath: csv table of all USGS topographic maps that were ever made
+    progress: an optional function that gets called with a short message
+    describing how far along the read is, after every chunk"""
+    columns = TOPO_COLUMNS + [col for col in GNIS_COLUMNS if col not in TOPO_COLUMNS]
+    builder = CatalogBuilder()
+    cells = {}
+    seen = set()
+    for chunk in _read_chunks(filepath, columns):
+        # the catalog gets "(none)" for missing values, the GNIS index gets them as-is
+        topos = chunk[TOPO_COLUMNS].fillna("(none)").itertuples(index=False, name=None)
+        gnis_rows = chunk[GNIS_COLUMNS].itertuples(index=False, name=None)
+        for topo, gnis_row in zip(topos, gnis_rows):
+            builder.add(topo[0], topo[2:], topo[1])
+            _add_gnis_row(cells, seen, gnis_row)
+        if progress is not None:
+            progress("Reading {}: {:,} maps so far...".format(os.path.basename(filepath), len(builder.url_names)))
+    for row in TERRITORY_ROWS:
+        _add_gnis_row(cells, None, row)
+    if progress is not None:
+        progress("Sorting the map catalog...")
+    return builder.build(), cells
+
+def _read_chunks(filepath:str, columns:list):
+    """Reads the given columns of a csv (stringifying everything) and yields them
+    in DataFrames of up to CHUNK_ROWS rows, with the columns in the given order."""
+    # pandas takes a good while to import and is only needed here, so it's imported
+    # the first time a csv actually has to be read rather than whenever file_io is
+    import pandas as pd
+    with pd.read_csv(filepath, usecols=columns, dtype=str, chunksize=CHUNK_ROWS) as reader:
+        for chunk in reader:
+            yield chunk[columns]
+
+def read_htmc_cached(filepath:str, cache_path:str=None, progress=None):
+    """Returns the same catalog and GNIS cell index as read_htmc, but goes through
+    a binary snapshot of both that is stored on disk next to the csv. The snapshot
+    is keyed on the size, modification time and SHA-256 hash of the csv, so
+    replacing usgs_topos.csv makes the next launch rebuild it. If the size and
+    modification time match we trust the snapshot without hashing; if only those
+    changed (e.g. the file was copied over again) the hash decides. A snapshot
+    that is missing, out of date, or unreadable is rebuilt from the csv. The GNIS
+    cell index is also handed over to get_gnis_cells.
+    Returns a (catalog, cells, from_cache) tuple, where from_cache is True if they
+    were loaded from the snapshot and False if they were rebuilt.
+
+    filepath: csv table of all USGS topographic maps that were ever made
+    cache_path: where to keep the snapshot (defaults to filepath + '.cache')
+    progress: an optional function that gets called with short messages
+    describing what's being loaded (see read_htmc)"""
+    if progress is None:
+        progress = lambda message: None
+    if cache_path is None:
+        cache_path = filepath + '.cache'
+    signature = _file_signature(filepath)
+    key = {'version': TOPOS_CACHE_VERSION, 'size': signature[0], 'mtime': signature[1]}
+
+    digest = None
+    try:
+        with open(cache_path, 'rb') as f:
+            # the snapshot is two pickles back to back: a small header with the
+            # key, then the catalog and index, so a stale snapshot is rejected
+            # without having to unpickle the whole catalog
+            header = pickle.load(f)
+            if header['version'] == key['version']:
+                if header['size'] != key['size'] or header['mtime'] != key['mtime']:
+                    progress("Checking {} for changes...".format(os.path.basename(filepath)))
+                    digest = _hash_file(filepath)
+                if digest is None or digest == header['sha256']:
+                    progress("Loading the map catalog from its cache...")
+                    catalog, cells = pickle.load(f)
+                    if digest is not None: # re-key the snapshot to the new mtime
+                        _write_topos_cache(cache_path, dict(key, sha256=digest), (catalog, cells))
+                    _share_gnis_cells(filepath, signature, cells)
+                    return catalog, cells, True
+    except FileNotFoundError:
+        pass
+    except Exception: # a truncated or corrupt snapshot can fail in many ways
+        pass          # so just rebuild it instead
+
+    catalog, cells = read_htmc(filepath, progress)
+    if digest is None:
+        digest = _hash_file(filepath)
+    _write_topos_cache(cache_path, dict(key, sha256=digest), (catalog, cells))
+    _share_gnis_cells(filepath, signature, cells)
+    return catalog, cells, False
+
+def _write_topos_cache(cache_path:str, header:dict, contents):
+    """Writes the snapshot to a temporary file and swaps it into place, so a crash
+    mid-write never leaves a half-written snapshot behind. Failing to write the
+    snapshot (e.g. a read-only folder) is not an error, the tool just rebuilds
+    again on the next launch."""
+    tmp_path = cache_path + '.tmp'
+    try:
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(header, f, protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump(contents, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        pass
+
+def _hash_file(filepath:str):
+    """Returns the SHA-256 hex digest of a file's contents, read in 1 MB blocks"""
+    sha = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+# ------------------------------------------------------------------------------
+# -------------------------- COLUMNAR CATALOG FILES ----------------------------
+# ------------------------------------------------------------------------------
+
+# A columnar file holds a Catalog and a GNIS cell index in a form that can be memory
+# mapped and used as-is: every array of the Catalog is stored as raw bytes, and the
+# drop-down menus are filled by reading the parts of the file they need rather than
+# by parsing anything. The layout is:
+#
+#   COLUMNAR_MAGIC, then the length of the header as an 8-byte little-endian integer
+#   the header: a JSON object with the layout version, the byte order, the source
+#       csv, the Catalog's pools and URL directories, the GNIS index's pools, and
+#       where in the data each section starts, what type its items are, and how many
+#   the data: one section per array, each starting on an 8-byte boundary
+#
+# State, scale, cell name, map year and print year are dictionary-encoded (the pools
+# in the header), and so are the state, cell name and map scale of the GNIS rows.
+# Only standard cells make it into the GNIS index (see _add_gnis_row), so cell_type
+# doesn't need to be stored at all.
+
+def is_columnar(filepath:str):
+    """returns whether a file is a columnar catalog file (see write_columnar)"""
+    try:
+        with open(filepath, 'rb') as f:
+            return f.read(len(COLUMNAR_MAGIC)) == COLUMNAR_MAGIC
+    except OSError:
+        return False
+
+def write_columnar(filepath:str, catalog, cells:dict, source:str=None):
+    """Writes a Catalog (like the one from read_htmc) and a GNIS cell index to a
+    columnar file that read_columnar can memory-map. The file is written next to
+    filepath and then swapped into place, so nobody ever reads half a file.
+
+    filepath: where to write the columnar file
+    catalog: a Catalog
+    cells: the GNIS cell index that goes with it
+    source: the csv they were read from, which is noted in the header"""
+    sections = [] # (name, array)
+    for level in range(len(LEVELS)):
+        sections.extend([('values{}'.format(level), catalog.values[level]),
+                         ('starts{}'.format(level), catalog.starts[level]),
+                         ('runs{}'.format(level), catalog.runs[level])])
+    n = len(catalog)
+    string_scan_ids = isinstance(catalog.scan_ids, list)
+    if string_scan_ids:
+        sections.extend(_string_sections('scan_ids', catalog.scan_ids))
+    else:
+        sections.append(('scan_ids', array('q', catalog.scan_ids)))
+    sections.append(('url_dir_codes', catalog.url_dir_codes))
+    sections.extend(_string_sections('url_names', catalog.url_names))
+    # the rows sorted by scan ID and by file name, for Catalog.find_row
+    sections.append(('scan_order', array('I', sorted(range(n), key=catalog.scan_ids.__getitem__))))
+    sections.append(('name_order', array('I', sorted(range(n), key=catalog.url_names.__getitem__))))
+
+    # the GNIS cell index as (state, cell name, scale, GNIS cell ID) rows, in order
+    gnis_pools = [[], [], []]
+    gnis_codes = [{}, {}, {}]
+    gnis_columns = [array('I'), array('I'), array('I')]
+    gnis_ids = []
+    for state, state_cells in cells.items():
+        for cell, scales in state_cells.items():
+            for scale, gnis in scales:
+                for col, val in enumerate((state, cell, scale)):
+                    code = gnis_codes[col].get(val)
+                    if code is None:
+                        code = gnis_codes[col][val] = len(gnis_pools[col])
+                        gnis_pools[col].append(val)
+                    gnis_columns[col].append(code)
+                gnis_ids.append(gnis)
+    for name, column in zip(['gnis_states', 'gnis_cells', 'gnis_scales'], gnis_columns):
+        sections.append((name, column))
+    sections.extend(_string_sections('gnis_ids', gnis_ids))
+
+    layout = {}
+    offset = 0
+    for name, column in sections:
+        layout[name] = [offset, column.typecode, len(column)]
+        offset += _padded(len(column) * column.itemsize)
+    header = {'version': COLUMNAR_VERSION, 'byteorder': sys.byteorder, 'rows': n,
+              'source': os.path.basename(source) if source else None,
+              'pools': catalog.pools, 'url_dirs': catalog.url_dirs, 'string_scan_ids': string_scan_ids,
+              'gnis_pools': gnis_pools, 'sections': layout}
+    header_bytes = json.dumps(header).encode('utf-8')
+
+    tmp_path = filepath + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(COLUMNAR_MAGIC)
+        f.write(len(header_bytes).to_bytes(8, 'little'))
+        f.write(header_bytes.ljust(_padded(len(header_bytes)), b' '))
+        for name, column in sections:
+            data = column.tobytes()
+            f.write(data.ljust(_padded(len(data)), b'\0'))
+    swap_in(tmp_path, filepath)
+
+def swap_in(tmp_path:str, filepath:str):
+    """Moves a finished temporary file into place over filepath. Windows won't replace
+    a file that another program has open, and every copy of the tool that's running
+    has the columnar file memory-mapped (see read_columnar), so if the file can't be
+    replaced the temporary file is deleted and a RuntimeError says to close them first."""
+    try:
+        os.replace(tmp_path, filepath)
+    except PermissionError:
+        os.remove(tmp_path)
+        raise RuntimeError("Could not replace {} because another program has it open. Close every copy "
+                           "of the map inventory tool (and anything else using the file) and try again.".format(filepath)) from None
+
+def _string_sections(name:str, strings):
+    """returns the (name, array) sections that store a list of strings: all of them
+    back to back as utf-8, and where each one starts (see StringColumn)"""
+    blob = bytearray()
+    offsets = array('I', [0])
+    for string in strings:
+        blob += string.encode('utf-8')
+        offsets.append(len(blob))
+    return [(name + '_offsets', offsets), (name + '_blob', array('B', blob))]
+
+def _padded(size:int):
+    """rounds a number of bytes up to the next multiple of 8"""
+    return (size + 7) // 8 * 8
+
+def read_columnar(filepath:str):
+    """Memory-maps a columnar file (see write_columnar) and returns the (catalog,
+    cells) tuple it holds, like read_htmc does for a csv. Only the header is read
+    up front: the Catalog's arrays are views onto the mapped file, so the operating
+    system reads in whichever parts of it the drop-down menus look at, as they
+    look at them, and shares them between everyone using the same file. The GNIS
+    cell index is small, so it's built as a dictionary right away, and it's also
+    handed over to get_gnis_cells.
+    Raises ValueError if the file isn't a columnar file that this version of the
+    tool can read.
+
+    filepath: a columnar file written by write_columnar"""
+    catalog, cells = _read_columnar(filepath)
+    _share_gnis_cells(filepath, _file_signature(filepath), cells)
+    return catalog, cells
+
+def _read_columnar(filepath:str):
+    """what read_columnar does, without handing the GNIS cell index over to get_gnis_cells"""
+    with open(filepath, 'rb') as f:
+        if f.read(len(COLUMNAR_MAGIC)) != COLUMNAR_MAGIC:
+            raise ValueError("{} is not a columnar catalog file".format(filepath))
+        header_length = int.from_bytes(f.read(8), 'little')
+        header = json.loads(f.read(header_length).decode('utf-8'))
+        if header['version'] != COLUMNAR_VERSION or header['byteorder'] != sys.byteorder:
+            raise ValueError("{} was written by a different version of the tool, or on a different "
+                             "kind of computer; convert usgs_topos.csv again".format(filepath))
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(mapped)
+    data_start = len(COLUMNAR_MAGIC) + 8 + _padded(header_length)
+    def section(name):
+        offset, typecode, count = header['sections'][name]
+        start = data_start + offset
+        return view[start:start + count * array(typecode).itemsize].cast(typecode)
+    def strings(name):
+        return StringColumn(section(name + '_blob'), section(name + '_offsets'))
+
+    levels = range(len(LEVELS))
+    catalog = Catalog(header['pools'],
+                      [section('values{}'.format(level)) for level in levels],
+                      [section('starts{}'.format(level)) for level in levels],
+                      [section('runs{}'.format(level)) for level in levels],
+                      strings('scan_ids') if header['string_scan_ids'] else section('scan_ids'),
+                      header['url_dirs'], section('url_dir_codes'), strings('url_names'),
+                      section('scan_order'), section('name_order'))
+
+    cells = {}
+    states, cell_names, scales = header['gnis_pools']
+    gnis_ids = strings('gnis_ids')
+    for i, (state, cell, scale) in enumerate(zip(section('gnis_states'), section('gnis_cells'), section('gnis_scales'))):
+        cells.setdefault(states[state], {}).setdefault(cell_names[cell], []).append((scales[scale], gnis_ids[i]))
+    return catalog, cells
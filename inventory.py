@@ -0,0 +1,374 @@
+# Ethan McIntosh - GIS and Data Services - Brown University - October 2026
+
+# The parts of the inventory tool that don't need a window: loading the map catalog,
+# finding maps in it, putting together the records that get written to the map
+# database, and recording and removing them. bul_topo_tool.py and bulk_record.py
+# both go through these methods, and other scripts (like the ones in benchmarks/)
+# can import them without starting the GUI. Nothing here imports tkinter, and
+# pandas only gets imported (by file_io) if the catalog has to be rebuilt from the csv.
+
+from collections import Counter
+from datetime import datetime
+import os, threading
+import file_io, db # import the other files in this package
+from catalog import DbCatalog
+
+TOPOS_CSV = 'usgs_topos.csv'
+# the columnar version of usgs_topos.csv, if one has been made (see convert_htmc.py)
+TOPOS_COLUMNAR = 'usgs_topos.htmc'
+USERS_CSV = 'users.csv'
+NEXT_EXCEPTION_ID_CSV = 'next_exception_id.csv'
+
+# the scale an exception map's GNIS cell ID is looked up by when no scale was given
+DEFAULT_SCALE = 24000
+
+# ------------------------------------------------------------------------------
+# ---------------------------- LOADING DATA ------------------------------------
+# ------------------------------------------------------------------------------
+
+def open_database(db_path:str=None):
+    """Connects to the map database (the one on the shared drive unless a path is
+    given), brings its indexes and tables up to date (see db.MIGRATIONS) and returns
+    the db.Database. The first time this runs on a database, the exception map ID
+    sequence picks up where next_exception_id.csv left off. The GUI leaves this to
+    its syncer instead (see journal.JournalSyncer), which keeps trying until it works."""
+    map_db = db.Database(db_path or db.default_db_path())
+    map_db.migrate(exception_id_seed())
+    return map_db
+
+def exception_id_seed():
+    """returns the next exception map ID from before the map database allocated them
+    (see Database.migrate)"""
+    return file_io.read_next_exception_id(NEXT_EXCEPTION_ID_CSV)
+
+def catalog_path(csv_path:str=TOPOS_CSV, columnar_path:str=TOPOS_COLUMNAR):
+    """Returns the file the map catalog gets loaded from: the columnar version of
+    usgs_topos.csv if there is one that's at least as new as the csv, and otherwise
+    the csv itself"""
+    if os.path.exists(columnar_path) and \
+            (not os.path.exists(csv_path) or os.path.getmtime(columnar_path) >= os.path.getmtime(csv_path)):
+        return columnar_path
+    return csv_path
+
+def load_catalog(filepath:str=None, progress=None):
+    """Reads the map catalog (see catalog.py), from catalog_path() unless another
+    file is given, and returns a (catalog, from_cache) tuple. A csv is read from its
+    snapshot on disk if it hasn't changed, and a columnar file is memory-mapped (see
+    file_io.read_columnar); from_cache is False only if the csv had to be parsed.
+    The GNIS cell index is read in the same pass, and is then available from gnis_cells().
+
+    progress: an optional function that gets called with short messages about how
+    far along the read is, if the catalog has to be rebuilt"""
+    filepath = filepath or catalog_path()
+    if file_io.is_columnar(filepath):
+        catalog, _ = file_io.read_columnar(filepath)
+        return catalog, True
+    catalog, _, from_cache = file_io.read_htmc_cached(filepath, progress=progress)
+    catalog.index_rows() # so that find_map() doesn't have to wait for them
+    return catalog, from_cache
+
+def database_catalog(db_path:str=None):
+    """Returns a DbCatalog (see catalog.py) over the all_usgs_topos table of the map
+    database (the one on the shared drive unless a path is given), which fills the
+    drop-down menus with indexed queries as they're used instead of loading the csv
+    up front. Its root() answers the same lookups as the catalog from load_catalog()."""
+    return DbCatalog(db_path or db.default_db_path())
+
+def gnis_cells(filepath:str=None):
+    """returns the GNIS cell index, a dictionary of {state: {cell name: [(scale, GNIS cell ID), ...]}},
+    from catalog_path() unless another file is given"""
+    return file_io.get_gnis_cells(filepath or catalog_path())
+
+def users(filepath:str=USERS_CSV):
+    """returns the initials of everyone who can record maps"""
+    return file_io.read_users(filepath)
+
+# ------------------------------------------------------------------------------
+# ---------------------------- FINDING MAPS ------------------------------------
+# ------------------------------------------------------------------------------
+
+def resolve(maps, path):
+    """Walks the map catalog down the given (map scale, primary state, cell name,
+    map year, print year) path, the same way the drop-down menus do, and returns
+    the list of (scan ID, product URL) tuples of the maps at the end of it, which
+    is empty if any of the values isn't one of the options at that point.
+
+    maps: the root CatalogNode of the map catalog"""
+    node = maps
+    for val in path:
+        if val not in node:
+            return []
+        node = node[val]
+    return node
+
+def find_map(maps, identifier:str):
+    """Looks a map up by its scan ID or product URL (see Catalog.find_row) and returns
+    a (path, (scan ID, product URL)) tuple, where path is the (map scale, primary state,
+    cell name, map year, print year) that the drop-down menus would have to be set to
+    for it, or None if there's no such map in the catalog.
+
+    maps: the root CatalogNode (or DbCatalogNode) of the map catalog"""
+    return maps.catalog.find(identifier)
+
+def closest_gnis_cell_id(cells, state:str, cell:str, scale:str):
+    """Returns the GNIS cell ID of the given cell in the given state whose map scale
+    is closest to the given one (a string, which defaults to DEFAULT_SCALE if it isn't
+    an integer), or '' if the cell isn't in the GNIS cell index.
+
+    cells: the GNIS cell index from gnis_cells()"""
+    try:
+        scale = int(scale)
+    except ValueError: # if the scale was left blank or otherwise isn't an integer,
+        scale = DEFAULT_SCALE # use the default for the purposes of finding a GNIS cell ID
+    closest_gnis = ''
+    if state in cells and cell in cells[state]:
+        # find the map scale with the smallest difference between it and the given scale
+        min_diff = float('inf')
+        for scl, gnis in cells[state][cell]:
+            if abs(int(scl) - scale) < min_diff:
+                min_diff = abs(int(scl) - scale)
+                closest_gnis = gnis
+    return closest_gnis
+
+# ------------------------------------------------------------------------------
+# ------------------------- RECORDING AND REMOVING -----------------------------
+# ------------------------------------------------------------------------------
+
+def recorded_time():
+    """returns the current time the way the database stores it, as a YYYYMMDDHHMM integer"""
+    return int(datetime.now().strftime('%Y%m%d%H%M'))
+
+def topo_record(scan_id:str, recorded_by:str, is_damaged, is_duplicate, when:int=None):
+    """Returns the values that record a USGS topo in usgs_topos_we_have (the arguments
+    of Database.insert_topo_if_absent), recorded now unless a recorded time is given."""
+    return [scan_id
+            , recorded_by
+            , when if when is not None else recorded_time()
+            , int(is_damaged) # 0 or 1
+            , int(is_duplicate) # 0 or 1
+            , 'USGS'] # producer
+
+def exception_record(map_info, cells, recorded_by:str, when:int=None):
+    """Returns the values that record an exception map in exception_maps_we_have,
+    minus the map ID, which the database allocates when the record is inserted.
+    These are the producer, map scale, primary state, cell name, GNIS cell ID, map
+    year, print year, sheet, series, edition, is_damaged, is_duplicate, recorded_by
+    and recorded_time.
+
+    map_info: the producer, map scale, primary state, cell name, map year, print
+    year, sheet, series, edition, is_damaged and is_duplicate from the exception window
+    cells: the GNIS cell index from gnis_cells()"""
+    vals = list(map_info[:4])
+    vals.append(closest_gnis_cell_id(cells, map_info[2], map_info[3], map_info[1]))
+    vals.extend(map_info[4:-2])
+    vals.extend([int(x) for x in map_info[-2:]])
+    vals.extend([recorded_by, when if when is not None else recorded_time()])
+    return vals
+
+def map_table(map_id):
+    """Returns the (table, ID column) that a map ID belongs to. Exception map IDs
+    have fewer than 6 digits and USGS scan IDs have 6 or more."""
+    if len(str(map_id)) < 6:
+        return db.WE_HAVE_TABLES[1]
+    return db.WE_HAVE_TABLES[0]
+
+def record_topo(map_db, record):
+    """Records a USGS topo from the values that topo_record() returns, and returns the
+    outcome (see Database.insert_topo_if_absent)"""
+    return map_db.insert_topo_if_absent(*record)
+
+def record_exception(map_db, record):
+    """Records an exception map from the values that exception_record() returns under
+    a newly allocated map ID, and returns an (outcome, map ID) tuple"""
+    return map_db.insert_exception_with_new_id(record)
+
+def remove_map(map_db, map_id):
+    """Removes the record of a USGS topo or exception map, and returns the outcome
+    (see Database.remove_if_present)"""
+    table, id_name = map_table(map_id)
+    return map_db.remove_if_present(table, id_name, map_id)
+
+# ------------------------------------------------------------------------------
+# ----------------------- KEEPING TRACK OF RECORDED MAPS -----------------------
+# ------------------------------------------------------------------------------
+
+def exception_key(vals):
+    """Returns what tells an exception map apart from the others (its producer, map
+    scale, primary state, cell name, GNIS cell ID, map year, print year, sheet, series
+    and edition) from the values that exception_record() returns, or from a row of
+    db.EXCEPTION_KEY_COLS, in a form that compares the same whichever it came from"""
+    key = []
+    for val in vals[:10]:
+        if isinstance(val, float) and val.is_integer():
+            val = int(val) # e.g. a map scale that sqlite stored as 24000.0
+        key.append('' if val is None else str(val).strip())
+    return tuple(key)
+
+class RecordedMaps:
+    """Every map we have, kept in memory so that whether a map has been recorded can be
+    answered without going to the map database. The scan IDs of the USGS topos and
+    the exception_key() of the exception maps are read once, on a worker thread so that
+    whoever is waiting on the database isn't the window, and after that refresh()
+    reads just the maps added or removed since the last time, from the log that the
+    database keeps of them (we_have_changes, see db.MIGRATIONS), and only when PRAGMA
+    data_version says something in the database has changed. That covers the maps
+    recorded from every workstation, not just this one. Until the first read is done,
+    nothing counts as recorded but the maps waiting in the journal.
+
+    Maps that have been recorded on this workstation but are still waiting in the
+    journal (see journal.py) count as recorded too, from the moment they're queued
+    (see add_pending() and done_pending()).
+
+    This keeps its own read-only connection to the map database, since a connection's
+    data_version doesn't change when it makes changes itself, and so it should only be
+    used from one thread."""
+
+    def __init__(self, db_path:str, pending=()):
+        """db_path: the map database
+        pending: (write ID, kind, values) tuples of the writes waiting in the journal"""
+        self.db_path = db_path
+        self.map_db = db.Database(db_path, read_only=True)
+        self.pending = {} # write ID: (kind, scan ID or exception key)
+        self.synced = {} # the same, for writes the syncer is done with that refresh() hasn't read back yet
+        for write_id, kind, vals in pending:
+            self.add_pending(write_id, kind, vals)
+        self.seq = None
+        self.scan_ids = Counter()
+        self.exceptions = {} # map ID: exception key
+        self.exception_keys = Counter()
+        self.load()
+
+    def load(self):
+        """Starts reading every map we have from the database on a worker thread, to
+        replace whatever was read before once refresh() sees that it's done. If the
+        database doesn't have the log of changes yet (because it hasn't been migrated
+        yet), or the log no longer goes back as far as the last read (see
+        db.CHANGES_KEPT), refresh() reads everything again in the same way instead."""
+        # taken before the read starts, so that anything that changes while it's
+        # going on changes data_version, and gets read from the log afterwards
+        self.version = self.map_db.data_version()
+        self.loaded = None
+        self._loader = threading.Thread(target=self._read_all, daemon=True)
+        self._loader.start()
+
+    def _read_all(self):
+        """the worker thread behind load(), which needs a connection of its own"""
+        try:
+            self.loaded = db.Database(self.db_path, read_only=True).recorded_maps()
+        except Exception as e:
+            self.loaded = e
+
+    def wait_loaded(self):
+        """waits for load() to finish reading, for scripts that can't carry on without it"""
+        self._loader.join()
+        self.refresh()
+
+    def _finish_loading(self):
+        """Replaces whatever was read before with what load() read, once it's done. Returns
+        True if it's done, and raises the error that kept it from reading the database
+        (after starting to read again) if there was one."""
+        if self._loader.is_alive():
+            return False
+        loaded = self.loaded
+        self.loaded = None
+        if isinstance(loaded, Exception):
+            self.load() # try again
+            raise loaded
+        self.seq, scan_ids, exceptions = loaded
+        self.scan_ids = Counter(str(scan_id) for scan_id in scan_ids)
+        self.exceptions = {}
+        self.exception_keys = Counter()
+        for row in exceptions:
+            self._add_exception(row[0], exception_key(row[1:]))
+        return True
+
+    def refresh(self):
+        """Catches up with whatever maps have been added to or removed from the database
+        since the last time, and returns True if anything changed (in which case
+        something may now count as recorded that didn't before, or the other way round)"""
+        if self._loader.is_alive() or self.loaded is not None:
+            return self._finish_loading()
+        version = self.map_db.data_version()
+        if version == self.version:
+            # nothing has been written since the last read, so that read had whatever
+            # the syncer wrote before it said so
+            return self._forget_synced()
+        self.version = version
+        if self.seq is None: # the database has no log of changes to read (see load())
+            self.load()
+            return False
+        changes = self.map_db.recorded_changes(self.seq)
+        if changes and changes[0][0] > self.seq + 1:
+            # the log has been pruned past where we left off (see db.CHANGES_KEPT)
+            self.load()
+            return False
+        for seq, table_idx, map_id, removed, *key in changes:
+            self.seq = seq
+            if table_idx == 0:
+                self.scan_ids[str(map_id)] += -1 if removed else 1
+                if self.scan_ids[str(map_id)] <= 0:
+                    del self.scan_ids[str(map_id)]
+            elif removed:
+                self._remove_exception(map_id)
+            elif any(val is not None for val in key):
+                # the key is the exception map's current values, which are all None if
+                # it's been removed again since (a later change in the log says so)
+                self._add_exception(map_id, exception_key(key))
+        return self._forget_synced() or bool(changes)
+
+    def _forget_synced(self):
+        """stops counting the maps the syncer was done with before the database was last
+        read, which now count as recorded (or not) by what was read, and returns True if there were any"""
+        synced = bool(self.synced)
+        self.synced = {}
+        return synced
+
+    def _add_exception(self, map_id, key):
+        self._remove_exception(map_id)
+        self.exceptions[map_id] = key
+        self.exception_keys[key] += 1
+
+    def _remove_exception(self, map_id):
+        key = self.exceptions.pop(map_id, None)
+        if key is not None:
+            self.exception_keys[key] -= 1
+            if self.exception_keys[key] <= 0:
+                del self.exception_keys[key]
+
+    def add_pending(self, write_id:str, kind:str, vals):
+        """counts a map that's been queued in the journal as recorded, from the values it
+        was queued with (see topo_record() and exception_record())"""
+        if kind == db.TOPO_WRITE:
+            self.pending[write_id] = (kind, str(vals[0]))
+        else:
+            self.pending[write_id] = (kind, exception_key(vals))
+
+    def done_pending(self, write_id:str):
+        """Takes a queued map off the pending list once the syncer has written it (or
+        given up on it). It still counts as recorded until the next refresh() has read
+        back whatever the syncer wrote, so that it never goes missing in between, and
+        however many maps the syncer writes, the database is only read once for them."""
+        entry = self.pending.pop(write_id, None)
+        if entry is not None:
+            self.synced[write_id] = entry
+
+    def cancel_pending(self, write_id:str):
+        """takes a queued map off the pending list once it's been taken out of the journal
+        before the syncer got to it, so that it no longer counts as recorded"""
+        self.pending.pop(write_id, None)
+
+    def has_topo(self, scan_id):
+        """returns True if the USGS topo with the given scan ID has been recorded"""
+        entry = (db.TOPO_WRITE, str(scan_id))
+        return str(scan_id) in self.scan_ids or entry in self.pending.values() or entry in self.synced.values()
+
+    def has_exception(self, vals):
+        """returns True if an exception map with the same exception_key() as the values
+        from exception_record() has been recorded. Sparse exception maps can share a key
+        without being the same map, so this is a hint rather than a reason to refuse one"""
+        entry = (db.EXCEPTION_WRITE, exception_key(vals))
+        return entry[1] in self.exception_keys or entry in self.pending.values() or entry in self.synced.values()
+
+    def all_recorded(self, results):
+        """returns True if every one of a list of (scan ID, product URL) results has been recorded"""
+        return all(self.has_topo(scan_id) for scan_id, _ in results)
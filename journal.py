@@ -0,0 +1,175 @@
+# Ethan McIntosh - GIS and Data Services - Brown University - October 2026
+
+import json, os, sqlite3, threading, time, uuid
+import db
+
+# the journal lives on the local disk, next to the tool, rather than on the shared drive.
+# It's found from where this file is rather than the working directory, so that starting
+# the tool from some other folder doesn't start an empty journal and leave queued records behind
+DEFAULT_JOURNAL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pending_writes.db')
+
+class WriteJournal:
+    """A durable queue of map records that have been recorded in the tool but not
+    yet written to the map database on the shared drive. Recording a map only
+    writes to this small local SQLite file, which is quick and never locked by
+    anyone else, and a JournalSyncer replays the queued writes into the map
+    database in the background. Writes stay in the journal until they have been
+    applied, so nothing is lost if the tool is closed or crashes before then.
+
+    Every write gets a random write ID, which the map database remembers once the
+    write is applied (see Database.apply_writes), so replaying a write twice never
+    records the same map twice.
+
+    Each thread needs its own WriteJournal, since sqlite connections can't be shared
+    between threads."""
+
+    def __init__(self, path:str=DEFAULT_JOURNAL_PATH):
+        self.conn = sqlite3.connect(path)
+        # WAL lets the syncer read the journal while the main window writes to it,
+        # and synchronous=FULL makes each queued write durable once it's committed
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=FULL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS pending_writes (" +
+                          "seq INTEGER PRIMARY KEY AUTOINCREMENT, write_id TEXT NOT NULL UNIQUE, " +
+                          "kind TEXT NOT NULL, recorded_by TEXT NOT NULL, vals TEXT NOT NULL, " +
+                          "display TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, last_error TEXT)")
+        self.conn.commit()
+
+    def enqueue(self, kind:str, recorded_by:str, vals, display):
+        """Queues a write and returns its write ID.
+
+        kind: db.TOPO_WRITE or db.EXCEPTION_WRITE
+        recorded_by: the initials of whoever recorded the map
+        vals: the values to write (see Database.apply_writes)
+        display: the row to show for this map in the table display until it's written"""
+        write_id = uuid.uuid4().hex
+        with self.conn:
+            self.conn.execute("INSERT INTO pending_writes (write_id, kind, recorded_by, vals, display) VALUES (?, ?, ?, ?, ?)",
+                              (write_id, kind, recorded_by, json.dumps(list(vals)), json.dumps(list(display))))
+        return write_id
+
+    def pending(self, limit:int):
+        """returns up to limit of the oldest queued writes (all of them if limit is -1),
+        as (write ID, kind, values) tuples"""
+        rows = self.conn.execute("SELECT write_id, kind, vals FROM pending_writes ORDER BY seq LIMIT ?", (limit,)).fetchall()
+        return [(write_id, kind, json.loads(vals)) for write_id, kind, vals in rows]
+
+    def pending_rows(self, recorded_by:str):
+        """returns the (write ID, table display row) of each queued write recorded by
+        the given initials, oldest first"""
+        rows = self.conn.execute("SELECT write_id, display FROM pending_writes WHERE recorded_by = ? ORDER BY seq",
+                                 (recorded_by,)).fetchall()
+        return [(write_id, json.loads(display)) for write_id, display in rows]
+
+    def pending_count(self):
+        """returns how many writes are waiting to be applied"""
+        return self.conn.execute("SELECT COUNT(*) FROM pending_writes").fetchone()[0]
+
+    def note_failed_attempt(self, write_ids, error:str):
+        """records that applying the given writes failed, and why"""
+        with self.conn:
+            self.conn.executemany("UPDATE pending_writes SET attempts = attempts + 1, last_error = ? WHERE write_id = ?",
+                                  [(error, write_id) for write_id in write_ids])
+
+    def remove(self, write_ids):
+        """Takes the given writes out of the queue, and returns the IDs of the ones that
+        were still there (the others were cancelled in the meantime)"""
+        removed = []
+        with self.conn:
+            for write_id in write_ids:
+                if self.conn.execute("DELETE FROM pending_writes WHERE write_id = ?", (write_id,)).rowcount:
+                    removed.append(write_id)
+        return removed
+
+    def cancel(self, write_id:str):
+        """Takes a write out of the queue before it's applied. Returns True if it was
+        still queued, or False if it's already been applied (or was never queued)."""
+        return bool(self.remove([write_id]))
+
+class JournalSyncer(threading.Thread):
+    """A background thread that replays the writes queued in a WriteJournal into the
+    map database in batches, one transaction per batch. When the map database can't
+    be written to (most often because someone has it open for writing in DB Browser,
+    so it's locked), the syncer waits and tries again, doubling the wait each time
+    up to max_delay seconds.
+
+    The syncer also brings the map database up to date (see db.MIGRATIONS) before it
+    writes anything, since the writes depend on the tables the migrations add. Doing
+    that here rather than when the tool starts means a locked database doesn't hold
+    up the window, and a migration that couldn't be applied at first is retried in
+    the same way as a batch of writes, until it can be.
+
+    The syncer never touches tkinter widgets. Instead, it calls on_result with the
+    (write ID, outcome, map ID, error) of every write it applies, and on_status with
+    the number of writes still waiting and the most recent error (or None) whenever
+    either changes; the GUI passes these along to the main thread."""
+
+    def __init__(self, journal_path:str, db_path:str, on_result, on_status, exception_id_seed:int=0,
+                 batch_size:int=50, min_delay:float=1.0, max_delay:float=60.0):
+        """exception_id_seed: see Database.migrate"""
+        super().__init__(daemon=True)
+        self.journal_path = journal_path
+        self.db_path = db_path
+        self.exception_id_seed = exception_id_seed
+        self.on_result = on_result
+        self.on_status = on_status
+        self.batch_size = batch_size
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self._wake = threading.Event()
+
+    def wake(self):
+        """tells the syncer that there's something new in the journal"""
+        self._wake.set()
+
+    def run(self):
+        journal = WriteJournal(self.journal_path)
+        database = db.Database(self.db_path)
+        delay = self.min_delay
+        error = None
+        migrated = False
+        while True:
+            if not migrated:
+                try:
+                    migrated = database.migrate(self.exception_id_seed) >= len(db.MIGRATIONS)
+                    error = database.last_error
+                except sqlite3.Error as e: # e.g. the shared drive can't be reached
+                    error = str(e)
+                if not migrated:
+                    error = "could not bring the map database up to date: " + str(error)
+                    self.on_status(journal.pending_count(), error)
+                    time.sleep(delay)
+                    delay = min(delay * 2, self.max_delay)
+                    continue
+                delay = self.min_delay
+                error = None
+
+            self.on_status(journal.pending_count(), error)
+            batch = journal.pending(self.batch_size)
+            if not batch:
+                # nothing to do until something is queued (or every few seconds, in
+                # case something was queued by another copy of the tool)
+                self._wake.wait(5)
+                self._wake.clear()
+                continue
+
+            results = database.apply_writes(batch)
+            if results == db.FAILED:
+                error = database.last_error
+                journal.note_failed_attempt([write_id for write_id, _, _ in batch], error)
+                self.on_status(journal.pending_count(), error)
+                time.sleep(delay)
+                delay = min(delay * 2, self.max_delay)
+                continue
+            delay = self.min_delay
+            error = None
+
+            kinds = {write_id: kind for write_id, kind, _ in batch}
+            still_queued = set(journal.remove([result[0] for result in results]))
+            for write_id, outcome, map_id, write_error in results:
+                if write_id in still_queued:
+                    self.on_result(write_id, outcome, map_id, write_error)
+                elif outcome == db.INSERTED:
+                    # the write was cancelled while we were applying it, so undo it
+                    table, id_name = db.WE_HAVE_TABLES[0 if kinds[write_id] == db.TOPO_WRITE else 1]
+                    database.remove_if_present(table, id_name, map_id)
@@ -0,0 +1,203 @@
+# Ethan McIntosh - GIS and Data Services - Brown University - October 2026
+
+# Opt-in timing of the tool's hot paths, for working out why the tool is slow on a
+# given day: loading the catalog, each drop-down selection and autocomplete
+# keystroke, and every call to the map database. It's off unless the BUL_TOPO_PERF
+# environment variable is set to 1 when the tool starts, e.g. on Windows:
+#
+#   set BUL_TOPO_PERF=1
+#   python bul_topo_tool.py
+#
+# While it's on, every measurement is written to perf.log next to the script (which
+# is rotated once it gets to PERF_LOG_BYTES, keeping PERF_LOG_BACKUPS old logs), and
+# a summary with the median and 95th percentile time of each operation is written
+# when the tool closes. Ctrl+Shift+P opens a window with the live numbers.
+#
+# Database calls are timed from the outside, and sqlite's trace and progress hooks
+# (see instrument_database) split out how much of that time sqlite spent waiting
+# rather than working, which is where a locked database or a slow network drive shows up.
+
+import atexit, functools, logging, logging.handlers, os, threading, time
+from collections import defaultdict, deque
+
+ENABLED = os.environ.get('BUL_TOPO_PERF') == '1'
+
+# next to the script, wherever the tool was started from
+PERF_LOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'perf.log')
+PERF_LOG_BYTES = 1000000
+PERF_LOG_BACKUPS = 3
+
+# how many of the most recent times of each operation the percentiles are taken over
+SAMPLES_KEPT = 5000
+
+# sqlite calls the progress handler every this many virtual machine instructions
+# while it's working. A gap of more than WAIT_GAP_MS between two calls means it
+# wasn't working in between: it was waiting on a lock, or on the disk
+PROGRESS_INSTRUCTIONS = 1000
+WAIT_GAP_MS = 2.0
+
+# the Database methods that get timed (see instrument_database)
+DATABASE_METHODS = ['fetch', 'fetch_history_page', 'insert_topo_if_absent',
+                    'insert_topos_if_absent', 'insert_exception_with_new_id', 'apply_writes',
+                    'remove_if_present', 'migrate', 'catalog_values', 'catalog_maps', 'catalog_find',
+                    'stream_table', 'coverage_stats', 'data_version', 'recorded_maps', 'recorded_changes']
+
+_lock = threading.Lock()
+_samples = defaultdict(lambda: deque(maxlen=SAMPLES_KEPT))
+_counts = defaultdict(int)
+_log = None
+
+def _logger():
+    """returns the perf.log logger, setting it up the first time"""
+    global _log
+    if _log is None:
+        _log = logging.getLogger('bul_topo_perf')
+        _log.setLevel(logging.INFO)
+        _log.propagate = False
+        handler = logging.handlers.RotatingFileHandler(PERF_LOG_PATH, maxBytes=PERF_LOG_BYTES,
+                                                       backupCount=PERF_LOG_BACKUPS)
+        handler.setFormatter(logging.Formatter('%(asctime)s %(threadName)s %(message)s'))
+        _log.addHandler(handler)
+        _log.info("session started")
+        atexit.register(log_summary)
+    return _log
+
+def record(operation:str, ms:float):
+    """records that an operation took a given number of milliseconds"""
+    if not ENABLED:
+        return None
+    with _lock:
+        _samples[operation].append(ms)
+        _counts[operation] += 1
+    _logger().info("%s %.3f ms", operation, ms)
+
+class timer:
+    """Times whatever happens inside a with block as the given operation, if
+    instrumentation is on:
+
+        with perf.timer('catalog load'):
+            ..."""
+    def __init__(self, operation:str):
+        self.operation = operation
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        record(self.operation, (time.perf_counter() - self.start) * 1000)
+        return False
+
+def timed(operation:str):
+    """A decorator that times every call of a function as the given operation. When
+    instrumentation is off, the function is returned as-is, so it costs nothing."""
+    def decorate(func):
+        if not ENABLED:
+            return func
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timer(operation):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def percentile(sorted_vals, fraction:float):
+    """returns the value a given fraction of the way through a sorted list (nearest rank)"""
+    return sorted_vals[min(len(sorted_vals) - 1, int(fraction * len(sorted_vals)))]
+
+def summary():
+    """Returns a (operation, count, p50 ms, p95 ms, max ms) tuple for each operation
+    timed so far this session, sorted by operation. The percentiles and maximum are
+    over the last SAMPLES_KEPT times of each operation."""
+    with _lock:
+        snapshot = {operation: (sorted(samples), _counts[operation]) for operation, samples in _samples.items()}
+    return [(operation, count, percentile(vals, 0.5), percentile(vals, 0.95), vals[-1])
+            for operation, (vals, count) in sorted(snapshot.items())]
+
+def format_summary():
+    """returns summary() as lines of a table"""
+    lines = ["{:<40}{:>8}{:>11}{:>11}{:>11}".format("operation", "count", "p50 ms", "p95 ms", "max ms")]
+    for operation, count, p50, p95, most in summary():
+        lines.append("{:<40}{:>8}{:>11.2f}{:>11.2f}{:>11.2f}".format(operation, count, p50, p95, most))
+    return lines
+
+def log_summary():
+    """writes the session summary to perf.log"""
+    if ENABLED and _samples:
+        _logger().info("session summary:\n" + "\n".join(format_summary()))
+
+def instrument_database(database_class):
+    """Times every call to the DATABASE_METHODS of a Database class (db.Database), and
+    how much of each call sqlite spent waiting, which is recorded as the method name
+    with ' (waiting)' added. Every connection the class opens from here on gets a
+    trace callback, which marks when each statement starts, and a progress handler,
+    which sqlite calls regularly while it's working; a long gap since the last of
+    either is time sqlite spent waiting for a lock or the disk. Does nothing when
+    instrumentation is off."""
+    if not ENABLED or getattr(database_class, '_perf_instrumented', False):
+        return None
+    database_class._perf_instrumented = True
+
+    original_init = database_class.__init__
+    @functools.wraps(original_init)
+    def __init__(self, *args, **kwargs):
+        original_init(self, *args, **kwargs)
+        state = {'last': time.perf_counter(), 'waited': 0.0}
+        def tick():
+            now = time.perf_counter()
+            gap = (now - state['last']) * 1000
+            if gap > WAIT_GAP_MS:
+                state['waited'] += gap
+            state['last'] = now
+        def on_statement(_):
+            # a statement is starting, so anything sqlite was waiting on while running
+            # the last one (e.g. a lock it gave up on before this ROLLBACK) is over
+            tick()
+        def on_progress():
+            tick()
+            return 0 # anything else would abort the statement
+        self._perf_state = state
+        self._perf_tick = tick
+        self.conn.set_trace_callback(on_statement)
+        self.conn.set_progress_handler(on_progress, PROGRESS_INSTRUCTIONS)
+    database_class.__init__ = __init__
+
+    def instrument(name):
+        method = getattr(database_class, name)
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            state = self._perf_state
+            state['waited'] = 0.0
+            state['last'] = start = time.perf_counter()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                # whatever time passed since sqlite last did anything was spent waiting
+                # too, e.g. for the lock that a statement that then failed was after
+                self._perf_tick()
+                record('db.' + name, (time.perf_counter() - start) * 1000)
+                if state['waited']:
+                    record('db.' + name + ' (waiting)', state['waited'])
+        setattr(database_class, name, wrapper)
+    for name in DATABASE_METHODS:
+        instrument(name)
+
+def show_panel(root):
+    """Opens a window (on top of the tkinter root window) that shows the summary()
+    table, refreshed every second, for as long as it's open"""
+    import tkinter as tk # only needed for the panel, which only the GUI opens
+    win = tk.Toplevel(root)
+    win.title("Performance")
+    text = tk.Text(win, width=82, height=24, font='TkFixedFont')
+    text.grid(row=0, column=0, padx=10, pady=10)
+    def refresh():
+        if not win.winfo_exists():
+            return None
+        text.delete('1.0', tk.END)
+        if ENABLED:
+            text.insert(tk.END, "\n".join(format_summary()))
+        else:
+            text.insert(tk.END, "Performance logging is off. To turn it on, set the BUL_TOPO_PERF\n" +
+                                "environment variable to 1 before starting the tool.")
+        win.after(1000, refresh)
+    refresh()
@@ -0,0 +1,209 @@
+# Ethan McIntosh - GIS and Data Services - Brown University - October 2026
+
+# Checks on the PDFs of the candidate maps in the "Multiple matches found" window in
+# the background, as soon as the window opens, so that the window can say which of
+# them the USGS's servers actually have and how big each one is before anyone waits
+# on one to open. Only the first PREVIEW_BYTES of each PDF are downloaded, with an
+# HTTP Range request, rather than whole GeoPDFs that run to tens of megabytes; the
+# PDF the operator opens is downloaded by their browser as usual.
+#
+# The previews are kept in a folder next to the tool (preview_cache), named by
+# scan ID, and the least recently used ones are deleted once the folder holds more
+# than PREVIEW_CACHE_MB megabytes. Two environment variables change where the PDFs
+# come from and how much is kept:
+#
+#   set BUL_TOPO_PREVIEW_HOST=http://localhost:8000
+#   set BUL_TOPO_PREVIEW_CACHE_MB=20
+#
+# BUL_TOPO_PREVIEW_HOST replaces the scheme and host of every product URL (keeping
+# its path), so a mirror, or a local web server serving a few test PDFs
+# (python -m http.server), can stand in for the USGS's servers.
+
+import os, threading, urllib.parse, urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'preview_cache')
+PREVIEW_CACHE_MB = int(os.environ.get('BUL_TOPO_PREVIEW_CACHE_MB', '20'))
+PREVIEW_HOST = os.environ.get('BUL_TOPO_PREVIEW_HOST') or None
+
+# how much of the start of each PDF is downloaded. That's enough to know the link
+# works, and the server's reply says how big the whole PDF is
+PREVIEW_BYTES = 64 * 1024
+
+# how many PDFs are checked at once. The candidates for one map are rarely more
+# than a handful, and a few connections at a time is polite to the USGS's servers
+FETCH_WORKERS = 4
+
+# how long to wait on a server that has stopped sending anything, in seconds
+FETCH_TIMEOUT = 30
+
+def fetch_url(url:str, host:str=None):
+    """returns the URL to download a product URL from, with its scheme and host replaced
+    by host (e.g. 'http://localhost:8000') if one is given"""
+    if not host:
+        return url
+    parts = urllib.parse.urlsplit(url)
+    new_host = urllib.parse.urlsplit(host if '//' in host else 'http://' + host)
+    return urllib.parse.urlunsplit((new_host.scheme, new_host.netloc, parts.path, parts.query, ''))
+
+def full_size(response):
+    """Returns the size in bytes of the whole file behind a response to a Range request,
+    from its Content-Range header (e.g. 'bytes 0-65535/24123456'), or from its
+    Content-Length if the server ignored the range and is sending the whole file.
+    Returns None if the server didn't say."""
+    content_range = response.headers.get('Content-Range', '')
+    if '/' in content_range and content_range.rsplit('/', 1)[1].strip().isdigit():
+        return int(content_range.rsplit('/', 1)[1])
+    length = response.headers.get('Content-Length')
+    if response.status == 200 and length and length.isdigit():
+        return int(length)
+    return None
+
+class PreviewCache:
+    """A folder of previews, the first PREVIEW_BYTES of the PDFs, named by scan ID,
+    which is kept under max_bytes by deleting the ones that were least recently used.
+    Each preview file starts with a line giving the size of the whole PDF in bytes (or
+    nothing, if the server didn't say), followed by the start of the PDF. Using a
+    preview (see get()) updates its modification time, so the file times are the only
+    record of which were used when, and a cache folder left over from the last time
+    the tool was open picks up where it left off. Safe to use from several threads at once."""
+
+    def __init__(self, directory:str=DEFAULT_CACHE_DIR, max_bytes:int=PREVIEW_CACHE_MB * 1000000):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, scan_id):
+        """returns where the preview for a scan ID is (or would be) kept"""
+        return os.path.join(self.directory, str(scan_id) + '.preview')
+
+    def get(self, scan_id):
+        """Returns the size of the whole PDF for a scan ID from its preview (None if the
+        server didn't say), marking the preview as just used. Raises KeyError if the
+        preview isn't cached."""
+        path = self.path(scan_id)
+        try:
+            os.utime(path)
+            with open(path, 'rb') as f:
+                size = f.readline().strip()
+        except OSError: # never cached, or evicted since
+            raise KeyError(scan_id)
+        return int(size) if size.isdigit() else None
+
+    def put(self, scan_id, size, stream):
+        """Copies the first PREVIEW_BYTES of a PDF from a readable binary stream into the
+        cache, along with the size of the whole PDF (or None), then deletes the least
+        recently used previews until the cache fits in max_bytes again. The preview is
+        written to a temporary file first, so a download that fails part of the way
+        through never leaves half a preview behind."""
+        path = self.path(scan_id)
+        tmp_path = path + '.' + str(threading.get_ident()) + '.tmp'
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(b'' if size is None else str(size).encode('ascii'))
+                f.write(b'\n')
+                remaining = PREVIEW_BYTES
+                while remaining > 0:
+                    chunk = stream.read(remaining)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+                    remaining -= len(chunk)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self.evict(keep=path)
+
+    def evict(self, keep=None):
+        """deletes the least recently used previews (other than keep) until the cache fits in max_bytes"""
+        with self._lock:
+            entries = []
+            total = 0
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith('.preview'):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+            entries.sort() # oldest first
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                if path == keep:
+                    continue
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    pass
+
+class PreviewFetcher:
+    """Downloads previews into a PreviewCache on a pool of FETCH_WORKERS threads. Each
+    download reports back through a callback, which is called on the worker thread,
+    so a window should pass the result along through a queue rather than touching
+    tkinter widgets from the callback (see select_from_multiple in bul_topo_tool.py).
+    A preview that's already being downloaded isn't downloaded a second time."""
+
+    def __init__(self, cache:PreviewCache, host:str=PREVIEW_HOST, workers:int=FETCH_WORKERS, timeout:float=FETCH_TIMEOUT):
+        self.cache = cache
+        self.host = host
+        self.timeout = timeout
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='preview')
+        self._lock = threading.Lock()
+        self._running = {} # scan ID: future, for the downloads that haven't finished
+
+    def fetch_all(self, candidates, on_done):
+        """Starts downloading the preview of each (scan ID, product URL) candidate that
+        isn't cached yet. on_done(scan_id, size, error) is called once for each candidate,
+        with the size of its whole PDF in bytes (or None if the server didn't say), or
+        with the exception that kept it from being downloaded; right away for the ones
+        that are already cached."""
+        for scan_id, url in candidates:
+            try:
+                on_done(scan_id, self.cache.get(scan_id), None)
+                continue
+            except KeyError:
+                pass
+            with self._lock:
+                future = self._running.get(scan_id)
+                started = future is None
+                if started:
+                    future = self._pool.submit(self._download, scan_id, url)
+                    self._running[scan_id] = future
+            # outside the lock, since a download that's already over (e.g. a map with
+            # no PDF link) calls _finished() straight away
+            if started:
+                future.add_done_callback(lambda future, scan_id=scan_id: self._finished(scan_id))
+            future.add_done_callback(lambda future, scan_id=scan_id: self._report(scan_id, future, on_done))
+
+    def _download(self, scan_id, url):
+        if not url or url == '(none)':
+            raise ValueError("map " + str(scan_id) + " has no PDF link")
+        request = urllib.request.Request(fetch_url(url, self.host),
+                                         headers={'Range': 'bytes=0-{}'.format(PREVIEW_BYTES - 1)})
+        # a server that ignores the range sends the whole PDF, but only the first
+        # PREVIEW_BYTES of it are read before the connection is closed
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            size = full_size(response)
+            self.cache.put(scan_id, size, response)
+        return size
+
+    def _finished(self, scan_id):
+        with self._lock:
+            self._running.pop(scan_id, None)
+
+    def _report(self, scan_id, future, on_done):
+        if future.cancelled():
+            return None
+        error = future.exception()
+        on_done(scan_id, None if error else future.result(), error)
+
+    def shutdown(self):
+        """Cancels the downloads that haven't started. The ones that have are left to
+        finish (or time out), since a half-read connection can't be interrupted"""
+        with self._lock:
+            futures = list(self._running.values())
+        for future in futures: # outside the lock, since cancelling one calls _finished()
+            future.cancel()
+        self._pool.shutdown(wait=False)
@@ -0,0 +1,199 @@
+# Ethan McIntosh - GIS and Data Services - Brown University - October 2026
+
+# Brings the map database and usgs_topos.csv up to date with a new version of the
+# USGS's HTMC table, without replacing all_usgs_topos wholesale:
+#
+#   python refresh_htmc.py new_usgs_topos.csv [--report refresh_report.csv] [--dry-run]
+#
+# The new csv is streamed one row at a time, and each row is hashed and compared,
+# by scan ID, with a hash of the same row in all_usgs_topos. The csv's values are
+# all text, while sqlite stores numbers in any column that isn't a TEXT column, so
+# values in those columns are compared as numbers (see canonical). Only the rows that were
+# added, changed or removed are written to all_usgs_topos, BATCH_ROWS at a time, each
+# batch in its own transaction, so the database is never locked for long and a
+# refresh that gets interrupted can simply be run again.
+#
+# Maps we've already inventoried keep the copy of their HTMC record that was made
+# when they were recorded (see Database.insert_topo_if_absent), so those aren't changed. The
+# report csv lists every inventoried map whose HTMC record changed or disappeared,
+# one line per attribute, for follow-up.
+#
+# Once the database is up to date, the new csv replaces usgs_topos.csv and the map
+# catalog's snapshot (see file_io.read_htmc_cached) is rebuilt from it, along with
+# usgs_topos.htmc if there is one (see convert_htmc.py), so that the tool starts
+# quickly the next time it's opened. The catalog's arrays are sorted end to end,
+# so it's rebuilt rather than patched. Windows won't replace usgs_topos.htmc while a
+# copy of the tool has it open, so close them all first; if one is still open, the
+# database is updated anyway, and running this again once it's closed replaces the files.
+
+import argparse, hashlib, os, shutil, sys, time
+import file_io, db, inventory # import the other files in this package
+
+# how many changed rows of all_usgs_topos are written per transaction
+BATCH_ROWS = 5000
+
+def canonical(val, numeric:bool):
+    """Returns a value from the csv or the database as the text it's compared by: '' for
+    None, and in a column sqlite stores numbers in (numeric, see db.numeric_affinity),
+    a number written the same way whether it's the csv's text or sqlite's number, so
+    that e.g. '-71.50' and -71.5, or '7' and 7.0, match. Text that isn't a number is
+    compared as it is."""
+    if val is None:
+        return ''
+    if not numeric or not isinstance(val, (str, int, float)):
+        return str(val)
+    if isinstance(val, str):
+        try:
+            return str(int(val))
+        except ValueError:
+            try:
+                val = float(val)
+            except ValueError:
+                return val
+    if isinstance(val, float) and val.is_integer():
+        return str(int(val))
+    return repr(val)
+
+def row_hash(vals, numeric:list):
+    """returns a short hash of a row's values, as compared by canonical
+
+    numeric: whether each column stores numbers (see Database.numeric_columns)"""
+    text = '\x1f'.join(canonical(val, is_numeric) for val, is_numeric in zip(vals, numeric))
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest()
+
+def current_hashes(map_db, columns, numeric):
+    """returns a dictionary of {scan ID: row_hash of its row} for every map in all_usgs_topos"""
+    scan_col = columns.index('scan_id')
+    return {canonical(row[scan_col], numeric[scan_col]): row_hash(row, numeric)
+            for row in map_db.iter_table('all_usgs_topos', columns)}
+
+def refresh(csv_path, map_db, dry_run=False, batch_rows=BATCH_ROWS):
+    """Compares a new HTMC csv with all_usgs_topos and, unless dry_run is True,
+    writes the differences to all_usgs_topos in batches of batch_rows.
+    Returns a (added, changed, removed) tuple of lists of scan IDs. Raises
+    RuntimeError if a batch couldn't be written (e.g. the database is locked), in
+    which case the batches before it stay written and running it again picks up
+    where it left off.
+
+    csv_path: the new csv table of all USGS topographic maps
+    map_db: a db.Database"""
+    columns = map_db.htmc_columns()
+    numeric = map_db.numeric_columns('all_usgs_topos')
+    scan_col = columns.index('scan_id')
+    old = current_hashes(map_db, columns, numeric)
+    seen = set()
+    added, changed = [], []
+    batch = []
+    def write(rows, removed_ids):
+        if not dry_run and map_db.replace_htmc_rows(columns, rows, removed_ids) == db.FAILED:
+            raise RuntimeError("could not update all_usgs_topos: " + map_db.last_error)
+
+    for row in file_io.read_htmc_rows(csv_path, columns):
+        scan_id = canonical(row[scan_col], numeric[scan_col])
+        if scan_id in seen: # the first row with a given scan ID wins
+            continue
+        seen.add(scan_id)
+        old_hash = old.pop(scan_id, None)
+        if old_hash is None:
+            added.append(scan_id)
+        elif old_hash != row_hash(row, numeric):
+            changed.append(scan_id)
+        else:
+            continue
+        batch.append(row)
+        if len(batch) >= batch_rows:
+            write(batch, [])
+            batch = []
+
+    # whatever wasn't in the new csv has been removed from the HTMC
+    removed = list(old)
+    write(batch, removed[:batch_rows])
+    for start in range(batch_rows, len(removed), batch_rows):
+        write([], removed[start:start + batch_rows])
+    return added, changed, removed
+
+def inventoried_changes(map_db, csv_path, changed, removed):
+    """Returns the report rows (see file_io.write_refresh_report) for the maps in
+    usgs_topos_we_have whose scan IDs are in changed or removed: one row for each
+    HTMC column whose value we recorded differs from its value in the new csv (as
+    compared by canonical), and one row for each map that isn't in the new csv at all.
+
+    csv_path: the new csv table of all USGS topographic maps
+    changed, removed: lists of scan IDs from refresh()"""
+    columns = map_db.htmc_columns()
+    n = len(columns)
+    scan_col = columns.index('scan_id')
+    # usgs_topos_we_have is every column of all_usgs_topos followed by recorded_by,
+    # recorded_time and the rest (see Database.insert_topo_if_absent)
+    numeric = map_db.numeric_columns('usgs_topos_we_have')[:n]
+    affected = set(changed) | set(removed)
+    recorded = {}
+    for row in map_db.iter_table('usgs_topos_we_have'):
+        scan_id = canonical(row[scan_col], numeric[scan_col])
+        if scan_id in affected:
+            recorded[scan_id] = row
+    if not recorded:
+        return []
+    # the changed maps' new values are read from the csv again, rather than being
+    # kept in memory from the refresh, since the csv might change nearly every row
+    report = []
+    for new_row in file_io.read_htmc_rows(csv_path, columns):
+        scan_id = canonical(new_row[scan_col], numeric[scan_col])
+        old_row = recorded.pop(scan_id, None)
+        if old_row is None:
+            continue
+        for col, old_val, new_val, is_numeric in zip(columns, old_row[:n], new_row, numeric):
+            if canonical(old_val, is_numeric) != canonical(new_val, is_numeric):
+                report.append((scan_id, old_row[n], old_row[n+1], 'changed', col,
+                               '' if old_val is None else str(old_val), new_val))
+    # and whatever is left wasn't in the csv
+    for scan_id, old_row in recorded.items():
+        report.append((scan_id, old_row[n], old_row[n+1], 'removed', '', '', ''))
+    report.sort(key=lambda report_row: (report_row[0], report_row[3]))
+    return report
+
+def install_csv(csv_path, topos_path, columnar_path):
+    """Replaces usgs_topos.csv with the new csv (unless they're the same file) and
+    rebuilds the map catalog's snapshot from it, and the columnar file too if there is one.
+    Raises RuntimeError if either file is open in a copy of the tool (see file_io.swap_in)"""
+    if os.path.abspath(csv_path) != os.path.abspath(topos_path):
+        # copy next to the old one and swap it in, so that the tool never sees half a csv
+        shutil.copyfile(csv_path, topos_path + '.tmp')
+        file_io.swap_in(topos_path + '.tmp', topos_path)
+    catalog, _ = inventory.load_catalog(topos_path, progress=print)
+    if os.path.exists(columnar_path):
+        file_io.write_columnar(columnar_path, catalog, inventory.gnis_cells(topos_path), topos_path)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Update all_usgs_topos and usgs_topos.csv from a new HTMC csv.")
+    parser.add_argument('csv_path', help="the new version of the HTMC csv")
+    parser.add_argument('--report', default='htmc_refresh_report.csv',
+                        help="where to list the inventoried maps whose HTMC records changed (default: %(default)s)")
+    parser.add_argument('--db', default=db.default_db_path(), help="the map database")
+    parser.add_argument('--topos', default=inventory.TOPOS_CSV, help="the csv of all USGS topo maps to replace")
+    parser.add_argument('--columnar', default=inventory.TOPOS_COLUMNAR,
+                        help="the columnar version of the csv, which is rebuilt if it exists")
+    parser.add_argument('--dry-run', action='store_true', help="report what would change without changing anything")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    map_db = inventory.open_database(args.db)
+    try:
+        added, changed, removed = refresh(args.csv_path, map_db, args.dry_run)
+    except (ValueError, RuntimeError) as e:
+        sys.exit(str(e))
+    print("{} {:,} added, {:,} changed and {:,} removed maps in {:.2f} s".format(
+        "Found" if args.dry_run else "Applied", len(added), len(changed), len(removed), time.perf_counter() - start))
+
+    report = inventoried_changes(map_db, args.csv_path, changed, removed)
+    file_io.write_refresh_report(args.report, report)
+    print("{:,} changes to maps we've inventoried, see {}".format(len(report), args.report))
+
+    if not args.dry_run:
+        try:
+            install_csv(args.csv_path, args.topos, args.columnar)
+        except RuntimeError as e:
+            # all_usgs_topos is already up to date, so running this again finds nothing
+            # left to change there and only replaces the files
+            sys.exit(str(e) + " The map database has already been updated.")
+        print("Replaced {} and rebuilt the map catalog".format(args.topos))
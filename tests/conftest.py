@@ -0,0 +1,86 @@
+# Ethan McIntosh - GIS and Data Services - Brown University - October 2026
+
+# Shared fixtures for the tests: a tiny HTMC csv, and a scratch inventory database
+# built from it with the same tables as the one on the shared drive.
+#
+#   python -m pytest tests
+
+import csv, os, sqlite3, sys
+import pytest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import db
+
+HTMC_COLUMNS = ['series', 'version', 'cell_id', 'scan_id', 'gda_item_id', 'gnis_cell_id', 'map_name',
+                'cell_name', 'primary_state', 'county_list', 'cell_type', 'map_scale', 'date_on_map',
+                'print_year', 'product_url']
+
+# (scan ID, gnis cell ID, cell name, primary state, cell type, map scale, map year, print year)
+TINY_MAPS = [
+    ('1001', '501', 'Providence', 'Rhode Island', 'Standard 7.5X7.5 GRID', '24000', '1955', '1957'),
+    ('1002', '501', 'Providence', 'Rhode Island', 'Standard 7.5X7.5 GRID', '24000', '1955', '1970'),
+    ('1003', '501', 'Providence', 'Rhode Island', 'Standard 7.5X7.5 GRID', '24000', '1970', ''),
+    ('1004', '502', 'East Providence', 'Rhode Island', 'Standard 7.5X7.5 GRID', '24000', '1944', '1944'),
+    ('1005', '503', 'Newport', 'Rhode Island', 'Non-Standard 7.5X7.5 GRID', '24000', '1930', ''),
+    ('1006', '504', 'Providence', 'Rhode Island', 'Standard 15X15 GRID', '62500', '1897', '1897'),
+    ('1007', '505', 'Boston South', 'Massachusetts', 'Standard 7.5X7.5 GRID', '24000', '1946', '1950'),
+    ('1008', '506', 'Boston North', 'Massachusetts', 'Standard 7.5X7.5 GRID', '24000', '1946', '1946'),
+    ('1009', '507', 'Boston', 'Massachusetts', 'Standard 15X15 GRID', '62500', '1903', ''),
+    ('1010', '508', 'Hartford North', 'Connecticut', 'Standard 7.5X7.5 GRID', '24000', '1953', '1964'),
+]
+
+def htmc_row(scan_id, gnis, cell, state, cell_type, scale, year, print_year):
+    """returns a full csv row of HTMC_COLUMNS for one of TINY_MAPS"""
+    url = 'https://prd-tnm.s3.amazonaws.com/StagedProducts/Maps/HistoricalTopo/PDF/{}_{}_{}.pdf'.format(
+        cell.replace(' ', ''), scan_id, year)
+    return ['HTMC', '1', scan_id, scan_id, scan_id, gnis, cell + ', ' + state, cell, state, 'County',
+            cell_type, scale, year, print_year, url]
+
+def write_csv(filepath, header, rows):
+    with open(filepath, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+
+def create_db(db_path, csv_path, types=None, exception_id_seed=0):
+    """Creates an inventory database like the one on the shared drive (see
+    benchmarks/synthetic_htmc.py) with all_usgs_topos loaded from a csv, and migrates it.
+
+    types: {column: declared type} for the columns of all_usgs_topos that aren't TEXT
+    exception_id_seed: see Database.migrate"""
+    types = types or {}
+    conn = sqlite3.connect(db_path)
+    with open(csv_path, newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        columns = ", ".join("{} {}".format(col, types.get(col, 'TEXT')) for col in header)
+        conn.execute("CREATE TABLE all_usgs_topos ({})".format(columns))
+        conn.executemany("INSERT INTO all_usgs_topos VALUES ({})".format(", ".join("?" * len(header))), reader)
+    conn.execute("CREATE TABLE usgs_topos_we_have ({}, recorded_by TEXT, recorded_time INTEGER, is_damaged INTEGER, "
+                 "is_duplicate INTEGER, producer TEXT)".format(columns))
+    conn.execute("CREATE TABLE exception_maps_we_have (map_id TEXT, producer TEXT, map_scale TEXT, primary_state TEXT, "
+                 "cell_name TEXT, gnis_cell_id TEXT, date_on_map TEXT, print_year TEXT, sheet TEXT, series TEXT, "
+                 "edition TEXT, is_damaged INTEGER, is_duplicate INTEGER, recorded_by TEXT, recorded_time INTEGER)")
+    conn.commit()
+    conn.close()
+    db.Database(db_path).migrate(exception_id_seed)
+    return db_path
+
+@pytest.fixture
+def tiny_csv(tmp_path):
+    """a csv of the ten TINY_MAPS"""
+    filepath = str(tmp_path / 'usgs_topos.csv')
+    write_csv(filepath, HTMC_COLUMNS, [htmc_row(*vals) for vals in TINY_MAPS])
+    return filepath
+
+@pytest.fixture
+def db_path(tmp_path, tiny_csv):
+    """a migrated inventory database of the TINY_MAPS, none of them recorded yet"""
+    return create_db(str(tmp_path / 'inventory.db'), tiny_csv)
+
+@pytest.fixture
+def map_db(db_path):
+    return db.Database(db_path)
+
+def exception_vals(cell, recorded_by='EPM', recorded_time=202210180900):
+    """returns the 14 values of an exception map (see inventory.exception_record) of a given cell"""
+    return ['AMS', '25000', 'Rhode Island', cell, '', '1943', '1943', '', 'V814', '', 0, 0, recorded_by, recorded_time]
@@ -0,0 +1,27 @@
+# Ethan McIntosh - GIS and Data Services - Brown University - October 2026
+
+import file_io
+
+def tree(node):
+    """returns a CatalogNode (or a level of the nested dictionary from read_topos) as
+    nested dicts, with the (scan ID, product URL) lists at the bottom sorted"""
+    if isinstance(node, list):
+        return sorted((str(scan_id), url) for scan_id, url in node)
+    return {key: tree(node[key]) for key in node.keys()}
+
+def test_catalog_matches_read_topos(tmp_path, tiny_csv):
+    maps = {}
+    file_io.read_topos(tiny_csv, maps)
+    expected = tree(maps)
+    assert expected['24000']['Rhode Island']['Providence']['1955'] == {
+        '1957': [('1001', 'https://prd-tnm.s3.amazonaws.com/StagedProducts/Maps/HistoricalTopo/PDF/Providence_1001_1955.pdf')],
+        '1970': [('1002', 'https://prd-tnm.s3.amazonaws.com/StagedProducts/Maps/HistoricalTopo/PDF/Providence_1002_1955.pdf')]}
+    assert list(expected['24000']['Rhode Island']['Providence']['1970']) == ['(none)']
+
+    catalog, _ = file_io.read_htmc(tiny_csv)
+    columnar_path = str(tmp_path / 'usgs_topos.htmc')
+    file_io.write_columnar(columnar_path, catalog, {})
+    for built in [file_io.read_catalog(tiny_csv), catalog, file_io.read_columnar(columnar_path)[0]]:
+        assert tree(built.root()) == expected
+        # and back again, from a scan ID to the menu values of its map
+        assert built.path(built.find_row('1004')) == ('24000', 'Rhode Island', 'East Providence', '1944', '1944')
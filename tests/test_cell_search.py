@@ -0,0 +1,19 @@
+# Ethan McIntosh - GIS and Data Services - Brown University - October 2026
+
+import cell_search
+
+def test_exact_hits_survive_the_candidate_cut():
+    # more names contain "spring" than search() ranks as candidates, and they all share
+    # the same pieces with it, so the one that starts with it could be cut before ranking
+    names = ['Big Spring ' + str(n) for n in range(cell_search.MAX_CANDIDATES + 100)] + ['Spring Valley']
+    matches = cell_search.CellNameIndex(names).search('spring')
+    assert matches[0] == 'Spring Valley'
+    assert len(matches) == cell_search.MAX_MATCHES
+
+def test_search_groups():
+    index = cell_search.CellNameIndex(['Providence', 'East Providence', 'Mount Hood', 'Boston', 'Prov'])
+    assert index.search('pr') == ['Prov', 'Providence']
+    assert index.search('providence') == ['Providence', 'East Providence']
+    assert index.search('Mt. Hood') == ['Mount Hood']
+    assert index.search('Providance')[:2] == ['Providence', 'East Providence']
+    assert index.search('') == []
@@ -0,0 +1,86 @@
+# Ethan McIntosh - GIS and Data Services - Brown University - October 2026
+
+import sqlite3
+import db, inventory
+from conftest import create_db, exception_vals
+
+def count(map_db, table):
+    return map_db.conn.execute("SELECT COUNT(*) FROM " + table).fetchone()[0]
+
+def test_apply_writes_replay(db_path, map_db):
+    writes = [('w1', db.TOPO_WRITE, inventory.topo_record('1001', 'EPM', 0, 0, when=202210180900)),
+              ('w2', db.EXCEPTION_WRITE, exception_vals('Providence')),
+              ('w3', db.TOPO_WRITE, inventory.topo_record('9999', 'EPM', 0, 0, when=202210180900)),
+              ('w4', db.TOPO_WRITE, inventory.topo_record('1001', 'EPM', 1, 0, when=202210180901))]
+    results = map_db.apply_writes(writes)
+    assert [result[:3] for result in results] == [('w1', db.INSERTED, '1001'), ('w2', db.INSERTED, '0'),
+                                                  ('w3', db.FAILED, '9999'), ('w4', db.ALREADY_PRESENT, '1001')]
+    assert 'not in all_usgs_topos' in results[2][3]
+
+    # replaying the batch, whether after a crash or from another copy of the tool,
+    # reports the same outcomes without writing anything or using up an exception map ID
+    assert map_db.apply_writes(writes) == results
+    assert db.Database(db_path).apply_writes(writes[1:3]) == results[1:3]
+    assert count(map_db, 'usgs_topos_we_have') == 1
+    assert count(map_db, 'exception_maps_we_have') == 1
+    assert map_db.insert_exception_with_new_id(exception_vals('Newport')) == (db.INSERTED, '1')
+
+def test_apply_writes_locked(db_path, map_db):
+    other = sqlite3.connect(db_path)
+    other.execute("BEGIN IMMEDIATE")
+    map_db.conn.execute("PRAGMA busy_timeout = 0")
+    writes = [('w1', db.TOPO_WRITE, inventory.topo_record('1001', 'EPM', 0, 0))]
+    assert map_db.apply_writes(writes) == db.FAILED
+    assert 'locked' in map_db.last_error
+    other.rollback()
+    assert map_db.apply_writes(writes)[0][1] == db.INSERTED
+
+def test_exception_id_sequence(tmp_path, tiny_csv):
+    map_db = db.Database(create_db(str(tmp_path / 'inventory.db'), tiny_csv, exception_id_seed=30))
+    assert [map_db.insert_exception_with_new_id(exception_vals(cell)) for cell in ['Providence', 'Newport']] \
+        == [(db.INSERTED, '30'), (db.INSERTED, '31')]
+
+    # an ID that's somehow already taken is never used twice, and isn't used up either
+    map_db.conn.execute("INSERT INTO exception_maps_we_have (map_id) VALUES ('32')")
+    map_db.conn.commit()
+    assert map_db.insert_exception_with_new_id(exception_vals('Bristol')) == (db.FAILED, None)
+    assert 'already in use' in map_db.last_error
+    assert map_db.conn.execute("SELECT next_id FROM id_sequences").fetchone() == (32,)
+
+def test_exception_id_seed_below_recorded(tmp_path, tiny_csv):
+    # the sequence starts after the highest exception map ID already recorded if
+    # next_exception_id.csv is behind it
+    path = str(tmp_path / 'inventory.db')
+    conn = sqlite3.connect(create_db(path, tiny_csv))
+    conn.execute("DROP TABLE id_sequences")
+    conn.execute("INSERT INTO exception_maps_we_have (map_id) VALUES ('41')")
+    conn.execute("PRAGMA user_version = 1")
+    conn.commit()
+    conn.close()
+    map_db = db.Database(path)
+    assert map_db.migrate(30) == len(db.MIGRATIONS)
+    assert map_db.insert_exception_with_new_id(exception_vals('Providence')) == (db.INSERTED, '42')
+
+def test_history_pages(map_db):
+    # several maps recorded in the same minute, which only the map ID can put in order
+    for scan_id, when in [('1001', 202210180900), ('1002', 202210180900), ('1003', 202210180901),
+                          ('1004', 202210180900), ('1005', 202210180902), ('1006', 202210180900)]:
+        assert inventory.record_topo(map_db, inventory.topo_record(scan_id, 'EPM', 0, 0, when)) == db.INSERTED
+    assert inventory.record_topo(map_db, inventory.topo_record('1007', 'ADB', 0, 0, 202210180903)) == db.INSERTED
+    for cell, when in [('Providence', 202210180900), ('Newport', 202210180901), ('Bristol', 202210180904)]:
+        assert map_db.insert_exception_with_new_id(exception_vals(cell, 'EPM', when))[0] == db.INSERTED
+
+    everything, _ = map_db.fetch_history_page('EPM', limit=100)
+    assert [(row[0], row[-1]) for row in everything] == [
+        ('2', 202210180904), ('1005', 202210180902), ('1003', 202210180901), ('1', 202210180901),
+        ('1006', 202210180900), ('1004', 202210180900), ('1002', 202210180900), ('1001', 202210180900),
+        ('0', 202210180900)]
+
+    for limit in [1, 2, 3, 4]:
+        rows, after = [], None
+        while True:
+            page, after = map_db.fetch_history_page('EPM', after, limit)
+            rows.extend(page)
+            if len(page) < limit:
+                break
+        assert rows == everything
@@ -0,0 +1,51 @@
+# Ethan McIntosh - GIS and Data Services - Brown University - October 2026
+
+import db, inventory
+from conftest import exception_vals
+
+def topo_write(write_id, scan_id):
+    return (write_id, db.TOPO_WRITE, inventory.topo_record(scan_id, 'EPM', 0, 0, when=202210180900))
+
+def test_recorded_maps_refresh(map_db, db_path):
+    assert map_db.apply_writes([topo_write('w1', '1001')])[0][1] == db.INSERTED
+    recorded = inventory.RecordedMaps(db_path)
+    recorded.wait_loaded()
+    assert recorded.has_topo('1001') and not recorded.has_topo('1002')
+    assert not recorded.refresh() # nothing has changed since
+
+    # maps recorded, and taken out again, through another connection
+    assert map_db.insert_topo_if_absent('1002', 'EPM', 202210180901, 0, 0, 'USGS') == db.INSERTED
+    assert map_db.insert_exception_with_new_id(exception_vals('Providence'))[0] == db.INSERTED
+    assert map_db.remove_if_present('usgs_topos_we_have', 'scan_id', '1001') == db.REMOVED
+    assert recorded.refresh()
+    assert recorded.has_topo('1002') and not recorded.has_topo('1001')
+    assert recorded.has_exception(exception_vals('Providence')) and not recorded.has_exception(exception_vals('Newport'))
+    assert recorded.all_recorded([('1002', '')]) and not recorded.all_recorded([('1002', ''), ('1003', '')])
+
+def test_recorded_maps_pending(map_db, db_path):
+    recorded = inventory.RecordedMaps(db_path, pending=[topo_write('w1', '1001')])
+    recorded.wait_loaded()
+    assert recorded.has_topo('1001')
+    recorded.add_pending(*topo_write('w2', '1002'))
+    recorded.cancel_pending('w2')
+    assert not recorded.has_topo('1002')
+
+    # once the syncer is done with a write, the map still counts as recorded until
+    # refresh() has read it back from the database
+    assert map_db.apply_writes([topo_write('w1', '1001')])[0][1] == db.INSERTED
+    recorded.done_pending('w1')
+    assert recorded.pending == {} and recorded.has_topo('1001')
+    assert recorded.refresh()
+    assert recorded.synced == {} and recorded.has_topo('1001')
+
+def test_recorded_maps_pruned_log(map_db, db_path, monkeypatch):
+    recorded = inventory.RecordedMaps(db_path)
+    recorded.wait_loaded()
+    # the log of changes no longer goes back to where refresh() left off, so
+    # everything is read again instead
+    monkeypatch.setattr(db, 'CHANGES_KEPT', 1)
+    assert map_db.apply_writes([topo_write('w1', '1001'), topo_write('w2', '1002'), topo_write('w3', '1003')])
+    assert map_db.conn.execute("SELECT COUNT(*) FROM we_have_changes").fetchone() == (1,)
+    assert not recorded.refresh()
+    recorded.wait_loaded()
+    assert all(recorded.has_topo(scan_id) for scan_id in ['1001', '1002', '1003'])
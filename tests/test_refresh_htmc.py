@@ -0,0 +1,60 @@
+# Ethan McIntosh - GIS and Data Services - Brown University - October 2026
+
+import os
+import pytest
+import db, file_io, refresh_htmc
+from conftest import HTMC_COLUMNS, TINY_MAPS, create_db, htmc_row, write_csv
+
+def test_canonical():
+    assert refresh_htmc.canonical('-71.50', True) == refresh_htmc.canonical(-71.5, True)
+    assert refresh_htmc.canonical('7', True) == refresh_htmc.canonical(7.0, True) == '7'
+    assert refresh_htmc.canonical('Providence', True) == 'Providence'
+    assert refresh_htmc.canonical('7.0', False) != refresh_htmc.canonical('7', False)
+    assert refresh_htmc.canonical(None, True) == ''
+
+def test_numeric_affinity():
+    assert [db.numeric_affinity(declared) for declared in ['TEXT', 'varchar(10)', 'INTEGER', 'REAL', 'NUMERIC', '']] \
+        == [False, False, True, True, True, True]
+
+def test_refresh_numeric_columns(tmp_path):
+    # the database stores scan IDs and map scales as integers and longitudes as reals,
+    # which the new csv writes differently without any of them having changed
+    header = HTMC_COLUMNS + ['longitude']
+    old_csv = str(tmp_path / 'old.csv')
+    write_csv(old_csv, header, [htmc_row(*vals) + ['-71.5'] for vals in TINY_MAPS])
+    map_db = db.Database(create_db(str(tmp_path / 'inventory.db'), old_csv,
+                                   {'scan_id': 'INTEGER', 'map_scale': 'INTEGER', 'longitude': 'REAL'}))
+    for scan_id in ['1001', '1002']:
+        assert map_db.insert_topo_if_absent(scan_id, 'EPM', 202210180900, 0, 0, 'USGS') == db.INSERTED
+
+    new_rows = []
+    for vals in TINY_MAPS[:-1]: # 1010 is gone
+        row = htmc_row(*vals) + ['-71.50']
+        row[HTMC_COLUMNS.index('map_scale')] += '.0'
+        if vals[0] == '1002':
+            row[HTMC_COLUMNS.index('print_year')] = '1971'
+        new_rows.append(row)
+    new_rows.append(htmc_row('1011', '509', 'Hartford South', 'Connecticut', 'Standard 7.5X7.5 GRID',
+                             '24000', '1953', '') + ['-72.6'])
+    new_csv = str(tmp_path / 'new.csv')
+    write_csv(new_csv, header, new_rows)
+
+    assert refresh_htmc.refresh(new_csv, map_db, dry_run=True) == (['1011'], ['1002'], ['1010'])
+    report = refresh_htmc.inventoried_changes(map_db, new_csv, ['1002'], ['1010'])
+    assert report == [('1002', 'EPM', 202210180900, 'changed', 'print_year', '1970', '1971')]
+
+    # once the changes are written, the same csv has nothing left to change
+    assert refresh_htmc.refresh(new_csv, map_db, batch_rows=2) == (['1011'], ['1002'], ['1010'])
+    assert refresh_htmc.refresh(new_csv, map_db) == ([], [], [])
+    assert map_db.conn.execute("SELECT longitude FROM all_usgs_topos WHERE scan_id = 1011").fetchone() == (-72.6,)
+
+def test_install_csv_while_open(tmp_path, tiny_csv, monkeypatch):
+    # Windows won't replace a file that a copy of the tool has memory-mapped
+    columnar_path = str(tmp_path / 'usgs_topos.htmc')
+    file_io.write_columnar(columnar_path, *file_io.read_htmc(tiny_csv))
+    def replace(src, dst):
+        raise PermissionError(13, 'The process cannot access the file because it is being used by another process')
+    monkeypatch.setattr(os, 'replace', replace)
+    with pytest.raises(RuntimeError, match='Close every copy'):
+        refresh_htmc.install_csv(tiny_csv, tiny_csv, columnar_path)
+    assert not os.path.exists(columnar_path + '.tmp')